@@ -0,0 +1,75 @@
+"""
+NMEA throughput on a recorded log: the pynmea2 path (gps._interpret_gps_line + gps.merge)
+against nmea.parse + gps.merge_sentence. Both fold every line into a Fix, like GpsReader does.
+
+    python bench/bench_nmea.py [tests/data/flight.nmea.gz] [repeats]
+"""
+import os
+import sys
+import gzip
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'floater'))
+import gps
+import nmea
+
+DEFAULT_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'data', 'flight.nmea.gz')
+
+
+def load(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        return f.readlines()
+
+def pynmea2_path(lines):
+    fix = gps.EMPTY_FIX
+    for bline in lines:
+        try:
+            msg = gps._interpret_gps_line(bline)
+        except gps.pynmea2.ParseError:
+            continue
+        if msg:
+            fix = gps.merge(fix, msg, 0.0)
+    return fix
+
+def fast_path(lines):
+    fix = gps.EMPTY_FIX
+    sentence = nmea.Sentence()
+    for bline in lines:
+        try:
+            if nmea.parse(bline, sentence):
+                fix = gps.merge_sentence(fix, sentence, 0.0)
+        except nmea.ParseError:
+            continue
+    return fix
+
+def measure(func, lines, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fix = func(lines)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, fix
+
+def run(path=DEFAULT_LOG, repeats=3):
+    lines = load(path)
+    results = {}
+    for name, func in (('pynmea2', pynmea2_path), ('nmea', fast_path)):
+        secs, fix = measure(func, lines, repeats)
+        results[name] = {'lines': len(lines), 'secs': secs, 'lines_per_sec': len(lines) / secs,
+                         'final_alt': fix.altitude}
+    results['speedup'] = results['pynmea2']['secs'] / results['nmea']['secs']
+    return results
+
+def main(argv):
+    path = argv[1] if len(argv) > 1 else DEFAULT_LOG
+    repeats = int(argv[2]) if len(argv) > 2 else 3
+    results = run(path, repeats)
+    for name in ('pynmea2', 'nmea'):
+        r = results[name]
+        print(f"{name:8s} {r['lines']} lines in {r['secs'] * 1000:.1f}ms  {r['lines_per_sec']:.0f} lines/s")
+    print(f"speedup  {results['speedup']:.1f}x")
+
+if __name__ == '__main__':
+    main(sys.argv)
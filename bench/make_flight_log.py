@@ -0,0 +1,98 @@
+"""
+Writes a made up (but plausible) flight as the NMEA a u-blox would send: ground time, a 5 m/s
+ascent to ~30 km, burst, descent under a parachute and some time on the ground after landing.
+Used by the benchmarks, tests and the simulator, since we don't have a logged flight that covers all of that.
+
+    python bench/make_flight_log.py tests/data/flight.nmea.gz
+"""
+import sys
+import gzip
+import math
+import random
+from datetime import datetime, timedelta
+
+LAUNCH_LAT = 29.58236
+LAUNCH_LON = -98.28367
+LAUNCH_ALT = 250.0
+BURST_ALT = 30000.0
+ASCENT_RATE = 5.0
+DESCENT_RATE_SEA_LEVEL = 5.0
+EPOCH_SECS = 5
+GROUND_SECS = 600
+START = datetime(2020, 5, 13, 14, 0, 0)
+
+
+def checksum(body):
+    c = 0
+    for ch in body.encode():
+        c ^= ch
+    return f"${body}*{c:02X}"
+
+def wind(alt):
+    """ (east, north) m/s. A jet stream around 11 km. """
+    return 4 + 25 * math.exp(-((alt - 11000) / 4000) ** 2), 2 - 3 * math.exp(-((alt - 20000) / 5000) ** 2)
+
+def descent_rate(alt):
+    return DESCENT_RATE_SEA_LEVEL * math.sqrt(math.exp(alt / 7200))
+
+def nmea_lat(deg):
+    d = int(abs(deg))
+    return f"{d:02d}{(abs(deg) - d) * 60:08.5f},{'N' if deg >= 0 else 'S'}"
+
+def nmea_lon(deg):
+    d = int(abs(deg))
+    return f"{d:03d}{(abs(deg) - d) * 60:08.5f},{'E' if deg >= 0 else 'W'}"
+
+def epochs():
+    """ (seconds since start, lat, lon, alt, east m/s, north m/s, vertical m/s) """
+    lat, lon, alt = LAUNCH_LAT, LAUNCH_LON, LAUNCH_ALT
+    t = 0
+    phase = 'ground'
+    landed_at = None
+    while True:
+        if phase == 'ground' and t >= GROUND_SECS:
+            phase = 'ascent'
+        if phase == 'ascent' and alt >= BURST_ALT:
+            phase = 'descent'
+        if phase == 'descent' and alt <= LAUNCH_ALT:
+            phase, alt, landed_at = 'landed', LAUNCH_ALT, t
+        if phase == 'landed' and t - landed_at >= GROUND_SECS:
+            return
+        vz = {'ground': 0.0, 'ascent': ASCENT_RATE, 'descent': -descent_rate(alt), 'landed': 0.0}[phase]
+        ve, vn = wind(alt) if phase in ('ascent', 'descent') else (0.0, 0.0)
+        yield t, lat, lon, alt, ve, vn, vz
+        alt = max(LAUNCH_ALT, alt + vz * EPOCH_SECS)
+        lat += vn * EPOCH_SECS / 111320.0
+        lon += ve * EPOCH_SECS / (111320.0 * math.cos(math.radians(lat)))
+        t += EPOCH_SECS
+
+def lines(rnd):
+    yield checksum('GPTXT,01,01,02,u-blox ag - www.u-blox.com')
+    yield checksum('GPTXT,01,01,02,HW UBX-G70xx   00070000 FF7FFFFFo')
+    for t, lat, lon, alt, ve, vn, vz in epochs():
+        now = START + timedelta(seconds=t)
+        hms = now.strftime('%H%M%S') + '.00'
+        dmy = now.strftime('%d%m%y')
+        knots = math.hypot(ve, vn) * 1.943844
+        course = math.degrees(math.atan2(ve, vn)) % 360
+        sats = rnd.randint(7, 11)
+        yield checksum(f'GPRMC,{hms},A,{nmea_lat(lat)},{nmea_lon(lon)},{knots:.3f},{course:.2f},{dmy},,,A')
+        yield checksum(f'GPVTG,{course:.2f},T,,M,{knots:.3f},N,{knots * 1.852:.3f},K,A')
+        yield checksum(f'GPGGA,{hms},{nmea_lat(lat)},{nmea_lon(lon)},1,{sats:02d},{rnd.uniform(0.8, 1.6):.2f},{alt:.1f},M,-23.8,M,,')
+        yield checksum('GPGSA,A,3,' + ','.join(f'{rnd.randint(1, 32):02d}' for _ in range(sats)) + ',' * (12 - sats) + ',2.04,1.10,1.72')
+        for i in range(3):
+            sv = ','.join(f'{rnd.randint(1, 32):02d},{rnd.randint(5, 85):02d},{rnd.randint(0, 359):03d},{rnd.randint(10, 45):02d}' for _ in range(4))
+            yield checksum(f'GPGSV,3,{i + 1},12,{sv}')
+        line = checksum(f'GPGLL,{nmea_lat(lat)},{nmea_lon(lon)},{hms},A,A')
+        if rnd.random() < 0.002:
+            # the odd corrupted line, like on a real UART.
+            line = line[:20] + '#' + line[21:]
+        yield line
+
+def main(path):
+    with gzip.open(path, 'wt', newline='') as f:
+        for line in lines(random.Random(1)):
+            f.write(line + '\r\n')
+
+if __name__ == '__main__':
+    main(sys.argv[1])
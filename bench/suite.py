@@ -0,0 +1,314 @@
+"""
+Benchmarks for everything the tracker does over and over, runnable on any machine (gpio falls back
+to fake_gpio, the thermometers are a fake sysfs tree, the GPS is the recorded flight log).
+
+Each case runs in its own python process so its peak RSS is its own. Results go to a JSON file
+(bench/results/<commit>.json by default) that can be compared against an earlier run:
+
+    python bench/suite.py [--only sstv_encode,loop] [--scale 0.2] [--out results.json] [--compare old.json]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+import argparse
+import platform
+import resource
+import statistics
+import subprocess
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'floater'))
+sys.path.insert(0, HERE)
+
+DEFAULT_OUT_DIR = os.path.join(HERE, 'results')
+
+# a case's cpu time per iteration has to grow by more than this before --compare calls it out.
+REGRESSION = 0.10
+
+CASES = {}
+
+
+def case(iterations):
+    """
+    Registers a benchmark. The decorated function does the setup and returns a step function that
+    runs one iteration and returns how many items it processed (lines, packets, ...).
+    """
+    def register(setup):
+        CASES[setup.__name__] = (setup, iterations)
+        return setup
+    return register
+
+def _balloon():
+    import aprs
+    state = aprs.State()
+    state.call = 'N0CALL-11'
+    state.lat, state.lon = 29.58236, -98.28367
+    state.altitude = 22965.3
+    state.ground_speed_knots = 23.4
+    state.course = 65.0
+    state.sats = 9
+    state.temp_in, state.temp_out = 71.6, -40.2
+    return state
+
+def _photo():
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(1)
+    return Image.fromarray(rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8))
+
+def _minutes(lines, epochs=12):
+    """ Splits the log into minutes (12 GPS epochs, one beacon period). An epoch starts with an RMC. """
+    minutes, current, seen = [], [], 0
+    for bline in lines:
+        if bline[3:6] == b'RMC':
+            if seen == epochs:
+                minutes.append(current)
+                current, seen = [], 0
+            seen += 1
+        current.append(bline)
+    if current:
+        minutes.append(current)
+    return minutes
+
+
+@case(iterations=2000)
+def aprs_string():
+    import aprs
+    state = _balloon()
+    now = datetime(2020, 5, 13, 14, 21, 59)
+
+    def step():
+        aprs.make_direwolf_string(state, 'APN25', ['WIDE1-1'], now)
+        aprs.make_direwolf_string(state, 'APN25', ['WIDE1-1'], now, aprs.COMPRESS_COURSE)
+        aprs.make_direwolf_string(state, 'APN25', ['WIDE1-1'], now, aprs.COMPRESS_ALTITUDE)
+        return 3
+    return step
+
+@case(iterations=5)
+def nmea_parse():
+    import bench_nmea
+    lines = bench_nmea.load(bench_nmea.DEFAULT_LOG)
+
+    def step():
+        bench_nmea.fast_path(lines)
+        return len(lines)
+    return step
+
+@case(iterations=3)
+def nmea_pynmea2():
+    import bench_nmea
+    lines = bench_nmea.load(bench_nmea.DEFAULT_LOG)
+
+    def step():
+        bench_nmea.pynmea2_path(lines)
+        return len(lines)
+    return step
+
+@case(iterations=50)
+def aprs_samples():
+    """ A position packet and a telemetry frame, modulated at the rate the radio is fed. """
+    import aprs
+    import telemetry
+    state = _balloon()
+    tel = telemetry.Telemetry(state.call)
+    now = datetime(2020, 5, 13, 14, 21, 59)
+
+    def step():
+        packets = [aprs.make_direwolf_string(state, 'APN25', ['WIDE1-1'], now, aprs.COMPRESS_COURSE, status=False)]
+        packets += tel.packets('APN25', ['WIDE1-1'], now=0)
+        aprs.make_samples(packets, rate=48000)
+        return len(packets)
+    return step
+
+@case(iterations=30)
+def aprs_wav():
+    import aprs
+    state = _balloon()
+    now = datetime(2020, 5, 13, 14, 21, 59)
+    wav_path = os.path.join(tempfile.mkdtemp(), 'aprs.wav')
+    aprs_string = aprs.make_direwolf_string(state, 'APN25', ['WIDE1-1'], now)
+
+    def step():
+        aprs.make_wav(aprs_string, wav_path, backend='native')
+        return 1
+    return step
+
+@case(iterations=5)
+def sstv_encode():
+    """ Martin M1 from a frame that's already the right size (the camera's second output). """
+    import sstv
+    frame = sstv.annotate_img(_photo(), None, 'N0CALL-11 22965M 09817.02W,2934.94N')
+
+    def step():
+        sstv.encode(frame, rate=48000)
+        return 1
+    return step
+
+@case(iterations=20)
+def annotate():
+    """ Full size photo to a labelled SSTV frame, in memory. """
+    import sstv
+    photo = _photo()
+
+    def step():
+        sstv.annotate_img(photo, None, 'N0CALL-11 22965M 09817.02W,2934.94N')
+        return 1
+    return step
+
+@case(iterations=20)
+def loop():
+    """
+    One beacon period of flight through the flight controller's own stages, without the waiting:
+    a minute of GPS lines through the reader into update_gps and record_state every epoch,
+    a thermometer pass and update_temps, then send_aprs with the mux flipped over to an emulated
+    radio and back. gpio runs on fake_gpio, the thermometers and the radio are the simulator's.
+    """
+    sys.path.insert(0, os.path.join(HERE, '..', 'sim'))
+    import gps
+    import gpio
+    import fake_gpio
+    import therm
+    import dra818
+    import recorder
+    import telemetry
+    import devices
+    import bench_nmea
+    import flight_controller as fc
+
+    fc.load()
+    minutes = _minutes(bench_nmea.load(bench_nmea.DEFAULT_LOG))
+    work_dir = tempfile.mkdtemp()
+    devices.FakeW1(work_dir)
+    gpio.init_pins()
+    mux = devices.UartMux(gpio, fake_gpio)
+    radio = devices.Dra818Emulator(mux, gpio, fake_gpio, pd_pin=dra818.PD)
+    mux.attach('vhf', radio)
+    dra818._player = devices.SimPlayer(radio, decode=False, wait=False)
+    dra818.DEFAULT_UART_PORT = mux.device
+    dra818._radio = dra818.Dra818(mux.device)
+    # the reader and the sampler are fed here instead of running on their own threads.
+    reader = gps._reader = gps.GpsReader(mux.device)
+    sampler = therm._sampler = therm.ThermSampler(base_dir=work_dir)
+    fc._telemetry = telemetry.Telemetry('N0CALL-11')
+    fc._recorder = recorder.Recorder(os.path.join(work_dir, 'flight.rec'), capacity=4096)
+    # past the first beacon, so the telemetry goes along.
+    fc._first_beacon = 0.0
+    state = _balloon()
+    position = {'minute': 0}
+
+    def step():
+        lines = minutes[position['minute'] % len(minutes)]
+        position['minute'] += 1
+        for bline in lines:
+            reader._consume(bline)
+            if bline[3:6] == b'RMC':
+                fc.update_gps(state)
+                fc.record_state(state)
+        sampler.sample()
+        fc.update_temps(state)
+        fc.send_aprs(state)
+        return len(lines)
+    return step
+
+def run_case(name, scale=1.0, warmup=1):
+    """ Runs one case in this process. """
+    setup, iterations = CASES[name]
+    iterations = max(1, int(round(iterations * scale)))
+    step = setup()
+    for _ in range(warmup):
+        step()
+    walls, cpus, items = [], [], 0
+    for _ in range(iterations):
+        wall, cpu = time.perf_counter(), time.process_time()
+        items = step() or 1
+        cpus.append(time.process_time() - cpu)
+        walls.append(time.perf_counter() - wall)
+    wall = statistics.median(walls)
+    return {
+        'iterations': iterations,
+        'wall_secs': wall,
+        'wall_secs_min': min(walls),
+        'cpu_secs': statistics.median(cpus),
+        'items': items,
+        'items_per_sec': items / wall if wall > 0 else None,
+        # kilobytes on linux.
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+def run_isolated(name, scale=1.0):
+    """ Runs one case in a fresh interpreter so the peak RSS is the case's alone. """
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', name, '--scale', str(scale)],
+                         check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                                       stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(names=None, scale=1.0):
+    names = names or list(CASES)
+    return {
+        'meta': {
+            'commit': _commit(),
+            'when': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'machine': platform.machine(),
+            'python': platform.python_version(),
+            'scale': scale,
+        },
+        'cases': {name: run_isolated(name, scale) for name in names},
+    }
+
+def compare(old, new, threshold=REGRESSION):
+    """ Returns {case: (cpu ratio new/old, rss delta kb, regressed)} for the cases in both runs. """
+    report = {}
+    for name, r in new['cases'].items():
+        before = old['cases'].get(name)
+        if not before or not before['cpu_secs']:
+            continue
+        ratio = r['cpu_secs'] / before['cpu_secs']
+        report[name] = (ratio, r['peak_rss_kb'] - before['peak_rss_kb'], ratio > 1 + threshold)
+    return report
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--case', help='Run a single case in this process and print its result as JSON')
+    parser.add_argument('--only', help='Comma separated cases to run (default: all)')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplies every case\'s iteration count')
+    parser.add_argument('--out', help='Where the results go (default: bench/results/<commit>.json)')
+    parser.add_argument('--compare', help='An earlier results file to compare against')
+    args = parser.parse_args(argv[1:])
+    logging.basicConfig(level=logging.CRITICAL)
+
+    if args.case:
+        print(json.dumps(run_case(args.case, args.scale)))
+        return 0
+
+    results = run(args.only.split(',') if args.only else None, args.scale)
+    for name, r in results['cases'].items():
+        print(f"{name:14s} cpu {r['cpu_secs'] * 1000:9.2f}ms  wall {r['wall_secs'] * 1000:9.2f}ms  "
+              f"{r['items_per_sec'] or 0:12.0f}/s  rss {r['peak_rss_kb'] / 1024:6.1f}MB")
+
+    out = args.out or os.path.join(DEFAULT_OUT_DIR, f"{results['meta']['commit'] or 'results'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'wrote {out}')
+
+    regressed = False
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        for name, (ratio, rss_delta, slower) in compare(old, results).items():
+            regressed |= slower
+            print(f"{name:14s} cpu x{ratio:5.2f}  rss {rss_delta / 1024:+6.1f}MB{'  REGRESSION' if slower else ''}")
+    return 1 if regressed else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,283 @@
+"""
+Native AX.25 + Bell 202 AFSK. This replaces the round trip through direwolf's gen_packets.
+
+Frames are built from the same TNC2 monitor strings that `aprs.make_direwolf_string` produces
+(e.g. "N0CALL>APN25,WIDE1-1:@142159h..."), so both backends take identical input.
+"""
+import wave
+from functools import lru_cache
+import numpy as np
+
+BAUD = 1200
+MARK_HZ = 1200
+SPACE_HZ = 2200
+DEFAULT_RATE = 44100
+DEFAULT_AMPLITUDE = 25  # percent of full scale, same as `gen_packets -a 25`
+
+PREAMBLE_FLAGS = 32
+POSTAMBLE_FLAGS = 3
+
+FLAG = 0x7E
+CONTROL_UI = 0x03
+PID_NO_L3 = 0xF0
+
+# the phase accumulator is 32 bits wide. The top TABLE_BITS index the tone table.
+TABLE_BITS = 10
+_PHASE_SHIFT = 32 - TABLE_BITS
+
+
+class FrameError(ValueError):
+    pass
+
+
+## AX.25 framing
+
+def _crc16(data):
+    """ CRC-16/X.25, which is what AX.25 uses for its FCS. """
+    crc = 0xFFFF
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x8408 if crc & 1 else crc >> 1
+    return crc ^ 0xFFFF
+
+def _encode_address(addr, last, command=False):
+    repeated = addr.endswith('*')
+    addr = addr.rstrip('*').upper()
+    if '-' in addr:
+        call, ssid = addr.split('-', 1)
+        ssid = int(ssid)
+    else:
+        call, ssid = addr, 0
+    if not call or len(call) > 6 or not 0 <= ssid <= 15:
+        raise FrameError(f'Bad address: {addr}')
+    out = bytearray((ord(c) << 1) for c in call.ljust(6))
+    # reserved bits are always set. The high bit is C for dst/src and H for digis.
+    ssid_byte = 0x60 | (ssid << 1) | (1 if last else 0)
+    if command or repeated:
+        ssid_byte |= 0x80
+    out.append(ssid_byte)
+    return bytes(out)
+
+def _decode_address(raw):
+    call = ''.join(chr(b >> 1) for b in raw[:6]).rstrip()
+    ssid = (raw[6] >> 1) & 0x0F
+    return call if ssid == 0 else f'{call}-{ssid}'
+
+def parse_tnc2(tnc2):
+    """ "SRC>DST,DIGI1,DIGI2:info" -> (src, dst, [digis], info) """
+    header, sep, info = tnc2.partition(':')
+    if not sep or '>' not in header:
+        raise FrameError(f'Not a TNC2 string: {tnc2}')
+    src, path = header.split('>', 1)
+    path = [p for p in path.split(',') if p]
+    if not path:
+        raise FrameError(f'No destination: {tnc2}')
+    return src, path[0], path[1:], info
+
+def encode_frame(tnc2):
+    """ Turns a TNC2 string into an AX.25 UI frame (addresses, control, pid, info, fcs). No flags. """
+    src, dst, digis, info = parse_tnc2(tnc2)
+    frame = bytearray()
+    frame += _encode_address(dst, last=False, command=True)
+    frame += _encode_address(src, last=not digis)
+    for i, digi in enumerate(digis):
+        frame += _encode_address(digi, last=i == len(digis) - 1)
+    frame.append(CONTROL_UI)
+    frame.append(PID_NO_L3)
+    frame += info.encode('latin-1')
+    fcs = _crc16(frame)
+    frame.append(fcs & 0xFF)
+    frame.append(fcs >> 8)
+    return bytes(frame)
+
+def decode_frame(frame):
+    """ The inverse of `encode_frame`. Raises FrameError if the FCS does not check out. """
+    if len(frame) < 18:
+        raise FrameError('Frame too short')
+    body, fcs = frame[:-2], frame[-2] | (frame[-1] << 8)
+    if _crc16(body) != fcs:
+        raise FrameError('Bad FCS')
+    addrs = []
+    pos = 0
+    while True:
+        raw = body[pos:pos + 7]
+        if len(raw) < 7:
+            raise FrameError('Unterminated address field')
+        addrs.append(raw)
+        pos += 7
+        if raw[6] & 1:
+            break
+    if len(addrs) < 2 or body[pos] != CONTROL_UI or body[pos + 1] != PID_NO_L3:
+        raise FrameError('Not an APRS UI frame')
+    dst, src = _decode_address(addrs[0]), _decode_address(addrs[1])
+    digis = [_decode_address(a) + ('*' if a[6] & 0x80 else '') for a in addrs[2:]]
+    info = body[pos + 2:].decode('latin-1')
+    return f"{src}>{','.join([dst] + digis)}:{info}"
+
+
+## bits on the wire
+
+def _bytes_to_bits(data):
+    """ LSB first, the way AX.25 sends them. """
+    return np.unpackbits(np.frombuffer(bytes(data), dtype=np.uint8), bitorder='little')
+
+def _stuff(bits):
+    out = []
+    ones = 0
+    for b in bits:
+        out.append(b)
+        if b:
+            ones += 1
+            if ones == 5:
+                out.append(0)
+                ones = 0
+        else:
+            ones = 0
+    return out
+
+def _unstuff(bits):
+    out = []
+    ones = 0
+    for b in bits:
+        if ones == 5:
+            ones = 0
+            if b:
+                raise FrameError('Six ones outside of a flag')
+            continue
+        out.append(b)
+        ones = ones + 1 if b else 0
+    return out
+
+def frame_bits(frames, preamble=PREAMBLE_FLAGS, postamble=POSTAMBLE_FLAGS):
+    """ Flags + stuffed frames + flags, before NRZI. Frames are separated by a single flag. """
+    flag_bits = list(_bytes_to_bits([FLAG]))
+    bits = flag_bits * max(1, preamble)
+    for frame in frames:
+        bits += _stuff(_bytes_to_bits(frame))
+        bits += flag_bits
+    bits += flag_bits * postamble
+    return np.array(bits, dtype=np.uint8)
+
+def nrzi(bits, level=1):
+    """ 0 is a change of tone, 1 is no change. Returns the tone per bit (1 = mark). """
+    # the level flips once per zero, so it is just the parity of the running count of zeros.
+    zeros = np.cumsum(np.asarray(bits) == 0)
+    return ((zeros + (0 if level else 1)) % 2 == 0).astype(np.uint8)
+
+
+## modulation
+
+@lru_cache(maxsize=8)
+def _tone_table(amplitude):
+    peak = 32767 * amplitude / 100.0
+    angles = 2 * np.pi * np.arange(1 << TABLE_BITS) / (1 << TABLE_BITS)
+    return np.round(peak * np.sin(angles)).astype(np.int16)
+
+@lru_cache(maxsize=8)
+def _phase_increments(rate):
+    """ per-sample phase step for [space, mark], indexed by the NRZI level. """
+    return np.array([round(f * (1 << 32) / rate) for f in (SPACE_HZ, MARK_HZ)], dtype=np.uint32)
+
+def _samples_per_bit(nbits, rate):
+    edges = (np.arange(nbits + 1, dtype=np.int64) * rate) // BAUD
+    return np.diff(edges)
+
+def modulate(tones, rate=DEFAULT_RATE, amplitude=DEFAULT_AMPLITUDE):
+    """
+    Phase continuous Bell 202. `tones` is the post-NRZI level per bit (1 = mark).
+    The phase accumulator is a uint32 so it wraps for free; its top bits index a sine table.
+    """
+    tones = np.asarray(tones, dtype=np.uint8)
+    steps = np.repeat(_phase_increments(rate)[tones], _samples_per_bit(len(tones), rate))
+    phase = np.cumsum(steps, dtype=np.uint32) - steps
+    return _tone_table(amplitude)[phase >> _PHASE_SHIFT]
+
+def make_samples(tnc2_strings, rate=DEFAULT_RATE, amplitude=DEFAULT_AMPLITUDE):
+    """ One or more TNC2 strings -> int16 PCM, all frames sent back to back in one transmission. """
+    if isinstance(tnc2_strings, str):
+        tnc2_strings = [tnc2_strings]
+    frames = [encode_frame(s) for s in tnc2_strings]
+    return modulate(nrzi(frame_bits(frames)), rate=rate, amplitude=amplitude)
+
+def write_wav(samples, wav_path, rate=DEFAULT_RATE):
+    with wave.open(wav_path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(np.asarray(samples, dtype='<i2').tobytes())
+
+def read_wav(wav_path):
+    """ Returns (samples, rate). Only handles the 16 bit mono files that we (and gen_packets) write. """
+    with wave.open(wav_path, 'rb') as wav:
+        if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+            raise ValueError(f'Expected 16 bit mono: {wav_path}')
+        return np.frombuffer(wav.readframes(wav.getnframes()), dtype='<i2'), wav.getframerate()
+
+
+## demodulation. Good enough to check our own (and direwolf's) output, not meant for a noisy channel.
+
+def _tone_energy(samples, freq, rate, window):
+    t = np.arange(len(samples)) / rate
+    mixed = samples * np.exp(-2j * np.pi * freq * t)
+    acc = np.concatenate(([0], np.cumsum(mixed)))
+    return np.abs(acc[window:] - acc[:-window]) ** 2
+
+def _slice_levels(samples, rate):
+    """ Non-coherent mark/space detector. Returns one level per sample (1 = mark). """
+    samples = np.asarray(samples, dtype=np.float64)
+    window = int(round(rate / BAUD))
+    diff = _tone_energy(samples, MARK_HZ, rate, window) - _tone_energy(samples, SPACE_HZ, rate, window)
+    # the window trails the sample; re-center it.
+    levels = np.zeros(len(samples), dtype=np.uint8)
+    levels[window // 2:window // 2 + len(diff)] = diff > 0
+    return levels
+
+def _recover_bits(levels, rate):
+    """ Samples each bit mid-period, re-syncing the clock on every tone transition. """
+    spb = rate / BAUD
+    edges = np.flatnonzero(np.diff(levels.astype(np.int8))) + 1
+    bits = []
+    if len(edges) == 0:
+        return bits
+    last_edge = edges[0]
+    edge_idx = 1
+    t = last_edge + spb / 2
+    while t < len(levels):
+        while edge_idx < len(edges) and edges[edge_idx] <= t:
+            last_edge = edges[edge_idx]
+            edge_idx += 1
+        # snap to the nearest bit center after the most recent transition
+        n = max(0, round((t - last_edge - spb / 2) / spb))
+        t = last_edge + spb / 2 + n * spb
+        if t >= len(levels):
+            break
+        bits.append(levels[int(t)])
+        t += spb
+    return bits
+
+def demodulate(samples, rate=DEFAULT_RATE):
+    """ PCM -> list of frames (bytes, FCS included) that pass the FCS check. """
+    tones = _recover_bits(_slice_levels(samples, rate), rate)
+    # undo NRZI: same tone is a one, a change is a zero.
+    bits = [1 if a == b else 0 for a, b in zip(tones, tones[1:])]
+    flag = [0, 1, 1, 1, 1, 1, 1, 0]
+    frames = []
+    start = None
+    i = 0
+    while i <= len(bits) - 8:
+        if bits[i:i + 8] == flag:
+            if start is not None and i - start >= 8 * 18:
+                try:
+                    unstuffed = _unstuff(bits[start:i])
+                    if len(unstuffed) % 8 == 0:
+                        raw = bytes(np.packbits(np.array(unstuffed, dtype=np.uint8), bitorder='little'))
+                        decode_frame(raw)
+                        frames.append(raw)
+                except FrameError:
+                    pass
+            i += 8
+            start = i
+        else:
+            i += 1
+    return frames
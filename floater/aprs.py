@@ -1,38 +1,73 @@
 import os
+import math
+import time
+import threading
 import subprocess
 from datetime import datetime
 import logging
+import afsk
+import instrument
 
 DIREWOLF_HOME = os.environ.get('DIREWOLF_HOME')
 
+# 'native' modulates in-process with afsk. 'direwolf' shells out to gen_packets.
+AFSK_BACKEND = os.environ.get('AFSK_BACKEND', 'native')
+
 class State(object):
+    """
+    Everything the beacons, SSTV label, telemetry and recorder need. Numbers only, converted once when
+    they come in: lat/lon in signed degrees, altitude in meters, speed in knots, course in degrees, temps
+    as therm returns them. None means we don't know yet. `fix_time` is the unix time of the fix.
+    Whoever writes a fix holds `lock` while doing it, so a snapshot never mixes two fixes.
+    """
+    __slots__ = ('call', 'lat', 'lon', 'altitude', 'ground_speed_knots', 'course', 'sats', 'timestamp',
+                 'datestamp', 'fix_time', 'temp_in', 'temp_out', 'radio_freq',
+                 'last_photo_time', 'last_photo_path', 'last_sstv_frame', 'last_video_time', 'last_video_path',
+                 'last_sstv_time', 'will_send_sstv', 'lock')
+
     def __init__(self):
         self.call = ''
-        self.lon = ''
-        self.lat = ''
-        self.ground_speed_knots = 0
-        self.ground_speed_kph = 0
+        self.lat = None
+        self.lon = None
+        self.altitude = None
+        self.ground_speed_knots = 0.0
+        self.course = 0.0
+        self.sats = None
         self.timestamp = None
         self.datestamp = None
-        self.sats = None
-        self.raw_altitude = ''
-        self.temp_in = ''
-        self.temp_out = ''
-        self.course = 0
+        self.fix_time = None
+        self.temp_in = None
+        self.temp_out = None
         self.radio_freq = 0.0
 
         self.last_photo_time = 0
         self.last_photo_path = None
+        self.last_sstv_frame = None
         self.last_video_time = 0
+        self.last_video_path = None
         self.last_sstv_time = 0
         self.will_send_sstv = False
+        self.lock = threading.Lock()
 
     def __repr__(self):
-        return f"alt:{self.raw_altitude} {self.lat},{self.lon} spd:{self.ground_speed_kph}({self.ground_speed_knots}) sats:{self.sats}"
+        return f"alt:{self.altitude} {self.lat},{self.lon} spd:{self.ground_speed_knots} sats:{self.sats}"
 
     def is_valid(self):
-        return len(self.lon.strip()) > 0 and \
-            len(self.lat.strip()) > 0
+        return self.lat is not None and self.lon is not None
+
+    def fix_age(self, now=None):
+        if self.fix_time is None:
+            return float('inf')
+        return (time.time() if now is None else now) - self.fix_time
+
+    def snapshot(self):
+        """ A shallow copy, for handing to something that runs while the state keeps changing. """
+        copy = State.__new__(State)
+        with self.lock:
+            for name in State.__slots__:
+                setattr(copy, name, getattr(self, name))
+        copy.lock = threading.Lock()
+        return copy
 
 def zulu_now():
     return datetime.utcnow()
@@ -44,29 +79,19 @@ def getHMS(dt):
 def getDHM(dt):
     return dt.strftime('%d%H%M') + 'z'
 
-# 2934.94157N,09817.02034W
-
-def _encode_arbitrary_location(lonlat, w):
-    try:
-        dm, h = lonlat.split('.')
-        d = h[-1].upper()  # direction
-        h = h[:-1]  # git rid of direction
-        while len(dm) < w:
-            dm += '0'
-        while len(h) > 2:
-            h = h[:-1]
-        return f"{dm}.{h}{d}"
-    except ValueError:
-        logging.error(f'Problem encoding this: {lonlat}   {w}')
-        return '0'
+def _encode_degrees(deg, width, hemispheres):
+    """ Rounds to the nearest hundredth of a minute (about 18m). """
+    hundredths = int(round(abs(deg) * 6000))
+    d, m = divmod(hundredths, 6000)
+    return f"{d:0{width}d}{m // 100:02d}.{m % 100:02d}{hemispheres[0] if deg >= 0 else hemispheres[1]}"
 
 def encode_latitude(lat):
-    """ input will probably be ddmm.hhhhhN, convert it into ddmm.hhM """
-    return _encode_arbitrary_location(lat, 4)
+    """ 49.0583 -> 4903.50N """
+    return _encode_degrees(lat, 2, 'NS')
 
 def encode_longitude(lon):
-    """ input will probably be dddmm.hhhhhW, convert it to dddmm.hhW """
-    return _encode_arbitrary_location(lon, 5)
+    """ -72.0292 -> 07201.75W """
+    return _encode_degrees(lon, 3, 'EW')
 
 def encode_position(lat, lon, table='/', symbol='O'):
     return f"{encode_latitude(lat)}{table}{encode_longitude(lon)}{symbol}"
@@ -76,47 +101,128 @@ def encode_altitude(alt_in_feet):
         alt_in_feet = str(alt_in_feet)
     return f"/A={alt_in_feet.zfill(6)}"
 
-def alt_to_feet(alt):
-    if alt is None:
+def alt_to_feet(meters):
+    if meters is None:
         return 0
-    elif alt.lower().endswith('m'):
-        return int(round(int(float(alt[:-1])) * 3.28084))
-    else:
-        return int(alt[:-1])
+    return int(round(meters * 3.28084))
 
 # Data extensions
 
 def encode_course_and_speed(course, speed_in_knots):
-    course %= 360
+    course = int(round(course)) % 360
+    speed_in_knots = int(round(speed_in_knots))
     if course == 0:
         course = 360
     return f"{str(course).zfill(3)}/{str(speed_in_knots).zfill(3)}"
 
+# Compressed position (APRS 1.0.1 chapter 9). Everything after the timestamp fits in 13 bytes.
+
+# what goes into the cs bytes of a compressed position.
+COMPRESS_COURSE = 'course'
+COMPRESS_ALTITUDE = 'altitude'
+
+# compression type byte: current fix, nmea source, software origin. See ch9 table.
+T_RMC = 0b111010
+T_GGA = 0b110010
+
+def _base91(value, width):
+    out = ''
+    for _ in range(width):
+        value, digit = divmod(value, 91)
+        out = chr(digit + 33) + out
+    return out
+
+def compress_latitude(lat):
+    return _base91(int(380926 * (90 - lat)), 4)
+
+def compress_longitude(lon):
+    return _base91(int(190463 * (180 + lon)), 4)
+
+def compress_course_and_speed(course, speed_in_knots):
+    c = int(course) % 360 // 4
+    s = int(round(math.log(max(0, speed_in_knots) + 1) / math.log(1.08)))
+    # base91 digits run '!'..'z' (0-89 here), about 1000 knots.
+    return chr(c + 33) + chr(min(s, 89) + 33) + chr(T_RMC + 33)
+
+def compress_altitude(alt_in_feet):
+    cs = int(round(math.log(max(1, alt_in_feet)) / math.log(1.002)))
+    return _base91(cs, 2) + chr(T_GGA + 33)
+
+def encode_compressed_position(lat, lon, cs, table='/', symbol='O'):
+    return f"{table}{compress_latitude(lat)}{compress_longitude(lon)}{symbol}{cs}"
+
 ## Put it all together
 
-def make_info_string(balloon, dt):
+def make_info_string(balloon, dt, compressed=None):
+    """
+    `compressed` picks the position format for this packet: None for the plain text
+    ddmm.hhN/dddmm.hhW form, COMPRESS_COURSE for base91 with course/speed in the cs bytes
+    (altitude still goes in /A=), or COMPRESS_ALTITUDE for base91 with the altitude in cs.
+    """
     # generally speaking, the aprs info section is like this:
     # 1 - data type id. we are going to want '/' which is pos w/timestamp (will include other nice things)
-    # n - aprs data (position w/ timestamp). maybe figure out how do do compressed lat/lon/course/speed/range/alt.
-    # 7 - aprs data extension (course and speed)
+    # n - aprs data (position w/ timestamp), plain or compressed.
+    # 7 - aprs data extension (course and speed), or the cs bytes when compressed.
     # m - aprs comment (altitude)
-    # everyone complains about base91, but it's only used for compressed lat/lon (ch9) and altitude in mic-e.
     # everyone should be complaining about the bit-shifting in addresses. that crap is madness.
     symbol_table_id = '/'
     symbol_code = 'O'
+    alt_in_feet = alt_to_feet(balloon.altitude)
     data = f"@{getHMS(dt)}"
-    data += f"{encode_latitude(balloon.lat)}{symbol_table_id}{encode_longitude(balloon.lon)}{symbol_code}"
-    data += f"{encode_course_and_speed(balloon.course, balloon.ground_speed_knots)}"
-    data += f"{encode_altitude(alt_to_feet(balloon.raw_altitude))}"
-    # we still have room for 36-9=27 bytes in the comment.
+    if compressed == COMPRESS_ALTITUDE:
+        # 13 bytes in place of 35, but no course/speed.
+        data += encode_compressed_position(balloon.lat, balloon.lon, compress_altitude(alt_in_feet),
+                                           symbol_table_id, symbol_code)
+        return data
+    if compressed == COMPRESS_COURSE:
+        data += encode_compressed_position(balloon.lat, balloon.lon,
+                                           compress_course_and_speed(balloon.course, balloon.ground_speed_knots),
+                                           symbol_table_id, symbol_code)
+    elif compressed is None:
+        data += f"{encode_latitude(balloon.lat)}{symbol_table_id}{encode_longitude(balloon.lon)}{symbol_code}"
+        data += f"{encode_course_and_speed(balloon.course, balloon.ground_speed_knots)}"
+    else:
+        raise ValueError(f'Unknown position format: {compressed}')
+    data += f"{encode_altitude(alt_in_feet)}"
+    # we still have room for 36-9=27 bytes in the comment (40 when compressed).
     return data
 
-def make_direwolf_string(bln, dst, via_digis, dt):
-    s = f"{bln.call}>{dst},{','.join(via_digis)}:{make_info_string(bln, dt)}"
-    s += f" sat={bln.sats} in={bln.temp_in} out={bln.temp_out} sstv={1 if bln.will_send_sstv else 0}"
+def _blank(value):
+    return '' if value is None else value
+
+def landing_comment(lat, lon, secs):
+    """ Predicted landing point and minutes to go, e.g. 'LZ=2940.42N,09723.74W T-41'. 26 bytes. """
+    return f"LZ={encode_latitude(lat)},{encode_longitude(lon)} T-{min(99, int(round(secs / 60)))}"
+
+def make_direwolf_string(bln, dst, via_digis, dt, compressed=None, status=True, comment=None):
+    """
+    With status=False the free text sats/temps/sstv comment is left off (telemetry frames carry those).
+    `comment` goes on the end of whatever else there is.
+    """
+    s = f"{bln.call}>{dst},{','.join(via_digis)}:{make_info_string(bln, dt, compressed)}"
+    if status:
+        s += f" sat={bln.sats} in={_blank(bln.temp_in)} out={_blank(bln.temp_out)} sstv={1 if bln.will_send_sstv else 0}"
+    if comment:
+        s += f" {comment}"
     return s
 
-def make_wav(aprs_string, wav_path):
+def make_samples(aprs_string, rate=afsk.DEFAULT_RATE):
+    """ int16 PCM for one or more direwolf strings. Nothing touches the disk. """
+    return afsk.make_samples(aprs_string, rate=rate)
+
+def make_wav(aprs_string, wav_path, backend=None):
+    backend = backend or AFSK_BACKEND
+    if backend == 'native':
+        try:
+            afsk.write_wav(make_samples(aprs_string), wav_path)
+            return
+        except afsk.FrameError:
+            if not DIREWOLF_HOME:
+                raise
+            logging.exception('Native AFSK failed. Falling back to gen_packets')
+    _make_wav_direwolf(aprs_string, wav_path)
+
+def _make_wav_direwolf(aprs_string, wav_path):
     if not DIREWOLF_HOME:
         raise RuntimeError('Cannot find direwolf. Check env (export DIREWOLF_HOME=...)')
     if os.path.exists(wav_path):
@@ -137,7 +243,8 @@ def make_wav(aprs_string, wav_path):
         raise RuntimeError('APRS text file not written')
 
     try:
-        res = subprocess.check_output([f"{DIREWOLF_HOME}/gen_packets", '-a', '25', '-o', wav_path, aprs_text_path], shell=False)
+        with instrument.timed('subprocess.gen_packets'):
+            res = subprocess.check_output([f"{DIREWOLF_HOME}/gen_packets", '-a', '25', '-o', wav_path, aprs_text_path], shell=False)
         logging.debug(res)
     except subprocess.CalledProcessError as ex:
         logging.debug(ex.cmd)
@@ -1,41 +1,242 @@
 import os
-from picamera import PiCamera
+import threading
+import logging
+from PIL import Image
 import time
+import media
 
-PHOTO_DIR = os.path.join(os.environ.get('MEDIA_HOME', '/home/pi/Pictures'), 'photos')
-VIDEO_DIR = os.path.join(os.environ.get('MEDIA_HOME', '/home/pi/Pictures'), 'videos')
+MEDIA_HOME = os.environ.get('MEDIA_HOME', '/home/pi/Pictures')
+PHOTO_DIR = os.path.join(MEDIA_HOME, 'photos')
+VIDEO_DIR = os.path.join(MEDIA_HOME, 'videos')
 
-cam = PiCamera()
+RESOLUTION = (1280, 720)
+FRAMERATE = 30
+
+# the second output of every still. Martin M1's frame (and nicely aligned for the GPU resizer).
+SSTV_SIZE = (320, 256)
+
+# how long auto exposure/white balance need after the camera opens. Only paid once.
+WARMUP_SECS = 2
+
+# the video ring: this many seconds of H.264 in memory, at a bitrate that keeps it to ~15MB.
+RING_SECS = 30
+RING_BITRATE = 4000000
+# clips shorter than this aren't worth a file.
+MIN_CLIP_SECS = 2
+
+# splitter ports on the video port. Recording gets its own so stills can be taken while it runs.
+STILL_PORT = 0
+VIDEO_PORT = 1
+SSTV_PORT = 2
+
+
+class CameraService(object):
+    """
+    Opens the camera once and leaves the sensor running, so exposure is already settled when
+    a photo is wanted. Stills come off the video port's splitter: one capture gives a full size
+    JPEG and (through the GPU resizer, on a second splitter port) an SSTV sized frame, and
+    neither has to wait for a recording to finish.
+
+    Video either goes straight to a file (start_video/stop_video) or, in flight, round and round
+    a ring buffer in memory (start_ring) that save_ring copies the interesting bits out of. The
+    encoder keeps running through every save.
+    """
+    def __init__(self, camera):
+        self.camera = camera
+        self.camera.resolution = RESOLUTION
+        self.camera.framerate = FRAMERATE
+        self._warm_at = time.monotonic() + WARMUP_SECS
+        self._still_lock = threading.Lock()
+        self._video_lock = threading.Lock()
+        self._video_timer = None
+        self._video_done = None
+        self.video_path = None
+        self.ring = None
+        self.ring_secs = None
+
+    def _wait_warm(self):
+        remaining = self._warm_at - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def _capture_small(self, size, out):
+        buf = bytearray(size[0] * size[1] * 3)
+        self.camera.capture(buf, format='rgb', use_video_port=True, splitter_port=SSTV_PORT, resize=size)
+        out.append(Image.frombuffer('RGB', size, bytes(buf), 'raw', 'RGB', 0, 1))
+
+    def capture(self, photo_path, small_size=SSTV_SIZE):
+        """ Full size JPEG to `photo_path`. Returns the small frame as a PIL image (or None if small_size is None). """
+        self._wait_warm()
+        with self._still_lock:
+            small = []
+            worker = None
+            if small_size:
+                # both splitter outputs are fed from the same frames, so these two line up.
+                worker = threading.Thread(target=self._capture_small, args=(small_size, small))
+                worker.start()
+            self.camera.capture(photo_path, format='jpeg', use_video_port=True, splitter_port=STILL_PORT)
+            if worker:
+                worker.join()
+        return small[0] if small else None
+
+    def start_video(self, video_path, seconds=None, on_done=None):
+        """
+        Starts recording and returns right away. If `seconds` is given the recording stops itself.
+        `on_done(path)` is called once the file is closed.
+        """
+        self._wait_warm()
+        with self._video_lock:
+            if self.video_path is not None or self.ring is not None:
+                raise RuntimeError(f'Already recording to {self.video_path or "the ring"}')
+            self.camera.start_recording(video_path, format='h264', splitter_port=VIDEO_PORT)
+            self.video_path = video_path
+            self._video_done = on_done
+            if seconds:
+                self._video_timer = threading.Timer(seconds, self.stop_video)
+                self._video_timer.daemon = True
+                self._video_timer.start()
+
+    def stop_video(self):
+        with self._video_lock:
+            if self._video_timer:
+                self._video_timer.cancel()
+                self._video_timer = None
+            if self.video_path is not None:
+                self.camera.stop_recording(splitter_port=VIDEO_PORT)
+            path, self.video_path = self.video_path, None
+            on_done, self._video_done = self._video_done, None
+        if path is not None and on_done is not None:
+            on_done(path)
+        return path
+
+    def wait_video(self, seconds):
+        self.camera.wait_recording(seconds, splitter_port=VIDEO_PORT)
+
+    def start_ring(self, seconds=RING_SECS, bitrate=RING_BITRATE):
+        """ Starts recording into the ring. Returns False if it already was. """
+        from picamera import PiCameraCircularIO
+        self._wait_warm()
+        with self._video_lock:
+            if self.ring is not None:
+                return False
+            if self.video_path is not None:
+                raise RuntimeError(f'Already recording to {self.video_path}')
+            ring = PiCameraCircularIO(self.camera, seconds=seconds, bitrate=bitrate, splitter_port=VIDEO_PORT)
+            self.camera.start_recording(ring, format='h264', bitrate=bitrate, splitter_port=VIDEO_PORT)
+            self.ring, self.ring_secs = ring, seconds
+            return True
+
+    def save_ring(self, path, seconds=None):
+        """ Copies the newest `seconds` of the ring (all of it by default) to `path`, from a keyframe. """
+        with self._video_lock:
+            if self.ring is None:
+                raise RuntimeError('The ring is not recording')
+            try:
+                # raises if the encoder has fallen over since the last look.
+                self.camera.wait_recording(0, splitter_port=VIDEO_PORT)
+            except:
+                # the ring is gone. Tidy up so the next start_ring can start a new one.
+                try:
+                    self.camera.stop_recording(splitter_port=VIDEO_PORT)
+                except:
+                    pass
+                self.ring = None
+                raise
+            self.ring.copy_to(path, seconds=seconds)
+
+    def stop_ring(self):
+        with self._video_lock:
+            if self.ring is not None:
+                self.camera.stop_recording(splitter_port=VIDEO_PORT)
+            self.ring = None
+
+
+# opened on first use, so nothing that doesn't take pictures waits on (or dies with) the camera.
+_service = None
+_store = None
+_lock = threading.Lock()
+# when the last clip out of the ring ended (monotonic).
+_clip_end = None
+
+def service():
+    global _service
+    with _lock:
+        if _service is None:
+            from picamera import PiCamera
+            logging.info('Opening the camera')
+            _service = CameraService(PiCamera())
+        return _service
+
+def store():
+    global _store
+    with _lock:
+        if _store is None:
+            _store = media.MediaStore(MEDIA_HOME)
+        return _store
+
+def recording():
+    """ True while video is being recorded, to a file or the ring. Doesn't open the camera to find out. """
+    return _service is not None and (_service.video_path is not None or _service.ring is not None)
 
 def next_photo_path():
-    idx = 0
-    while True:
-        photo_path = os.path.join(PHOTO_DIR, f"capture_{idx:04d}.jpg")
-        if os.path.exists(photo_path):
-            idx += 1
-        else:
-            return photo_path
+    return store().next_path(media.PHOTO)
 
 def next_video_path():
-    idx = 0
-    while True:
-        video_path = os.path.join(VIDEO_DIR, f"capture_{idx:04d}.h264")
-        if os.path.exists(video_path):
-            idx += 1
-        else:
-            return video_path
-
-def capture_photo():
+    return store().next_path(media.VIDEO)
+
+def capture_stills(fix=None):
+    """ Returns (photo path, SSTV sized PIL image) from a single capture. `fix` is recorded with it. """
     photo_path = next_photo_path()
-    cam.start_preview()
-    time.sleep(4)
-    cam.capture(photo_path)
-    cam.stop_preview()
+    small = service().capture(photo_path)
+    store().add(media.PHOTO, photo_path, fix)
+    return photo_path, small
+
+def capture_photo(fix=None):
+    photo_path, _ = capture_stills(fix)
     return photo_path
 
-def capture_video(seconds=30):
+def start_ring(seconds=RING_SECS):
+    """ Keeps the last `seconds` of video in memory from now on. Returns False if that was already happening. """
+    global _clip_end
+    if not service().start_ring(seconds):
+        return False
+    _clip_end = time.monotonic()
+    return True
+
+def save_clip(fix=None):
+    """
+    Writes whatever the ring has recorded since the last clip (at most all of it) to a new file
+    and returns its path, or None if there's too little. Recording doesn't stop.
+    """
+    global _clip_end
+    camera = service()
+    if camera.ring is None or _clip_end is None:
+        raise RuntimeError('The ring is not recording')
+    now = time.monotonic()
+    seconds = min(camera.ring_secs, now - _clip_end)
+    if seconds < MIN_CLIP_SECS:
+        return None
+    video_path = next_video_path()
+    try:
+        camera.save_ring(video_path, seconds)
+    except:
+        if camera.ring is None:
+            # the encoder died. The next video task starts the ring again.
+            _clip_end = None
+        raise
+    _clip_end = now
+    store().add(media.VIDEO, video_path, fix)
+    return video_path
+
+def capture_video(seconds=30, wait=True, fix=None):
+    """ With wait=False this returns as soon as recording starts; stills can be taken meanwhile. """
     video_path = next_video_path()
-    cam.start_recording(video_path)
-    cam.wait_recording(seconds)
-    cam.stop_recording()
+    on_done = lambda path: store().add(media.VIDEO, path, fix)
+    camera = service()
+    if wait:
+        camera.start_video(video_path, on_done=on_done)
+        camera.wait_video(seconds)
+        camera.stop_video()
+    else:
+        camera.start_video(video_path, seconds, on_done=on_done)
     return video_path
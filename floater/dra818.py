@@ -1,9 +1,11 @@
 import os
 import time
-import subprocess
 import serial
 import gpio
 import logging
+import afsk
+import playback
+import instrument
 
 
 DEFAULT_UART_PORT = "/dev/ttyAMA0"
@@ -18,59 +20,140 @@ PTT     = 6
 HL      = 13
 PD      = 19
 
-MINUTES_30 = 1800
+# everything we send (APRS and SSTV) is generated at this rate so the PCM never has to be reopened.
+AUDIO_RATE = playback.DEFAULT_RATE
+TX_DELAY = playback.TX_DELAY
 
-def _open_uart(device=DEFAULT_UART_PORT):
+_player = playback.Player()
+
+# the DRA818 answers in well under 100ms. This is how long we give it before calling it a failure.
+RESPONSE_TIMEOUT = 0.5
+
+def _open_uart(device=DEFAULT_UART_PORT, timeout=RESPONSE_TIMEOUT):
     return serial.Serial(
         port=device,
         baudrate=9600,
         parity=serial.PARITY_NONE,
         stopbits=serial.STOPBITS_ONE,
-        bytesize=serial.EIGHTBITS)
-
-
-def _send_rcv(uart, cmd, hang_time=1.00):
-    logging.debug(f"=> {cmd.strip()}")
-    uart.write(cmd.encode())
-    time.sleep(hang_time)
-    response = uart.readline()
-    logging.debug(f"<= {response.decode('utf-8').strip()}")
-    return response
-
-
-def _handshake(uart):
-    return _send_rcv(uart, "AT+DMOCONNECT\r\n")
-
-
-def program(port=DEFAULT_UART_PORT, frequency=146.500, tries=4):
-    ok = False
-    while tries > 0 and not ok:
-        tries -= 1
-        try:
-            uart = _open_uart(port)
-            res = _handshake(uart).decode("utf-8").strip()
-            if res != "+DMOCONNECT:0":
-                logging.error("Unable to communicate with DRA818.")
-            else:
-                group_set_cmd = group_set_cmd = "AT+DMOSETGROUP=%d,%3.4f,%3.4f,%s,%d,%s\r\n" % (MODE, frequency, frequency, CTCSS, SQUELCH, CTCSS)
-                res = _send_rcv(uart, group_set_cmd).decode('utf-8').strip()
-                if res != "+DMOSETGROUP:0":
-                    logging.error("Unable to program DRA818")
+        bytesize=serial.EIGHTBITS,
+        timeout=timeout)
+
+
+class Dra818(object):
+    """
+    Keeps the UART open and remembers what the radio was last successfully programmed with, so
+    `program` only talks to it when something changed. That memory is dropped whenever the radio
+    is powered down or a command fails, which forces a fresh handshake next time.
+    """
+    def __init__(self, port=DEFAULT_UART_PORT, timeout=RESPONSE_TIMEOUT):
+        self.port = port
+        self.timeout = timeout
+        self.config = None
+        self._uart = None
+
+    def _open(self):
+        if self._uart is None:
+            self._uart = _open_uart(self.port, self.timeout)
+        return self._uart
+
+    def close(self):
+        if self._uart is not None:
+            self._uart.close()
+        self._uart = None
+
+    def invalidate(self):
+        self.config = None
+
+    def _send_rcv(self, cmd, expect):
+        """ Sends `cmd` and returns the first response line that starts with `expect`, or None on timeout. """
+        with instrument.timed('uart.dra818'):
+            uart = self._open()
+            # anything already sitting there is left over from the gps.
+            uart.reset_input_buffer()
+            logging.debug(f"=> {cmd.strip()}")
+            uart.write(cmd.encode())
+            deadline = time.monotonic() + self.timeout
+            while time.monotonic() < deadline:
+                response = uart.readline().decode('utf-8', errors='replace').strip()
+                if response:
+                    logging.debug(f"<= {response}")
+                if response.startswith(expect):
+                    return response
+        logging.debug(f"<= (nothing after {self.timeout}s)")
+        instrument.count('dra818.timeouts')
+        return None
+
+    def _handshake(self):
+        return self._send_rcv("AT+DMOCONNECT\r\n", "+DMOCONNECT") == "+DMOCONNECT:0"
+
+    def program(self, frequency=146.500, squelch=SQUELCH, ctcss=CTCSS, mode=MODE, tries=4):
+        wanted = (mode, round(frequency, 4), ctcss, squelch)
+        if self.config == wanted:
+            logging.debug(f"DRA818 already on {frequency:3.4f}")
+            instrument.count('dra818.program_cached')
+            return True
+        while tries > 0:
+            tries -= 1
+            self.config = None
+            try:
+                if not self._handshake():
+                    logging.error("Unable to communicate with DRA818.")
                 else:
-                    ok = True
-        except:
-            logging.warning(f"{tries} programming tries left.")
-        if not ok:
+                    group_set_cmd = "AT+DMOSETGROUP=%d,%3.4f,%3.4f,%s,%d,%s\r\n" % (mode, frequency, frequency, ctcss, squelch, ctcss)
+                    if self._send_rcv(group_set_cmd, "+DMOSETGROUP") != "+DMOSETGROUP:0":
+                        logging.error("Unable to program DRA818")
+                    else:
+                        self.config = wanted
+                        return True
+            except (serial.SerialException, OSError):
+                logging.warning(f"{tries} programming tries left.")
+                self.close()
             time.sleep(0.5)
-    return ok
+        return False
+
+    def power_down(self):
+        gpio.set_pin(PD, gpio.LOW)
+        self.invalidate()
+
+    def power_up(self):
+        gpio.set_pin(PD, gpio.HIGH)
+        self.invalidate()
+
+
+_radio = None
+
+def radio(port=None):
+    global _radio
+    port = port or DEFAULT_UART_PORT
+    if _radio is None or _radio.port != port:
+        if _radio is not None:
+            _radio.close()
+        _radio = Dra818(port)
+    return _radio
+
+def program(port=None, frequency=146.500, tries=4):
+    return radio(port).program(frequency=frequency, tries=tries)
 
 def ptt(enabled):
     gpio.set_pin(PTT, gpio.LOW if enabled else gpio.HIGH)
 
-def play_file(wav_path, device='plughw:CARD=Set,DEV=0'):
+def transmit(audio, rate=AUDIO_RATE, tx_delay=None):
+    """
+    Keys the radio, plays `audio` (int16 samples, or a generator of them) and unkeys as soon
+    as the audio has drained. The TX delay is counted from when the audio is handed to the device.
+    """
+    tx_delay = TX_DELAY if tx_delay is None else tx_delay
+    with instrument.timed('dra818.transmit'):
+        secs = _player.play(audio, rate=rate, ptt=ptt, tx_delay=tx_delay)
+    instrument.count('dra818.airtime_secs', secs)
+    logging.debug(f"Transmitted {secs:.2f}s of audio")
+    return secs
+
+def play_file(wav_path):
+    """ Plays a wav without touching PTT. """
     if not os.path.isfile(wav_path):
         logging.error(f"Problem with file {wav_path}")
         return False
-    subprocess.check_output(['aplay', '-D', device, wav_path], shell=False, timeout=MINUTES_30)
+    samples, rate = afsk.read_wav(wav_path)
+    _player.play(samples, rate=rate, tx_delay=0)
     return True
-
@@ -18,13 +18,31 @@ def _const_tos(c):
     return m.get(c, f"INVALID {c}")
 
 
+# what every pin was last set to, so a simulator can see the mux and PTT.
+_state = {}
+
+
+def setwarnings(enabled):
+    pass
+
+
 def setmode(board_mode):
     logging.debug(f"Setting GPIO board mode to {_const_tos(board_mode)}")
 
 
 def setup(pin_num, io_mode, initial=LOW):
     logging.debug(f"pin {pin_num} mode {_const_tos(io_mode)} value {_const_tos(initial)}")
+    _state[pin_num] = initial
 
 
 def output(pin_num, hilo):
-    logging.debug(f"pin {pin_num} set {_const_tos(hilo)}")
\ No newline at end of file
+    """ Like RPi.GPIO: one pin or a list of them, and one value for all or one each. """
+    pins = pin_num if isinstance(pin_num, (list, tuple)) else [pin_num]
+    values = hilo if isinstance(hilo, (list, tuple)) else [hilo] * len(pins)
+    for pin, value in zip(pins, values):
+        logging.debug(f"pin {pin} set {_const_tos(value)}")
+        _state[pin] = value
+
+
+def input(pin_num):
+    return _state.get(pin_num, LOW)
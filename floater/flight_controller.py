@@ -1,159 +1,442 @@
-import os
 import sys
 import argparse
 import time
 from datetime import datetime
 import traceback
+from contextlib import contextmanager
 import logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(message)s', datefmt='%H:%M:%S')
 
-import gpio
-import gps
-import dra818
-import aprs
-import cam
-import therm
-import sstv
+import scheduler
+import telemetry
+import instrument
+import phase
+import landing
+import media
+import storage
+
+# the device and codec modules are imported by load(). The --test-* modes import only what they
+# use, so they start quickly and a broken camera (or library) only takes down what needs it.
+gpio = gps = dra818 = aprs = cam = therm = sstv = recorder = None
+
+def load():
+    global gpio, gps, dra818, aprs, cam, therm, sstv, recorder
+    import gpio, gps, dra818, aprs, cam, therm, sstv, recorder
 
 MINUTES_30 = 30 * 60
 MINUTES_5 = 5 * 60
+BEACON_PERIOD = 60
+GPS_PERIOD = 5
+# how often the stage timings get written out.
+STATS_PERIOD = MINUTES_5
+
+# the camera records round and round this many seconds in memory. The video task saves clips out of it.
+CLIP_SECS = 30
+# a vertical rate this fast (m/s), when it wasn't a moment ago, is worth a clip whatever the phase.
+VIDEO_EVENT_RATE = 12
+
+# task cadence (s) in each flight phase. Beacon often on the way down (for recovery), less at float
+# (power, airtime), and photos and back to back clips around burst. Video is otherwise a clip now
+# and then: the SD card only gets footage worth keeping.
+PHASE_POLICY = {
+    phase.GROUND:  {'aprs': BEACON_PERIOD, 'photo': BEACON_PERIOD, 'video': MINUTES_30},
+    phase.ASCENT:  {'aprs': BEACON_PERIOD, 'photo': BEACON_PERIOD, 'video': MINUTES_5},
+    phase.CRUISE:  {'aprs': 2 * BEACON_PERIOD, 'photo': 2 * BEACON_PERIOD, 'video': MINUTES_30},
+    phase.BURST:   {'aprs': BEACON_PERIOD / 2, 'photo': BEACON_PERIOD / 3, 'video': CLIP_SECS},
+    phase.DESCENT: {'aprs': BEACON_PERIOD / 2, 'photo': BEACON_PERIOD, 'video': MINUTES_5},
+    phase.LANDED:  {'aprs': 2 * BEACON_PERIOD, 'photo': MINUTES_30, 'video': MINUTES_30},
+}
+# run right away on entering a phase. The ring still has the half minute before it was noticed.
+PHASE_TRIGGERS = {
+    phase.ASCENT: ('video',),
+    phase.BURST: ('video', 'aprs'),
+}
+
+# the SSTV audio starts being prepared this long before it is due to go out.
+SSTV_PREP_WINDOW = 2 * BEACON_PERIOD
+# a fresh fix only gets the picture re-encoded once the altitude on it is this far (m) out of date.
+SSTV_LABEL_STEP = 100
+# and once more, whatever the fix did, this long (s) before the slot. An encode takes tens of seconds
+# on the Pi. If it isn't done in time, the previous one goes out.
+SSTV_REFRESH_SECS = 45
+
+# position format of each beacon: aprs.COMPRESS_COURSE, aprs.COMPRESS_ALTITUDE or None (plain).
+# See aprs.make_info_string. Compressed saves 13 bytes of airtime.
+APRS_FORMAT = 'course'
+
+# set up in main, once the call sign is known.
+_sstv = None
+# (altitude, had a position) on the label last encoded, and whether the final refresh has happened.
+_sstv_basis = None
+_sstv_refreshed = False
+_phase = None
+_fast = False
+_landing = None
+_storage = None
+_telemetry = None
+_recorder = None
+_stats_path = None
+
+# for the time to first beacon, which is what counts after a reboot in flight.
+_started = time.monotonic()
+_first_beacon = None
 
 def check_devices():
     pass
 
+@instrument.timed('update_gps')
 def update_gps(state):
-    gpio.enable_gps()
-    logging.debug("Taking GPS reading")
-    start_time = time.time()
-    for msg in gps.collect():
-        if hasattr(msg, 'lat'):
-            state.lat = msg.lat
-        if hasattr(msg, 'lon'):
-            state.lon = msg.lon
-        if hasattr(msg, 'lat_dir'):
-            state.lat += msg.lat_dir
-        if hasattr(msg, 'lon_dir'):
-            state.lon += msg.lon_dir
-        if hasattr(msg, 'timestamp'):
-            state.timestamp = msg.timestamp
-        if hasattr(msg, 'datestamp'):
-            state.datestamp = msg.datestamp
-        if hasattr(msg, 'spd_over_grnd_kts'):
-            state.ground_speed_knots = msg.spd_over_grnd_kts
-        if hasattr(msg, 'spd_over_grnd_kmph'):
-            state.ground_speed_kph = msg.spd_over_grnd_kmph
-        if hasattr(msg, 'num_sats'):
-            state.sats = msg.num_sats
-        if hasattr(msg, 'altitude'):
-            state.raw_altitude = msg.altitude
-        if hasattr(msg, 'altitude_units'):
-            state.raw_altitude = str(state.raw_altitude) + msg.altitude_units
-
-        if time.time() - start_time > 10000:
-            break
-    logging.debug("Done with reading.")
+    fix = gps.latest_fix()
+    age = fix.age()
+    if fix.is_stale():
+        logging.warning(f"GPS fix is {age:.0f}s old")
+        instrument.count('gps.stale')
+    # all of one fix or none of it, for whoever takes a snapshot on another worker.
+    with state.lock:
+        if fix.has_position():
+            state.lat = fix.lat
+            state.lon = fix.lon
+        if fix.timestamp is not None:
+            state.timestamp = fix.timestamp
+        if fix.datestamp is not None:
+            state.datestamp = fix.datestamp
+        if fix.speed_knots is not None:
+            state.ground_speed_knots = fix.speed_knots
+        if fix.course is not None:
+            state.course = fix.course
+        if fix.sats is not None:
+            state.sats = fix.sats
+        if fix.altitude is not None:
+            state.altitude = fix.altitude
+        if age != float('inf'):
+            state.fix_time = time.time() - age
+    if _telemetry:
+        _telemetry.sample('Sats', fix.sats)
+        _telemetry.sample('Alt', fix.altitude)
+        _telemetry.sample('FixAg', min(age, 255))
+        _telemetry.set_bit('GPS', fix.has_position() and not fix.is_stale())
+
+def gps_task(state, schedule):
+    had_position = state.is_valid()
+    update_gps(state)
+    # right after a (re)boot, beacon as soon as there's a position instead of at the next period.
+    if _first_beacon is None and not had_position and state.is_valid():
+        schedule.trigger('aprs')
+    if _phase and state.fix_time is not None:
+        changed = _phase.add(state.fix_time, state.altitude)
+        if changed:
+            apply_phase(schedule, changed)
+            if changed == phase.BURST and _storage:
+                _storage.burst_at = time.time()
+        watch_vertical_rate(schedule)
+        update_landing(state)
+
+def watch_vertical_rate(schedule):
+    """ Saves a clip when the balloon starts going up or down fast. Rearms once it has calmed down. """
+    global _fast
+    rate = _phase.rate.rate
+    if rate is None:
+        return
+    if not _fast and abs(rate) > VIDEO_EVENT_RATE:
+        _fast = True
+        logging.info(f"Vertical rate {rate:.1f}m/s. Saving video")
+        schedule.trigger('video')
+    elif _fast and abs(rate) < VIDEO_EVENT_RATE / 2:
+        _fast = False
+
+def update_landing(state):
+    """ Winds from every fix in the air, the launch site's height from the ground, descent rate on the way down. """
+    if _landing is None:
+        return
+    flight_phase = _phase.phase
+    if flight_phase == phase.GROUND and state.altitude is not None:
+        _landing.ground = state.altitude
+    elif flight_phase in (phase.ASCENT, phase.CRUISE, phase.DESCENT):
+        _landing.add_wind(state.altitude, state.ground_speed_knots, state.course)
+    if flight_phase == phase.DESCENT:
+        _landing.observe_descent(state.altitude, _phase.rate.rate)
+
+def landing_comment(state):
+    """ On the way down, where we'll land. None otherwise. """
+    if _landing is None or _phase.phase not in (phase.BURST, phase.DESCENT) or not state.is_valid():
+        return None
+    with instrument.timed('landing.predict'):
+        prediction = _landing.predict(state.lat, state.lon, state.altitude)
+    logging.info(f"Landing in {prediction.secs:.0f}s at {prediction.lat:.5f},{prediction.lon:.5f}")
+    return aprs.landing_comment(prediction.lat, prediction.lon, prediction.secs)
+
+def apply_phase(schedule, flight_phase):
+    """ Retunes the schedule for a new flight phase. Deadlines keep their share of the period. """
+    logging.info(f"Flight phase is now {flight_phase}")
+    instrument.count(f'phase.{flight_phase}')
+    for name, period in PHASE_POLICY[flight_phase].items():
+        task = schedule.tasks.get(name)
+        if task is not None:
+            schedule.set_period(name, period, period * task.deadline / task.period)
+    for name in PHASE_TRIGGERS.get(flight_phase, ()):
+        if name in schedule.tasks:
+            schedule.trigger(name)
+
+def record_state(state):
+    _recorder.append(time.time(), state.lat, state.lon, state.altitude, state.ground_speed_knots, state.course,
+                     state.sats, state.temp_in, state.temp_out)
+
+@contextmanager
+def _vhf_uart():
+    """ Hands the UART to the radio, and back to the GPS reader when done. """
+    with instrument.timed('uart.handover'):
+        gps.pause()
+        gpio.enable_vhf()
+    try:
+        yield
+    finally:
+        gpio.enable_gps()
+        gps.resume()
 
+@instrument.timed('update_temps')
 def update_temps(state):
     logging.debug("Getting temparatures")
     state.temp_in = therm.get_internal_temp()
     state.temp_out = therm.get_external_temp()
+    if _telemetry:
+        _telemetry.sample('TempIn', state.temp_in)
+        _telemetry.sample('TmpOut', state.temp_out)
+        _telemetry.set_bit('TIn', state.temp_in is not None)
+        _telemetry.set_bit('TOut', state.temp_out is not None)
 
+@instrument.timed('capture_photo')
 def capture_photo(state):
-    photo_path = cam.capture_photo()
+    if not room_for(media.PHOTO):
+        return
+    photo_path, sstv_frame = cam.capture_stills(gps.latest_fix())
     logging.info(f"Captured photo to: {photo_path}.")
     state.last_photo_time = time.time()
+    # frame first: the sstv prep task keys off the path.
+    state.last_sstv_frame = sstv_frame
     state.last_photo_path = photo_path
 
-def capture_video(state):
-    video_path = cam.capture_video()
-    logging.info(f"Captured video to: {video_path}.")
+@instrument.timed('save_video')
+def save_video(state):
+    # the encoder never stops. This only copies what's new in the ring since the last clip.
+    if cam.start_ring(CLIP_SECS):
+        logging.info(f"Recording the last {CLIP_SECS}s of video")
+        return
+    video_path = cam.save_clip(gps.latest_fix())
+    if video_path is None:
+        return
+    logging.info(f"Saved video to: {video_path}.")
     state.last_video_time = time.time()
     state.last_video_path = video_path
 
+@instrument.timed('send_aprs')
 def send_aprs(state, aprs_dst='APN25', digis=['WIDE1-1']):
-    gpio.enable_vhf()
+    # the gps task keeps updating the state on another worker. The packet is made from one fix.
+    state = state.snapshot()
     now = datetime.utcnow()
     try:
-        aprs_string = aprs.make_direwolf_string(state, aprs_dst, digis, now)
+        aprs_string = aprs.make_direwolf_string(state, aprs_dst, digis, now, APRS_FORMAT, status=_telemetry is None,
+                                                comment=landing_comment(state))
     except:
         traceback.print_exc()
         logging.error('Not sending APRS')
         return
 
-    wav_path = '/tmp/aprs.wav'
-    aprs.make_wav(aprs_string, wav_path)
+    # position and telemetry frames go out back to back under one PTT. Except the first time: after
+    # a reboot the position is what matters, and the telemetry (with its metadata) can wait a minute.
+    packets = [aprs_string]
+    with_telemetry = _telemetry is not None and _first_beacon is not None
+    if with_telemetry:
+        packets += _telemetry.packets(aprs_dst, digis)
+    with instrument.timed('aprs.make_samples'):
+        samples = aprs.make_samples(packets, rate=dra818.AUDIO_RATE)
 
-    if not dra818.program(frequency=146.500):
-        logging.error("Problem programming")
-        return
-    logging.info(f'Sending APRS: {{{aprs_string}}}')
-    dra818.ptt(True)
+    with _vhf_uart():
+        if not dra818.program(frequency=146.500):
+            logging.error("Problem programming")
+            return
+        for packet in packets:
+            logging.info(f'Sending APRS: {{{packet}}}')
+        try:
+            dra818.transmit(samples)
+        except:
+            traceback.print_exc()
+            return
+    # only now is that frame (and the metadata) really gone. Otherwise it goes again next beacon.
+    if with_telemetry:
+        _telemetry.commit()
+    _beacon_sent()
+
+def _uptime():
     try:
-        time.sleep(1)
-        dra818.play_file(wav_path)
-        time.sleep(0.25)
-    except:
-        traceback.print_exc()
-    dra818.ptt(False)
-
-def _maybe_delete(file_path, raise_error=False):
-    if os.path.exists(file_path):
-        os.remove(file_path)
-    if os.path.exists(file_path):
-        if raise_error:
-            raise RuntimeError(f'File not deleted: {file_path}')
-        else:
-            return False
-    else:
+        with open('/proc/uptime') as f:
+            return float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _beacon_sent():
+    global _first_beacon
+    if _first_beacon is not None:
+        return
+    _first_beacon = time.monotonic() - _started
+    instrument.default().observe('startup.first_beacon', _first_beacon)
+    uptime = _uptime()
+    logging.info(f"First beacon {_first_beacon:.1f}s after start" + (f", {uptime:.0f}s after boot." if uptime else "."))
+
+def sstv_label(state):
+    state = state.snapshot()
+    label = f'{state.call} {state.altitude or 0:.0f}M'
+    if state.is_valid():
+        label += f' {aprs.encode_longitude(state.lon)},{aprs.encode_latitude(state.lat)}'
+    return label
+
+def _sstv_label_moved(state):
+    if _sstv_basis is None:
         return True
+    altitude, had_position = _sstv_basis
+    return state.is_valid() != had_position or abs((state.altitude or 0) - altitude) >= SSTV_LABEL_STEP
 
+def prepare_sstv(state, schedule):
+    """
+    Gets the newest photo encoded ahead of time. A new fix only means a re-encode when the label
+    has moved on enough to matter, and then there's one last refresh just before the slot.
+    """
+    global _sstv_basis, _sstv_refreshed
+    until = schedule.time_until('sstv')
+    if state.last_photo_path is None or until > SSTV_PREP_WINDOW:
+        return
+    photo_path, frame = state.last_photo_path, state.last_sstv_frame
+    state = state.snapshot()
+    if _sstv.photo_path == photo_path and not _sstv_label_moved(state):
+        if until > SSTV_REFRESH_SECS or _sstv_refreshed:
+            return
+        _sstv_refreshed = True
+    _sstv_basis = (state.altitude or 0, state.is_valid())
+    # the small frame from the same capture saves decoding and shrinking the full size jpeg.
+    with instrument.timed('sstv.prepare'):
+        _sstv.prepare(photo_path, sstv_label(state), frame)
+
+@instrument.timed('send_sstv')
 def send_sstv(state):
     if state.last_photo_path is None:
         logging.warning('Would like to send SSTV, but nothing is there')
         return
-    sstv_img_path = '/tmp/sstv.jpg'
-    if not _maybe_delete(sstv_img_path):
-        logging.error(f'Could not clear old SSTV image: {sstv_img_path}')
-        return
+    audio = _sstv.get(state.last_photo_path)
+    instrument.count('sstv.prepared' if audio is not None else 'sstv.unprepared')
+    if audio is None:
+        logging.info('No SSTV prepared for the latest photo. Encoding while sending.')
+        sstv_img = sstv.annotate_img(state.last_sstv_frame or state.last_photo_path, None, sstv_label(state))
+        if sstv_img is None:
+            logging.error(f'Could not annotate {state.last_photo_path}')
+            return
+        # scanlines are encoded while the earlier ones are on the air.
+        audio = sstv.stream(sstv_img, rate=dra818.AUDIO_RATE)
 
-    anno_str = f'{state.call} {state.raw_altitude} {aprs.encode_longitude(state.lon)},{aprs.encode_latitude(state.lat)}'
-    logging.info('annotating image')
-    sstv.annotate_img(state.last_photo_path, sstv_img_path, anno_str)
-    sstv_wav_path = '/tmp/sstv.wav'
-    if not _maybe_delete(sstv_wav_path):
-        logging.error(f'Could not clear old SSTV wav: {sstv_wav_path}')
-        return
-    logging.info('converting image to wav')
-    if not sstv.img_to_wav(sstv_img_path, sstv_wav_path):
-        logging.error('Could not generate SSTV wav file. Aborting SSTV send.')
-        return
+    with _vhf_uart():
+        if not dra818.program(frequency=146.500):
+            logging.error('Problem programming')
+            return
+        logging.info('Sending SSTV')
+        try:
+            dra818.transmit(audio)
+        except:
+            traceback.print_exc()
 
-    gpio.enable_vhf()
-    if not dra818.program(frequency=146.500):
-        logging.error('Problem programming')
-        return
-    logging.info('Sending SSTV')
-    dra818.ptt(True)
-    try:
-        time.sleep(1)
-        dra818.play_file(sstv_wav_path)
-        time.sleep(1)
-    except:
-        traceback.print_exc()
-    dra818.ptt(False)
+def beacon(state, schedule):
+    # let listeners know a picture is on its way.
+    state.will_send_sstv = schedule.time_until('sstv') < schedule.tasks['aprs'].period
+    if _telemetry:
+        _telemetry.set_bit('SSTV', state.will_send_sstv)
+        _telemetry.set_bit('Vid', cam.recording())
+        _telemetry.set_bit('SD', _storage is not None and not all(_storage.allow(kind) for kind in (media.PHOTO, media.VIDEO)))
+    if state.is_valid():
+        send_aprs(state)
+        logging.info('beacon sent')
+    else:
+        logging.warning("Invalid state. Will not APRS")
+        logging.warning(f'{repr(state)}')
+    logging.debug(repr(state))
+
+def sstv_task(state):
+    global _sstv_refreshed
+    logging.info('starting sstv send')
+    send_sstv(state)
+    logging.info('sstv send completed')
+    state.last_sstv_time = time.time()
+    # not needed for another half hour.
+    _sstv.invalidate()
+    _sstv_refreshed = False
+
+def room_for(kind):
+    if _storage is None or _storage.allow(kind):
+        return True
+    logging.warning(f"No room for another {kind}")
+    instrument.count(f'storage.refused.{kind}')
+    return False
+
+def video_task(state):
+    if room_for(media.VIDEO):
+        save_video(state)
+
+@instrument.timed('storage.enforce')
+def storage_task(state):
+    # the sstv task still needs the last photo, whatever its turn to go.
+    removed = _storage.enforce(protect=(state.last_photo_path,))
+    if removed:
+        instrument.count('storage.removed', removed)
 
+def flush_stats():
+    summary = instrument.default().flush(_stats_path)
+    logging.info(f"Stage timings written to {_stats_path}. {summary['overrun_count']} overruns so far.")
+
+def build_schedule(state):
+    """
+    The beacon has the highest priority and keeps its own cadence. Everything else runs around it:
+    thermometers and gps bookkeeping need no hardware locks, photos and the video ring are on their
+    own splitter ports and don't get in each other's way, and APRS and SSTV share the uart mux and the radio.
+    """
+    schedule = scheduler.Scheduler(instruments=instrument.default())
+    schedule.add(scheduler.Task('gps', lambda: gps_task(state, schedule), period=GPS_PERIOD, priority=90))
+    if _recorder:
+        schedule.add(scheduler.Task('record', lambda: record_state(state), period=GPS_PERIOD, priority=85,
+                                    offset=GPS_PERIOD / 2))
+    schedule.add(scheduler.Task('temps', lambda: update_temps(state), period=BEACON_PERIOD, priority=80))
+    schedule.add(scheduler.Task('aprs', lambda: beacon(state, schedule), period=BEACON_PERIOD, deadline=BEACON_PERIOD / 2,
+                                priority=100, resources=('uart', 'radio'), offset=5))
+    schedule.add(scheduler.Task('photo', lambda: capture_photo(state), period=BEACON_PERIOD, priority=50,
+                                resources=('camera',), offset=10))
+    # starts well after the first photo, and half way between two beacons.
+    schedule.add(scheduler.Task('sstv', lambda: sstv_task(state), period=MINUTES_30, deadline=MINUTES_5, priority=30,
+                                resources=('uart', 'radio'), offset=BEACON_PERIOD * 1.5 + 5))
+    # cpu only. Follows each new photo and fix so the sstv task can key up without waiting on an encode.
+    # an encode takes longer than a period. The fixes that come in meanwhile just wait for the next run.
+    schedule.add(scheduler.Task('sstv_prep', lambda: prepare_sstv(state, schedule), period=GPS_PERIOD,
+                                deadline=SSTV_REFRESH_SECS, priority=20, offset=GPS_PERIOD / 2))
+    # the first run starts the ring.
+    schedule.add(scheduler.Task('video', lambda: video_task(state), period=MINUTES_5, deadline=MINUTES_5 / 2, priority=10,
+                                offset=20))
+    if _stats_path:
+        schedule.add(scheduler.Task('stats', flush_stats, period=STATS_PERIOD, priority=5, offset=STATS_PERIOD))
+    if _storage:
+        schedule.add(scheduler.Task('storage', lambda: storage_task(state), period=MINUTES_5, priority=5, offset=30))
+    if _phase:
+        apply_phase(schedule, _phase.phase)
+    return schedule
 
 def restart_pi():
     pass
 
 
-def main(args):
-
-    if args.call is None:
-        logging.critical("You need to set the `call` parameter. ")
-        sys.exit(-1)
+def setup(args):
+    """ Everything main does before the schedule starts. Returns (state, schedule). """
+    global _sstv, _phase, _landing, _storage, _telemetry, _recorder, _stats_path
 
     logging.info("Welcome to the main event!")
+    load()
+    if getattr(args, 'tx_delay', None) is not None:
+        dra818.TX_DELAY = args.tx_delay
+    _sstv = sstv.Prepared(rate=dra818.AUDIO_RATE)
+    _phase = phase.PhaseDetector()
+    _landing = landing.LandingPredictor()
     try:
         gpio.init_pins()
         logging.info("Pi GPIO initialized. Checking devices.")
@@ -165,47 +448,37 @@ def main(args):
     check_devices()
     state = aprs.State()
 
-    state.call = args.call
+    # the radio sits on the same uart as the gps, on the other side of the mux.
+    dra818.DEFAULT_UART_PORT = args.uart_device
+    # the gps reader runs for the whole flight. update_gps just picks up its latest fix.
+    gpio.enable_gps()
+    gps.start(args.uart_device)
+    # same for the thermometers. update_temps gets their latest readings without touching the bus.
+    therm.start()
 
-    while True:
-        loop_start = time.time()
-        try:
-            low_disk = False  # TODO: implement this check.
-            state.will_send_sstv = loop_start - state.last_sstv_time > MINUTES_30
-            update_gps(state)
-            update_temps(state)
-            logging.info('gps and temperatures recorded')
-            if state.is_valid():
-                send_aprs(state)
-            else:
-                logging.warning("Invalid state. Will not APRS")
-                logging.warning(f'{repr(state)}')
-            logging.info('beacon sent')
-            capture_photo(state)
-            if state.will_send_sstv:
-                logging.info('starting sstv send')
-                send_sstv(state)
-                logging.info('sstv send completed')
-                state.last_sstv_time = time.time()
-            if not low_disk and loop_start - state.last_video_time > MINUTES_5:
-                logging.info('capturing video')
-                capture_video(state)
-                state.last_video_time = time.time()
-        except:
-            # ugh.
-            traceback.print_exc()
+    state.call = args.call
+    _telemetry = telemetry.Telemetry(args.call)
+    try:
+        _recorder = recorder.Recorder(getattr(args, 'recorder_path', None) or recorder.DEFAULT_PATH)
+    except (OSError, ValueError):
+        traceback.print_exc()
+        logging.error('Flying without the flight recorder')
+    _stats_path = getattr(args, 'stats_path', None)
+    quotas = {kind: mb * storage.MB for kind, mb in ((media.PHOTO, getattr(args, 'photo_quota', None)),
+                                                     (media.VIDEO, getattr(args, 'video_quota', None))) if mb}
+    _storage = storage.StorageBudget(cam.store(), quotas)
 
-        logging.debug(repr(state))
+    schedule = build_schedule(state)
+    logging.info(f"Tasks: {list(schedule.tasks.values())}")
+    return state, schedule
 
-        # maybe take a nap.
-        loop_end = time.time()
-        sleep_time = max(0, 60 - loop_end + loop_start)
-        if sleep_time > 0:
-            logging.info(f"Sleeping {sleep_time}s")
-            time.sleep(sleep_time)
-        else:
-            logging.info("Not sleeping")
+def main(args):
+    if args.call is None:
+        logging.critical("You need to set the `call` parameter. ")
+        sys.exit(-1)
 
+    state, schedule = setup(args)
+    schedule.run()
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -219,15 +492,25 @@ if __name__ == '__main__':
     parser.add_argument("--call", type=str, help="Call sign + SSID of balloon. e.g. N0CALL-1")
 
     parser.add_argument("--aprs-frequency", type=float, default=144.390, help="APRS Transmit Frequency (MHz)")
+    parser.add_argument("--aprs-format", choices=['plain', 'course', 'altitude'], default=APRS_FORMAT,
+                        help="Position format: plain text, or base91 compressed with course/speed or altitude in the cs bytes")
     parser.add_argument("--sstv-frequency", type=float, default=146.500, help="Frequency used to send SSTV images")
+    parser.add_argument("--tx-delay", type=float, help="Seconds between keying the radio and the start of audio (default 0.3)")
+    parser.add_argument("--recorder-path", type=str, help="Flight recorder ring file (default $FLIGHT_HOME/flight.rec)")
+    parser.add_argument("--stats-path", type=str, default=instrument.DEFAULT_PATH, help="Where stage timings are written every few minutes")
+    parser.add_argument("--photo-quota", type=int, help="MB of photos to keep on the card (default 4096)")
+    parser.add_argument("--video-quota", type=int, help="MB of video to keep on the card (default 16384)")
     parser.add_argument("--uart-device", type=str, default='/dev/ttyAMA0', help="Serial port connected to module.")
     parser.add_argument("--test", action="store_true", default=False, help="Cycle through all devices testing them.")
     args = parser.parse_args()
+    APRS_FORMAT = None if args.aprs_format == 'plain' else args.aprs_format
 
     if args.init:
+        import gpio
         logging.info("Initializing")
         gpio.init_pins()
     elif args.test_gps:
+        import gpio, gps
         logging.info("Enabling GPS. Check out /dev/ttyAMA0")
         gpio.init_pins()
         gpio.enable_gps()
@@ -238,6 +521,7 @@ if __name__ == '__main__':
             if line_count <= 0:
                 break
     elif args.test_vhf:
+        import gpio, dra818
         logging.info("Testing VHF. Short broadcast on 146.500MHz")
         gpio.init_pins()
         gpio.enable_vhf()
@@ -249,12 +533,15 @@ if __name__ == '__main__':
         time.sleep(5)
         dra818.ptt(False)
     elif args.test_photo:
+        import cam
         photo_path = cam.capture_photo()
         logging.info(f"Captured test photo: {photo_path}.")
     elif args.test_video:
+        import cam
         video_path = cam.capture_video()
         logging.info(f"Captured test video: {video_path}.")
     elif args.test_therm:
+        import therm
         logging.info(f"Internal temp: {therm.get_internal_temp()}")
         logging.info(f"External temp: {therm.get_external_temp()}")
     else:
@@ -1,4 +1,5 @@
 import logging
+import threading
 
 try:
     import RPi.GPIO as GPIO
@@ -69,6 +70,28 @@ Y2_PINS             = (GPIO.LOW, GPIO.HIGH, GPIO.LOW)
 GPS_PINS = Y1_PINS
 VHF_PINS = Y2_PINS
 
+# named mux channels. OFF leaves both muxes disabled, on Y0 (which goes nowhere).
+OFF = 'off'
+GPS = 'gps'
+VHF = 'vhf'
+CHANNELS = {OFF: Y0_PINS, GPS: GPS_PINS, VHF: VHF_PINS}
+
+# what every output pin was last set to, so writes that wouldn't change anything are skipped.
+# Pins we haven't set yet (before init_pins) are always written.
+_shadow = {}
+# the active mux channel, or None when unknown.
+_channel = None
+_lock = threading.Lock()
+
+
+def _write(pins, values):
+    """ One list-form GPIO.output for every pin that isn't already at its value. Call with _lock held. """
+    changed = [(pin, value) for pin, value in zip(pins, values) if _shadow.get(pin) != value]
+    if not changed:
+        return
+    GPIO.output([pin for pin, _ in changed], [value for _, value in changed])
+    _shadow.update(changed)
+
 
 def init_pins():
     '''
@@ -78,6 +101,8 @@ def init_pins():
     *
     '''
 
+    global _channel
+
     # cuz GPIO lib is noisy.
     GPIO.setwarnings(False)
 
@@ -105,42 +130,64 @@ def init_pins():
     # This is a hack as I ran out of 3.3v rails. :(
     GPIO.setup(TEMP_VCC, GPIO.OUT, initial=GPIO.HIGH)
 
+    with _lock:
+        _shadow.clear()
+        _shadow.update({VHF_PTT: GPIO.HIGH, VHF_HL: GPIO.LOW, VHF_PD: GPIO.HIGH, TEMP_VCC: GPIO.HIGH,
+                        TX_MUX_E: GPIO.HIGH, TX_MUX_S0: GPIO.LOW, TX_MUX_S1: GPIO.LOW, TX_MUX_S2: GPIO.LOW,
+                        RX_MUX_E: GPIO.HIGH, RX_MUX_S0: GPIO.LOW, RX_MUX_S1: GPIO.LOW, RX_MUX_S2: GPIO.LOW})
+        _channel = OFF
+
     # It's tempting, but please don't mess with the uart pins.
     # GPIO.setup(TX_MUX_Z, GPIO.OUT, initial=GPIO.LOW)
     # GPIO.setup(RX_MUX_Z, GPIO.IN, initial=GPIO.LOW)
 
 
-def clear_uart():
-    # fire up the E pin. This has the effect of disabling any
-    # existing signal on the uart.
-    GPIO.output(TX_MUX_E, GPIO.HIGH)
-    GPIO.output(RX_MUX_E, GPIO.HIGH)
-
-    # activate Y0. Leave E high.
-    # we activate Y0 because it's not connected to any devices.
-    mux_activate(*Y0_PINS, E=GPIO.HIGH)
+def _activate(s0, s1, s2, E):
+    """ Call with _lock held. """
+    selects = (TX_MUX_S0, TX_MUX_S1, TX_MUX_S2, RX_MUX_S0, RX_MUX_S1, RX_MUX_S2)
+    if any(_shadow.get(pin) != value for pin, value in zip(selects, (s0, s1, s2) * 2)):
+        _write((TX_MUX_E, RX_MUX_E), (GPIO.HIGH, GPIO.HIGH))
+        _write(selects, (s0, s1, s2) * 2)
+    _write((TX_MUX_E, RX_MUX_E), (E, E))
 
 def mux_activate(s0, s1, s2, E=GPIO.LOW):
-    GPIO.output(TX_MUX_S0, s0)
-    GPIO.output(TX_MUX_S1, s1)
-    GPIO.output(TX_MUX_S2, s2)
-    GPIO.output(RX_MUX_S0, s0)
-    GPIO.output(RX_MUX_S1, s1)
-    GPIO.output(RX_MUX_S2, s2)
+    """
+    Points both muxes at one output. E goes high first, so nothing is connected while the select
+    lines move, and only comes back low once they're all set. At most three writes, none if the
+    muxes are already there.
+    """
+    global _channel
+    with _lock:
+        _activate(s0, s1, s2, E)
+        _channel = None
+
+def select(channel):
+    """ Connects the uart to a named channel. Returns False if it already was. """
+    global _channel
+    if channel not in CHANNELS:
+        raise ValueError(f'No mux channel {channel}')
+    with _lock:
+        if _channel == channel:
+            return False
+        # Y0 isn't connected to anything, and off leaves E high as well.
+        _activate(*CHANNELS[channel], E=GPIO.HIGH if channel == OFF else GPIO.LOW)
+        _channel = channel
+        return True
+
+def channel():
+    return _channel
 
-    # do the E pins
-    GPIO.output(TX_MUX_E, E)
-    GPIO.output(RX_MUX_E, E)
+def clear_uart():
+    return select(OFF)
 
 # gps is Y1
 def enable_gps():
-    clear_uart()
-    mux_activate(*GPS_PINS)
+    return select(GPS)
 
 # vhf is Y2
 def enable_vhf():
-    clear_uart()
-    mux_activate(*VHF_PINS)
+    return select(VHF)
 
 def set_pin(pin, hilo):
-    GPIO.output(pin, hilo)
+    with _lock:
+        _write((pin,), (hilo,))
@@ -1,12 +1,201 @@
 import serial
 import time
 import string
+import threading
+from collections import namedtuple
+from datetime import date, time as dtime, timezone
 import pynmea2
+import nmea
 import traceback
 import logging
 
 DEFAULT_UART_PORT = "/dev/ttyAMA0"
 
+# a fix that hasn't been refreshed in this long shouldn't be trusted.
+STALE_SECS = 30
+
+# serial read timeout (s). Also how long the reader can take to notice a pause.
+READ_TIMEOUT = 0.5
+
+# parse with nmea.py, and only hand lines to pynmea2 when it can't make sense of them.
+FAST_NMEA = True
+
+
+class Fix(namedtuple('Fix', ['lat', 'lon', 'altitude', 'speed_knots', 'speed_kph', 'course', 'sats',
+                             'quality', 'status', 'timestamp', 'datestamp', 'received'])):
+    """
+    Everything we know from the latest RMC/GGA/VTG/GLL sentences. Never modified; a new sentence
+    produces a new Fix. lat/lon are signed decimal degrees, altitude is meters.
+    `quality` is the GGA fix quality (0 = no fix), `status` is RMC/GLL's A (valid) or V (void),
+    and `received` is the time.monotonic() of the last sentence that went into it.
+    """
+    __slots__ = ()
+
+    def age(self, now=None):
+        return (time.monotonic() if now is None else now) - self.received
+
+    def is_stale(self, max_age=STALE_SECS, now=None):
+        return self.age(now) > max_age
+
+    def has_position(self):
+        return self.lat is not None and self.lon is not None and self.quality != 0 and self.status != 'V'
+
+
+EMPTY_FIX = Fix(None, None, None, None, None, None, None, None, None, None, None, float('-inf'))
+
+
+def _num(value, conv=float):
+    try:
+        return conv(value) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+def merge(fix, msg, received):
+    """ Folds one pynmea2 message into a fix, returning a new one. """
+    changes = {'received': received}
+    if getattr(msg, 'lat', None) and getattr(msg, 'lon', None):
+        changes['lat'] = msg.latitude
+        changes['lon'] = msg.longitude
+    if getattr(msg, 'timestamp', None) is not None:
+        changes['timestamp'] = msg.timestamp
+    if isinstance(msg, pynmea2.RMC):
+        changes['status'] = msg.status
+        changes['datestamp'] = msg.datestamp
+        changes['speed_knots'] = _num(msg.spd_over_grnd)
+        changes['course'] = _num(msg.true_course)
+    elif isinstance(msg, pynmea2.GGA):
+        changes['quality'] = msg.gps_qual
+        changes['sats'] = _num(msg.num_sats, int)
+        changes['altitude'] = _num(msg.altitude)
+    elif isinstance(msg, pynmea2.VTG):
+        changes['speed_knots'] = _num(msg.spd_over_grnd_kts)
+        changes['speed_kph'] = _num(msg.spd_over_grnd_kmph)
+        changes['course'] = _num(msg.true_track)
+    elif isinstance(msg, pynmea2.GLL):
+        changes['status'] = msg.status
+    return fix._replace(**{k: v for k, v in changes.items() if v is not None})
+
+def _utc_time(hhmmss):
+    secs = int(hhmmss)
+    return dtime(secs // 10000, secs // 100 % 100, secs % 100, int(round((hhmmss - secs) * 1e6)) % 1000000,
+                 tzinfo=timezone.utc)
+
+def _utc_date(ddmmyy):
+    return date(2000 + ddmmyy % 100, ddmmyy // 100 % 100, ddmmyy // 10000)
+
+def merge_sentence(fix, sentence, received):
+    """ Same as `merge`, for an nmea.Sentence. """
+    changes = {'received': received}
+    if sentence.lat is not None and sentence.lon is not None:
+        changes['lat'] = sentence.lat
+        changes['lon'] = sentence.lon
+    if sentence.utc is not None:
+        changes['timestamp'] = _utc_time(sentence.utc)
+    if sentence.date is not None:
+        changes['datestamp'] = _utc_date(sentence.date)
+    for field in ('altitude', 'speed_knots', 'speed_kph', 'course', 'sats', 'quality', 'status'):
+        value = getattr(sentence, field)
+        if value is not None:
+            changes[field] = value
+    return fix._replace(**changes)
+
+
+class GpsReader(threading.Thread):
+    """
+    Owns the GPS serial port and keeps `fix` up to date. `fix` is only ever replaced, never
+    modified, so anyone can read it at any time without taking a lock.
+    The UART is shared with the radio through the mux, so `pause` has to be called (and return)
+    before the mux is pointed anywhere else.
+    """
+    def __init__(self, device=DEFAULT_UART_PORT):
+        super().__init__(name='gps', daemon=True)
+        self.device = device
+        self.fix = EMPTY_FIX
+        self._sentence = nmea.Sentence()
+        self._stopped = threading.Event()
+        self._paused = threading.Event()
+        self._idle = threading.Event()
+
+    def run(self):
+        uart = None
+        flush = True
+        while not self._stopped.is_set():
+            if self._paused.is_set():
+                self._idle.set()
+                flush = True
+                time.sleep(0.05)
+                continue
+            try:
+                if not uart:
+                    uart = serial.Serial(port=self.device, baudrate=9600, timeout=READ_TIMEOUT)
+                if flush:
+                    # whatever arrived while the mux was elsewhere isn't ours.
+                    uart.reset_input_buffer()
+                    flush = False
+                self._consume(uart.readline())
+            except pynmea2.ParseError:
+                logging.debug("parse error. will try again.")
+            except (serial.SerialException, OSError):
+                traceback.print_exc()
+                if uart:
+                    uart.close()
+                uart = None
+                time.sleep(1)
+            except:
+                # garbage on the line (e.g. the tail end of a radio response). skip it.
+                logging.debug("problem reading gps line")
+        if uart:
+            uart.close()
+
+    def _consume(self, bline):
+        if FAST_NMEA:
+            try:
+                if nmea.parse(bline, self._sentence):
+                    self.fix = merge_sentence(self.fix, self._sentence, time.monotonic())
+                return
+            except nmea.ChecksumError:
+                logging.debug("bad nmea checksum")
+                return
+            except nmea.ParseError:
+                pass
+        msg = _interpret_gps_line(bline)
+        if msg:
+            self.fix = merge(self.fix, msg, time.monotonic())
+
+    def pause(self, timeout=2):
+        """ Stops reading. Returns once the port is quiet (or the timeout passes). """
+        self._idle.clear()
+        self._paused.set()
+        if self.is_alive():
+            return self._idle.wait(timeout)
+        return True
+
+    def resume(self):
+        self._paused.clear()
+
+    def stop(self):
+        self._stopped.set()
+
+
+_reader = None
+
+def start(device=DEFAULT_UART_PORT):
+    global _reader
+    if _reader is None or not _reader.is_alive():
+        _reader = GpsReader(device)
+        _reader.start()
+    return _reader
+
+def latest_fix():
+    return _reader.fix if _reader else EMPTY_FIX
+
+def pause():
+    return _reader.pause() if _reader else True
+
+def resume():
+    if _reader:
+        _reader.resume()
+
 def collect(device=DEFAULT_UART_PORT, duration_secs=10):
     start = time.time()
     cur_time = start
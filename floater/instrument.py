@@ -0,0 +1,182 @@
+"""
+Where the time goes. Stages (update_gps, send_aprs, uart round trips, subprocesses, ...) are timed
+into log scale histograms, kept twice: since boot and since the last flush. Counters are plain ints.
+
+Every scheduled run is an iteration. The stages timed inside it are kept as a tree, so when an
+iteration finishes past its deadline we can say which stage (and which stage inside that) ate the time.
+
+`flush` writes a compact JSON summary (atomically) and starts a new window.
+"""
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# bucket i holds durations up to BUCKETS[i] seconds. 1ms .. ~17 minutes, two buckets per doubling.
+BUCKETS = tuple(0.001 * 2 ** (i / 2) for i in range(41))
+
+MAX_OVERRUNS = 50
+
+DEFAULT_PATH = os.path.join(os.environ.get('FLIGHT_HOME', '/home/pi'), 'stats.json')
+
+
+class Histogram(object):
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, secs):
+        self.counts[bisect.bisect_left(BUCKETS, secs)] += 1
+        self.count += 1
+        self.total += secs
+        self.min = secs if self.min is None else min(self.min, secs)
+        self.max = secs if self.max is None else max(self.max, secs)
+
+    def percentile(self, p):
+        """ Upper edge of the bucket the p-th percentile falls in (the max for the last bucket). """
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+    def as_dict(self):
+        if not self.count:
+            return {'count': 0}
+        return {'count': self.count, 'mean': self.total / self.count, 'min': self.min, 'max': self.max,
+                'p50': self.percentile(50), 'p90': self.percentile(90), 'p99': self.percentile(99)}
+
+
+class _Node(object):
+    __slots__ = ('name', 'secs', 'children')
+
+    def __init__(self, name):
+        self.name = name
+        self.secs = 0.0
+        self.children = []
+
+
+class Instruments(object):
+    def __init__(self, clock=time.monotonic, max_overruns=MAX_OVERRUNS):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stages = {}
+        self.window = {}
+        self.counters = {}
+        self.overruns = deque(maxlen=max_overruns)
+        self.overrun_count = 0
+        self.window_start = time.time()
+
+    def observe(self, stage, secs):
+        with self._lock:
+            for table in (self.stages, self.window):
+                hist = table.get(stage)
+                if hist is None:
+                    hist = table[stage] = Histogram()
+                hist.add(secs)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def timed(self, stage):
+        """ Times the block (or, as a decorator, the function) as `stage`. """
+        stack = getattr(self._local, 'stack', None)
+        node = _Node(stage)
+        if stack:
+            stack[-1].children.append(node)
+            stack.append(node)
+        start = self.clock()
+        try:
+            yield node
+        finally:
+            node.secs = self.clock() - start
+            if stack:
+                stack.pop()
+            self.observe(stage, node.secs)
+
+    @contextmanager
+    def iteration(self, task, deadline_at):
+        """
+        One run of a scheduled task, due to be done by `deadline_at` (on `clock`). The run itself
+        is timed as 'task.<name>'.
+        """
+        root = _Node(f'task.{task}')
+        self._local.stack = [root]
+        start = self.clock()
+        try:
+            yield root
+        finally:
+            end = self.clock()
+            root.secs = end - start
+            self._local.stack = None
+            self.observe(root.name, root.secs)
+            if end > deadline_at:
+                self._overrun(task, root, end - deadline_at)
+
+    @staticmethod
+    def _cause(root):
+        """ Follows the most expensive stage down the tree: 'send_aprs > dra818.transmit'. """
+        path, node = [], root
+        while node.children:
+            node = max(node.children, key=lambda n: n.secs)
+            path.append(f'{node.name} {node.secs:.2f}s')
+        return ' > '.join(path) if path else None
+
+    def _overrun(self, task, root, late):
+        cause = self._cause(root)
+        with self._lock:
+            self.overrun_count += 1
+            self.overruns.append({'task': task, 'at': time.time(), 'secs': root.secs, 'late': late, 'cause': cause})
+        logging.warning(f"{task} overran its deadline by {late:.1f}s ({root.secs:.1f}s). Cause: {cause or 'the task itself'}")
+
+    def summary(self):
+        with self._lock:
+            return {
+                'at': time.time(),
+                'window_start': self.window_start,
+                'stages': {name: h.as_dict() for name, h in sorted(self.stages.items())},
+                'window': {name: h.as_dict() for name, h in sorted(self.window.items())},
+                'counters': dict(self.counters),
+                'overrun_count': self.overrun_count,
+                'overruns': list(self.overruns),
+            }
+
+    def flush(self, path):
+        """ Writes the summary to `path` (all or nothing) and starts a new window. """
+        summary = self.summary()
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(summary, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.window = {}
+            self.window_start = time.time()
+        return summary
+
+
+_default = Instruments()
+
+def default():
+    return _default
+
+def timed(stage):
+    return _default.timed(stage)
+
+def count(name, n=1):
+    _default.count(name, n)
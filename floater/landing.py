@@ -0,0 +1,97 @@
+"""
+Where the payload will come down, for the chase team.
+
+The way up is a wind sounding: every fix gives the horizontal velocity (ground speed and course)
+at that altitude, which is the wind there. Fixes are folded into a running mean per LAYER_M
+altitude layer as they come in. Nothing else from the history is kept.
+
+The way down is a parachute at terminal velocity, which falls faster where the air is thin:
+v = v0 * sqrt(rho0 / rho), with the density falling off exponentially with altitude. The time to
+fall through each layer at v0 = 1 m/s is worked out once, so a prediction is one pass over the
+layers below the payload: time in the layer times the wind there, added up.
+"""
+import math
+from collections import namedtuple
+
+LAYER_M = 500
+TOP_M = 40000
+# density scale height (m) of the lower atmosphere.
+SCALE_HEIGHT = 7238.3
+# m/s under the parachute at sea level, until a descent says otherwise.
+DESCENT_RATE = 5.0
+# how much each observed descent rate moves the estimate.
+DESCENT_GAIN = 0.1
+EARTH_RADIUS = 6371000.0
+KNOTS = 0.514444
+
+Prediction = namedtuple('Prediction', ['lat', 'lon', 'secs'])
+
+
+def _fall_factor(altitude):
+    """ v / v0 at `altitude`. """
+    return math.exp(altitude / (2 * SCALE_HEIGHT))
+
+
+class LandingPredictor(object):
+    def __init__(self, layer_m=LAYER_M, top=TOP_M, descent_rate=DESCENT_RATE, ground=0.0):
+        self.layer_m = layer_m
+        layers = int(math.ceil(top / layer_m))
+        self.east = [0.0] * layers
+        self.north = [0.0] * layers
+        self.count = [0] * layers
+        # seconds to fall through each layer at v0 = 1 m/s.
+        self._fall_secs = [layer_m / _fall_factor((i + 0.5) * layer_m) for i in range(layers)]
+        self.descent_rate = descent_rate
+        self.ground = ground
+
+    def _layer(self, altitude):
+        return min(max(int(altitude // self.layer_m), 0), len(self.count) - 1)
+
+    def add_wind(self, altitude, speed_knots, course):
+        """ Folds a fix's ground speed and course into the wind for its layer. """
+        if altitude is None or speed_knots is None or course is None:
+            return
+        i = self._layer(altitude)
+        speed = speed_knots * KNOTS
+        rad = math.radians(course)
+        self.count[i] += 1
+        self.east[i] += (speed * math.sin(rad) - self.east[i]) / self.count[i]
+        self.north[i] += (speed * math.cos(rad) - self.north[i]) / self.count[i]
+
+    def observe_descent(self, altitude, rate):
+        """ Calibrates the sea level descent rate from a vertical rate (m/s, negative) seen at `altitude`. """
+        # the last few hundred meters include the touchdown, which isn't the parachute's doing.
+        if altitude is None or rate is None or rate >= 0 or altitude - self.ground < self.layer_m:
+            return
+        v0 = -rate / _fall_factor(altitude)
+        self.descent_rate += DESCENT_GAIN * (v0 - self.descent_rate)
+
+    def _wind_above(self, i):
+        """ The nearest layer at or above `i` with any wind in it, or calm. """
+        for j in range(i, len(self.count)):
+            if self.count[j]:
+                return self.east[j], self.north[j]
+        return 0.0, 0.0
+
+    def predict(self, lat, lon, altitude):
+        """ Landing point and seconds until touchdown for a payload descending from here. """
+        if altitude is None or altitude <= self.ground:
+            return Prediction(lat, lon, 0.0)
+        # layers nobody flew through (a reboot, a gap in fixes) get the wind from above them.
+        wind = self._wind_above(self._layer(altitude))
+        east = north = secs = 0.0
+        h = altitude
+        while h > self.ground:
+            # the layer just below h, so a layer boundary counts as the top of the one under it.
+            i = min(max(int(math.ceil(h / self.layer_m)) - 1, 0), len(self.count) - 1)
+            bottom = max(i * self.layer_m, self.ground)
+            if self.count[i]:
+                wind = self.east[i], self.north[i]
+            dt = self._fall_secs[i] * (h - bottom) / self.layer_m / self.descent_rate
+            east += wind[0] * dt
+            north += wind[1] * dt
+            secs += dt
+            h = bottom
+        lat_out = lat + math.degrees(north / EARTH_RADIUS)
+        lon_out = lon + math.degrees(east / (EARTH_RADIUS * math.cos(math.radians(lat))))
+        return Prediction(lat_out, lon_out, secs)
@@ -0,0 +1,215 @@
+"""
+Keeps track of every photo and video we take, so nothing has to go looking on the SD card.
+
+Each capture is a line in an append-only manifest (json lines) with its path, time, where we were
+and how big it is. The sequence counters and the in-memory index are rebuilt from the manifest
+on startup. A half written last line (brownout) is cut off, so the next line starts clean. Deleting a capture appends a
+'removed' line for it, so the bytes used per kind are always known without listing anything.
+"""
+import os
+import json
+import time
+import bisect
+import threading
+import logging
+from collections import namedtuple
+
+PHOTO = 'photo'
+VIDEO = 'video'
+
+# kind -> (sub directory, file name pattern)
+LAYOUT = {
+    PHOTO: ('photos', 'capture_{:04d}.jpg'),
+    VIDEO: ('videos', 'capture_{:04d}.h264'),
+}
+
+MANIFEST = 'manifest.jsonl'
+
+Entry = namedtuple('Entry', ['kind', 'seq', 'path', 'time', 'lat', 'lon', 'alt', 'size'])
+
+
+class MediaStore(object):
+    def __init__(self, root, layout=None, manifest=MANIFEST):
+        self.root = root
+        self.layout = dict(layout or LAYOUT)
+        self.manifest_path = os.path.join(root, manifest)
+        self._lock = threading.Lock()
+        self._next = {kind: 0 for kind in self.layout}
+        self._entries = {kind: [] for kind in self.layout}
+        self._times = {kind: [] for kind in self.layout}
+        self._bytes = {kind: 0 for kind in self.layout}
+        self._load()
+
+    def _dir(self, kind):
+        return os.path.join(self.root, self.layout[kind][0])
+
+    def path_for(self, kind, seq):
+        return os.path.join(self._dir(kind), self.layout[kind][1].format(seq))
+
+    def _index(self, entry):
+        times = self._times[entry.kind]
+        if not times or entry.time >= times[-1]:
+            times.append(entry.time)
+            self._entries[entry.kind].append(entry)
+        else:
+            # the clock went backwards (gps time vs. rtc-less boot). keep the index sorted anyway.
+            idx = bisect.bisect_right(times, entry.time)
+            times.insert(idx, entry.time)
+            self._entries[entry.kind].insert(idx, entry)
+        self._bytes[entry.kind] += entry.size or 0
+        self._next[entry.kind] = max(self._next[entry.kind], entry.seq + 1)
+
+    def _unindex(self, kind, seqs):
+        kept = [e for e in self._entries[kind] if e.seq not in seqs]
+        self._entries[kind] = kept
+        self._times[kind] = [e.time for e in kept]
+        self._bytes[kind] = sum(e.size or 0 for e in kept)
+
+    def _append(self, records):
+        with open(self.manifest_path, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+            f.flush()
+
+    def _read_manifest(self):
+        """ The manifest's complete lines. A torn last line is cut off the file too. """
+        with open(self.manifest_path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                end = data.rfind(b'\n') + 1
+                logging.warning(f"Dropping torn manifest line: {data[end:]!r}")
+                data = data[:end]
+                f.truncate(end)
+        return data.decode('utf-8', errors='replace').splitlines()
+
+    def _from_disk(self, kind, seq):
+        """ An entry for a capture that's on the card but not in the manifest. None if it isn't there. """
+        path = self.path_for(kind, seq)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return Entry(kind=kind, seq=seq, path=path, time=st.st_mtime, lat=None, lon=None, alt=None, size=st.st_size)
+
+    def _load(self):
+        if os.path.exists(self.manifest_path):
+            removed = {kind: set() for kind in self.layout}
+            for line in self._read_manifest():
+                try:
+                    record = json.loads(line)
+                    if record.get('removed'):
+                        removed[record['kind']].add(record['seq'])
+                        continue
+                    entry = Entry(**record)
+                except (ValueError, TypeError, KeyError, AttributeError):
+                    logging.warning(f"Skipping bad manifest line: {line.strip()}")
+                    continue
+                if entry.kind in self.layout:
+                    self._index(entry)
+            for kind, seqs in removed.items():
+                if seqs:
+                    self._unindex(kind, seqs)
+        else:
+            self._bootstrap()
+        # a capture can land on disk without making it into the manifest (power cut in between).
+        # it still takes up room, so it goes in. This is normally zero or one stat per kind.
+        found = []
+        for kind in self.layout:
+            while True:
+                entry = self._from_disk(kind, self._next[kind])
+                if entry is None:
+                    break
+                self._index(entry)
+                found.append(entry._asdict())
+        if found:
+            self._append(found)
+
+    def _bootstrap(self):
+        """
+        No manifest yet (first run, or media from before we kept one): one listing per kind. What's
+        there goes into a new manifest, timed by mtime, so it counts against the storage budget.
+        """
+        found = []
+        for kind, (_, pattern) in self.layout.items():
+            prefix, suffix = pattern.split('{', 1)[0], pattern.rsplit('}', 1)[-1]
+            try:
+                names = os.listdir(self._dir(kind))
+            except FileNotFoundError:
+                continue
+            for name in names:
+                if name.startswith(prefix) and name.endswith(suffix):
+                    try:
+                        seq = int(name[len(prefix):len(name) - len(suffix)])
+                    except ValueError:
+                        continue
+                    entry = self._from_disk(kind, seq)
+                    if entry is not None:
+                        self._index(entry)
+                        found.append(entry)
+        if found:
+            # oldest first, like a manifest that had been kept all along.
+            self._append(e._asdict() for e in sorted(found, key=lambda e: e.time))
+
+    def next_path(self, kind):
+        """ Reserves the next sequence number for `kind` and returns its path. """
+        with self._lock:
+            seq = self._next[kind]
+            self._next[kind] += 1
+        os.makedirs(self._dir(kind), exist_ok=True)
+        return self.path_for(kind, seq)
+
+    def _seq_of(self, kind, path):
+        prefix, suffix = self.layout[kind][1].split('{', 1)[0], self.layout[kind][1].rsplit('}', 1)[-1]
+        return int(os.path.basename(path)[len(prefix):-len(suffix)])
+
+    def add(self, kind, path, fix=None, size=None, when=None):
+        """
+        Records a finished capture. `fix` is anything with lat/lon/altitude (a gps.Fix).
+        The size is looked up if not given.
+        """
+        if size is None:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = None
+        entry = Entry(kind=kind, seq=self._seq_of(kind, path), path=path,
+                      time=time.time() if when is None else when,
+                      lat=getattr(fix, 'lat', None), lon=getattr(fix, 'lon', None),
+                      alt=getattr(fix, 'altitude', None), size=size)
+        with self._lock:
+            self._append([entry._asdict()])
+            self._index(entry)
+        return entry
+
+    def remove(self, kind, entries):
+        """ Deletes captures of `kind` from the card and the index. Already missing files are fine. """
+        seqs = set()
+        for entry in entries:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+            seqs.add(entry.seq)
+        if not seqs:
+            return
+        with self._lock:
+            self._append({'kind': kind, 'seq': seq, 'removed': True} for seq in sorted(seqs))
+            self._unindex(kind, seqs)
+
+    def bytes_used(self, kind):
+        return self._bytes[kind]
+
+    def latest(self, kind):
+        entries = self._entries[kind]
+        return entries[-1] if entries else None
+
+    def between(self, kind, t1, t2):
+        """ Everything of `kind` captured in [t1, t2]. """
+        times = self._times[kind]
+        return self._entries[kind][bisect.bisect_left(times, t1):bisect.bisect_right(times, t2)]
+
+    def entries(self, kind):
+        return list(self._entries[kind])
+
+    def count(self, kind):
+        return len(self._entries[kind])
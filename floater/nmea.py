@@ -0,0 +1,133 @@
+"""
+Bytes level parser for the only four sentences we care about (RMC, GGA, VTG, GLL).
+
+Everything else the GPS spits out (GSV, GSA, TXT, ...) is thrown away by looking at three bytes,
+without decoding or even checking the checksum. The fields we keep go into a Sentence that is
+allocated once and reused for every line.
+"""
+
+RMC = 1
+GGA = 2
+VTG = 3
+GLL = 4
+
+TYPES = {b'RMC': RMC, b'GGA': GGA, b'VTG': VTG, b'GLL': GLL}
+TALKERS = {b'GP', b'GN', b'GL', b'GA', b'GB', b'BD'}
+
+_HEX = b'0123456789ABCDEFabcdef'
+
+
+class ParseError(ValueError):
+    pass
+
+
+class ChecksumError(ParseError):
+    pass
+
+
+class Sentence(object):
+    """
+    Numeric fields from the last line that was parsed. Anything the sentence didn't carry is None.
+    lat/lon are signed decimal degrees, altitude is meters, `utc` is hhmmss.ss as a float and
+    `date` is ddmmyy as an int.
+    """
+    __slots__ = ('kind', 'lat', 'lon', 'altitude', 'speed_knots', 'speed_kph', 'course', 'sats',
+                 'quality', 'status', 'utc', 'date')
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.kind = None
+        self.lat = None
+        self.lon = None
+        self.altitude = None
+        self.speed_knots = None
+        self.speed_kph = None
+        self.course = None
+        self.sats = None
+        self.quality = None
+        self.status = None
+        self.utc = None
+        self.date = None
+
+
+def _float(field):
+    return float(field) if field else None
+
+def _int(field):
+    return int(field) if field else None
+
+def _degrees(value, hemisphere):
+    """ ddmm.mmmm (or dddmm.mmmm) + N/S/E/W -> signed decimal degrees. """
+    if not value:
+        return None
+    v = float(value)
+    d = int(v // 100)
+    deg = d + (v - d * 100) / 60
+    return -deg if hemisphere in (b'S', b'W') else deg
+
+def _status(field):
+    return field.decode('ascii') if field else None
+
+def wanted(line):
+    """ True if the line is one of ours. Looks at 6 bytes and nothing else. """
+    return len(line) > 6 and line[0] == 0x24 and line[3:6] in TYPES and line[1:3] in TALKERS
+
+def checksum_ok(line):
+    star = line.rfind(b'*')
+    if star < 0 or len(line) < star + 3 or line[star + 1] not in _HEX or line[star + 2] not in _HEX:
+        return False
+    c = 0
+    for b in line[1:star]:
+        c ^= b
+    return c == int(line[star + 1:star + 3], 16)
+
+def parse(line, out):
+    """
+    Parses a raw line (bytes, with or without the trailing CR/LF) into `out`.
+    Returns the sentence type (RMC/GGA/VTG/GLL), or None for anything we don't care about.
+    Raises ChecksumError for a corrupt line, ParseError for a line that doesn't look like we expect.
+    """
+    line = line.strip()
+    if not wanted(line):
+        return None
+    if not checksum_ok(line):
+        raise ChecksumError(line)
+    kind = TYPES[line[3:6]]
+    f = line[:line.rfind(b'*')].split(b',')
+    out.clear()
+    try:
+        if kind == RMC:
+            # $GPRMC,hhmmss.ss,A,llll.ll,a,yyyyy.yy,a,x.x,x.x,ddmmyy,x.x,a*hh
+            out.utc = _float(f[1])
+            out.status = _status(f[2])
+            out.lat = _degrees(f[3], f[4])
+            out.lon = _degrees(f[5], f[6])
+            out.speed_knots = _float(f[7])
+            out.course = _float(f[8])
+            out.date = _int(f[9])
+        elif kind == GGA:
+            # $GPGGA,hhmmss.ss,llll.ll,a,yyyyy.yy,a,q,nn,x.x,x.x,M,x.x,M,x.x,xxxx*hh
+            out.utc = _float(f[1])
+            out.lat = _degrees(f[2], f[3])
+            out.lon = _degrees(f[4], f[5])
+            out.quality = _int(f[6])
+            out.sats = _int(f[7])
+            out.altitude = _float(f[9])
+        elif kind == VTG:
+            # $GPVTG,x.x,T,x.x,M,x.x,N,x.x,K*hh
+            out.course = _float(f[1])
+            out.speed_knots = _float(f[5])
+            out.speed_kph = _float(f[7])
+        else:
+            # $GPGLL,llll.ll,a,yyyyy.yy,a,hhmmss.ss,A*hh
+            out.lat = _degrees(f[1], f[2])
+            out.lon = _degrees(f[3], f[4])
+            out.utc = _float(f[5])
+            out.status = _status(f[6]) if len(f) > 6 else None
+    except (IndexError, ValueError) as ex:
+        out.clear()
+        raise ParseError(line) from ex
+    out.kind = kind
+    return kind
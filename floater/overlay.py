@@ -0,0 +1,71 @@
+"""
+Text overlays without ImageMagick. Every glyph we could need is rasterized once into an atlas,
+and labels are put together by pasting crops out of it, so nothing gets re-rendered per photo.
+"""
+import os
+import string
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+
+FONT_PATHS = [
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/truetype/freefont/FreeSansBold.ttf',
+]
+
+CHARSET = string.ascii_letters + string.digits + string.punctuation + ' '
+
+
+def _load_font(size):
+    for path in FONT_PATHS:
+        if os.path.exists(path):
+            return ImageFont.truetype(path, size)
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # older pillow only has the fixed size bitmap font.
+        return ImageFont.load_default()
+
+
+class GlyphAtlas(object):
+    def __init__(self, size):
+        font = _load_font(size)
+        ascent, descent = font.getmetrics()
+        self.height = ascent + descent
+        self.boxes = {}
+        widths = [max(1, int(round(font.getlength(c)))) for c in CHARSET]
+        self.image = Image.new('L', (sum(widths), self.height), 0)
+        draw = ImageDraw.Draw(self.image)
+        x = 0
+        for c, w in zip(CHARSET, widths):
+            draw.text((x, 0), c, fill=255, font=font)
+            self.boxes[c] = (x, w)
+            x += w
+
+    def width(self, text):
+        return sum(self.boxes.get(c, self.boxes['?'])[1] for c in text)
+
+    def render(self, text):
+        """ Returns an 'L' mask of `text` (255 = ink). """
+        mask = Image.new('L', (max(1, self.width(text)), self.height), 0)
+        x = 0
+        for c in text:
+            x0, w = self.boxes.get(c, self.boxes['?'])
+            mask.paste(self.image.crop((x0, 0, x0 + w, self.height)), (x, 0))
+            x += w
+        return mask
+
+
+@lru_cache(maxsize=4)
+def atlas(size):
+    return GlyphAtlas(size)
+
+def label_bar(text, width, height, fg=255, bg=0, font_size=None):
+    """ An RGB bar with `text` centered on it. Text that doesn't fit gets squeezed. """
+    glyphs = atlas(font_size or max(8, height - 6))
+    mask = glyphs.render(text)
+    if mask.width > width - 4:
+        mask = mask.resize((width - 4, mask.height), Image.BILINEAR)
+    bar = Image.new('RGB', (width, height), (bg, bg, bg))
+    bar.paste((fg, fg, fg), ((width - mask.width) // 2, (height - mask.height) // 2), mask)
+    return bar
@@ -0,0 +1,132 @@
+"""
+Works out what the balloon is doing from the stream of fixes: sitting on the ground, going up,
+floating, bursting, coming down or down for good.
+
+The vertical rate is the slope of a least squares line through the last WINDOW_SECS of
+(time, altitude) samples. The sums it needs are kept running, so a sample costs the same however
+many are in the window. A phase change has to hold for a while before it is believed (except
+burst, which is obvious enough and too short to wait for).
+"""
+from collections import deque
+
+GROUND = 'ground'
+ASCENT = 'ascent'
+CRUISE = 'cruise'
+BURST = 'burst'
+DESCENT = 'descent'
+LANDED = 'landed'
+
+WINDOW_SECS = 60
+# samples closer together than this are the same fix seen twice.
+MIN_INTERVAL = 1.0
+
+# m/s
+ASCENT_RATE = 1.5
+FLOAT_RATE = 1.0
+DESCENT_RATE = -2.0
+BURST_RATE = -10.0
+LANDED_RATE = 0.5
+
+# a burst is also this far (m) below the highest point so far.
+BURST_DROP = 200
+# floating this high up is cruise, even if we never saw the ascent (a reboot in flight).
+CRUISE_MIN_ALT = 3000
+# how long after a burst it's just a descent.
+BURST_SECS = 120
+
+# how long a new phase has to hold before it's taken (s).
+HOLD_SECS = {ASCENT: 30, CRUISE: 300, DESCENT: 60, LANDED: 120}
+
+
+class VerticalRate(object):
+    """ Least squares slope over a sliding time window. O(1) per sample. """
+    def __init__(self, window=WINDOW_SECS):
+        self.window = window
+        self._samples = deque()
+        self._t0 = None
+        self._st = self._sa = self._stt = self._sta = 0.0
+
+    def add(self, t, altitude):
+        if self._t0 is None:
+            self._t0 = t
+        # relative to the first sample keeps the sums small enough to stay accurate.
+        t -= self._t0
+        self._samples.append((t, altitude))
+        self._st += t
+        self._sa += altitude
+        self._stt += t * t
+        self._sta += t * altitude
+        while t - self._samples[0][0] > self.window:
+            old_t, old_a = self._samples.popleft()
+            self._st -= old_t
+            self._sa -= old_a
+            self._stt -= old_t * old_t
+            self._sta -= old_t * old_a
+
+    @property
+    def span(self):
+        return self._samples[-1][0] - self._samples[0][0] if self._samples else 0.0
+
+    @property
+    def rate(self):
+        """ m/s, or None until the window is at least half full. """
+        n = len(self._samples)
+        if n < 2 or self.span < self.window / 2:
+            return None
+        denominator = n * self._stt - self._st * self._st
+        if denominator <= 0:
+            return None
+        return (n * self._sta - self._st * self._sa) / denominator
+
+
+class PhaseDetector(object):
+    def __init__(self, window=WINDOW_SECS, hold_secs=None):
+        self.rate = VerticalRate(window)
+        self.hold_secs = dict(HOLD_SECS, **(hold_secs or {}))
+        self.phase = GROUND
+        self.started = None
+        self.since = None
+        self.max_altitude = None
+        self.changes = []
+        self._last_t = None
+        self._candidate = None
+        self._candidate_since = None
+
+    def _proposed(self, t, altitude, rate):
+        if self.phase in (ASCENT, CRUISE) and rate < BURST_RATE and altitude < self.max_altitude - BURST_DROP:
+            return BURST
+        if self.phase == BURST:
+            return DESCENT if t - self.since >= BURST_SECS else None
+        if self.phase in (GROUND, CRUISE) and rate > ASCENT_RATE:
+            return ASCENT
+        if self.phase in (GROUND, ASCENT, CRUISE) and rate < DESCENT_RATE:
+            return DESCENT
+        if self.phase in (GROUND, ASCENT) and abs(rate) < FLOAT_RATE and altitude > CRUISE_MIN_ALT:
+            return CRUISE
+        if self.phase == DESCENT and abs(rate) < LANDED_RATE:
+            return LANDED
+        return None
+
+    def add(self, t, altitude):
+        """ Feeds a fix. Returns the new phase if this sample changed it, otherwise None. """
+        if altitude is None or (self._last_t is not None and t - self._last_t < MIN_INTERVAL):
+            return None
+        self._last_t = t
+        if self.started is None:
+            self.started = self.since = t
+        self.max_altitude = altitude if self.max_altitude is None else max(self.max_altitude, altitude)
+        self.rate.add(t, altitude)
+        rate = self.rate.rate
+        if rate is None:
+            return None
+        proposed = self._proposed(t, altitude, rate)
+        if proposed != self._candidate:
+            self._candidate, self._candidate_since = proposed, t
+        # out of a burst is a plain timeout, nothing to wait for.
+        hold = 0 if self.phase == BURST else self.hold_secs.get(proposed, 0)
+        if proposed is None or t - self._candidate_since < hold:
+            return None
+        self.phase, self.since = proposed, t
+        self._candidate = None
+        self.changes.append((t, proposed))
+        return proposed
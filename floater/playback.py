@@ -0,0 +1,133 @@
+import time
+import subprocess
+import logging
+from itertools import chain
+import numpy as np
+
+import instrument
+
+try:
+    import alsaaudio
+except ModuleNotFoundError:
+    logging.error("Could not load alsaaudio. Playback will go through aplay.")
+    alsaaudio = None
+
+DEFAULT_DEVICE = 'plughw:CARD=Set,DEV=0'
+DEFAULT_RATE = 48000
+PERIOD_FRAMES = 1024
+
+# how long the radio is keyed before the audio starts, so the transmitter is up and receivers have
+# opened squelch by the time the first flag goes out.
+TX_DELAY = 0.3
+
+
+class _AplayPcm(object):
+    """ Stand-in for an alsaaudio PCM when the module isn't installed. Still no wav files. """
+    def __init__(self, device, rate):
+        self._started = time.monotonic()
+        self.proc = subprocess.Popen(
+            ['aplay', '-q', '-D', device, '-t', 'raw', '-f', 'S16_LE', '-c', '1', '-r', str(rate)],
+            stdin=subprocess.PIPE, shell=False)
+
+    def write(self, data):
+        self.proc.stdin.write(data)
+        return len(data) // 2
+
+    def drain(self):
+        self.proc.stdin.close()
+        self.proc.wait()
+        # start to exit: the whole playback, not just the fork.
+        instrument.default().observe('subprocess.aplay', time.monotonic() - self._started)
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+
+
+class Player(object):
+    """
+    Keeps the output PCM open between transmissions and plays int16 buffers (or generators
+    of buffers) straight out of memory. It is only reopened when the sample rate changes.
+    """
+    def __init__(self, device=DEFAULT_DEVICE, period_frames=PERIOD_FRAMES):
+        self.device = device
+        self.period_frames = period_frames
+        self._pcm = None
+        self._rate = None
+
+    def _open(self, rate):
+        if self._pcm is not None and (self._rate != rate or alsaaudio is None):
+            self.close()
+        if self._pcm is None:
+            if alsaaudio is not None:
+                self._pcm = alsaaudio.PCM(type=alsaaudio.PCM_PLAYBACK, mode=alsaaudio.PCM_NORMAL, device=self.device,
+                                          rate=rate, channels=1, format=alsaaudio.PCM_FORMAT_S16_LE,
+                                          periodsize=self.period_frames)
+            else:
+                self._pcm = _AplayPcm(self.device, rate)
+            self._rate = rate
+        return self._pcm
+
+    def close(self):
+        if self._pcm is not None:
+            self._pcm.close()
+        self._pcm = None
+        self._rate = None
+
+    def _periods(self, audio):
+        """ Re-chunks whatever we are given into whole periods. The tail gets padded with silence. """
+        if isinstance(audio, np.ndarray):
+            audio = [audio]
+        pending = np.empty(0, dtype=np.int16)
+        for chunk in audio:
+            pending = np.concatenate((pending, np.asarray(chunk, dtype=np.int16)))
+            whole = len(pending) - len(pending) % self.period_frames
+            if whole:
+                yield pending[:whole]
+                pending = pending[whole:]
+        if len(pending):
+            yield np.concatenate((pending, np.zeros(self.period_frames - len(pending), dtype=np.int16)))
+
+    def play(self, audio, rate=DEFAULT_RATE, ptt=None, tx_delay=TX_DELAY):
+        """
+        Plays `audio`, an int16 array or an iterable of them. If `ptt` is given it gets called with
+        True when the first buffer is submitted and with False as soon as the last period has drained.
+        The TX delay is played as silence, so it's counted from submission rather than slept.
+        Returns the number of seconds of audio that were played.
+        """
+        pcm = self._open(rate)
+        lead_in = int(round(tx_delay * rate))
+        lead_in += -lead_in % self.period_frames
+        frames = 0
+        # when the last frame written so far will have left the device. If we ever fall behind
+        # (an underrun), the device restarts with whatever we write next.
+        drained_at = time.monotonic()
+        if ptt:
+            ptt(True)
+        try:
+            for period in chain([np.zeros(lead_in, dtype=np.int16)], self._periods(audio)):
+                now = time.monotonic()
+                written = pcm.write(period.astype('<i2', copy=False).tobytes())
+                drained_at = max(drained_at, now) + written / rate
+                frames += written
+            self._drain(pcm, drained_at)
+        except:
+            # a half written device is in an unknown state. start fresh next time.
+            self.close()
+            raise
+        finally:
+            if ptt:
+                ptt(False)
+        if alsaaudio is None:
+            self.close()
+        return (frames - lead_in) / rate
+
+    def _drain(self, pcm, drained_at):
+        if isinstance(pcm, _AplayPcm):
+            pcm.drain()
+            return
+        # writes block until there's room in the ring buffer, so at most a buffer's worth is still
+        # queued and we know when it runs out. alsa's drain() would stop the stream, and we want it open.
+        remaining = drained_at - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
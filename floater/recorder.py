@@ -0,0 +1,149 @@
+"""
+Flight data recorder. Fixed size binary records in a ring file that is allocated up front and
+memory mapped, so a record is just a few stores into memory.
+
+Every record has a sequence number and a CRC, which is all a reader needs: a record torn by a
+brownout fails its CRC and is skipped, and the sequence numbers put the ring back in order.
+The map is flushed to the card every `sync_every` records, which bounds what a power cut can lose.
+"""
+import os
+import mmap
+import struct
+import zlib
+import numpy as np
+
+MAGIC = b'FLOATREC'
+VERSION = 1
+HEADER = struct.Struct('<8sHHI')
+HEADER_SIZE = 64
+
+RECORD = np.dtype([
+    ('seq', '<u4'),
+    ('sats', 'u1'),
+    ('_pad', 'V3'),
+    ('time', '<f8'),        # unix time
+    ('lat', '<f8'),         # degrees
+    ('lon', '<f8'),         # degrees
+    ('altitude', '<f4'),    # meters
+    ('speed', '<f4'),       # knots
+    ('course', '<f4'),      # degrees
+    ('temp_in', '<f4'),
+    ('temp_out', '<f4'),
+    ('crc', '<u4'),
+])
+_CRC_SPAN = RECORD.itemsize - 4
+
+# a record every 5s for a week.
+DEFAULT_CAPACITY = 7 * 24 * 720
+DEFAULT_SYNC_EVERY = 12
+
+NO_SATS = 255
+
+DEFAULT_PATH = os.path.join(os.environ.get('FLIGHT_HOME', '/home/pi'), 'flight.rec')
+
+
+def _valid(raw):
+    """ Mask of the records in `raw` (a uint8 view, one row per record) whose CRC checks out. """
+    seqs = raw[:, :4].copy().view('<u4').ravel()
+    crcs = raw[:, _CRC_SPAN:].copy().view('<u4').ravel()
+    valid = np.zeros(len(raw), dtype=bool)
+    # slots that were never written are all zeros. No need to checksum those.
+    for i in np.flatnonzero(seqs):
+        valid[i] = zlib.crc32(raw[i, :_CRC_SPAN].tobytes()) == crcs[i]
+    return valid
+
+def _num(value):
+    return np.nan if value is None or isinstance(value, str) else value
+
+
+class Recorder(object):
+    def __init__(self, path=DEFAULT_PATH, capacity=DEFAULT_CAPACITY, sync_every=DEFAULT_SYNC_EVERY):
+        self.path = path
+        self.sync_every = sync_every
+        self._unsynced = 0
+        size = HEADER_SIZE + capacity * RECORD.itemsize
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            self._create(path, capacity, size)
+        self._file = open(path, 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, version, record_size, self.capacity = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.itemsize:
+            self.close()
+            raise ValueError(f'{path} is not a version {VERSION} flight recording')
+        self._records = np.frombuffer(self._map, dtype=RECORD, count=self.capacity, offset=HEADER_SIZE)
+        self._raw = np.frombuffer(self._map, dtype=np.uint8, count=self.capacity * RECORD.itemsize,
+                                  offset=HEADER_SIZE).reshape(self.capacity, RECORD.itemsize)
+        self.seq = self._last_seq()
+
+    @staticmethod
+    def _create(path, capacity, size):
+        with open(path, 'wb') as f:
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(f.fileno(), 0, size)
+            else:
+                f.truncate(size)
+            f.write(HEADER.pack(MAGIC, VERSION, RECORD.itemsize, capacity))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _last_seq(self):
+        valid = _valid(self._raw)
+        if not valid.any():
+            return 0
+        return int(self._records['seq'][valid].max())
+
+    def append(self, time, lat=None, lon=None, altitude=None, speed=None, course=None, sats=None,
+               temp_in=None, temp_out=None):
+        """ Writes the next record. Unknown values are stored as NaN (255 for sats). """
+        self.seq += 1
+        i = self.seq % self.capacity
+        rec = self._records[i:i + 1]
+        rec['seq'] = self.seq
+        rec['sats'] = NO_SATS if sats is None else min(sats, NO_SATS)
+        rec['time'] = time
+        rec['lat'] = _num(lat)
+        rec['lon'] = _num(lon)
+        rec['altitude'] = _num(altitude)
+        rec['speed'] = _num(speed)
+        rec['course'] = _num(course)
+        rec['temp_in'] = _num(temp_in)
+        rec['temp_out'] = _num(temp_out)
+        rec['crc'] = zlib.crc32(self._raw[i, :_CRC_SPAN].tobytes())
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self.sync()
+        return self.seq
+
+    def sync(self):
+        """ A sync point: everything appended so far is on the card once this returns. """
+        self._map.flush()
+        self._unsynced = 0
+
+    def close(self):
+        if self._map is not None:
+            if self._unsynced:
+                self.sync()
+            # the numpy views have to go before the map can be closed.
+            self._records = self._raw = None
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+def read(path):
+    """ Every intact record in the file, oldest first, as a numpy structured array (dtype RECORD). """
+    with open(path, 'rb') as f:
+        magic, version, record_size, capacity = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or record_size != RECORD.itemsize:
+            raise ValueError(f'{path} is not a flight recording')
+        f.seek(HEADER_SIZE)
+        raw = np.frombuffer(f.read(capacity * RECORD.itemsize), dtype=np.uint8).reshape(-1, RECORD.itemsize)
+    records = raw.copy().view(RECORD).ravel()
+    records = records[_valid(raw)]
+    return records[np.argsort(records['seq'], kind='stable')]
+
+def iterate(path, chunk=4096):
+    """ Same as `read`, handed out `chunk` records at a time. """
+    records = read(path)
+    for start in range(0, len(records), chunk):
+        yield records[start:start + chunk]
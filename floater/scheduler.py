@@ -0,0 +1,216 @@
+"""
+Periodic tasks on threads instead of one long serial loop.
+
+Every task says how often it runs (period), how late an instance may start before it is
+dropped (deadline), how important it is (priority) and which pieces of hardware it needs
+exclusively (resources, e.g. the uart mux, the radio or the camera). Tasks that don't share
+resources run at the same time. When they do, the higher priority task gets the resource next.
+Releases are anchored to the schedule, not to when the last run finished, so a task keeps its
+cadence even when something else is slow.
+
+Given an instrument.Instruments, every run is timed (waiting for resources included) and any run
+that finishes past its deadline is reported along with the stage that took the time.
+"""
+import time
+import heapq
+import itertools
+import threading
+import traceback
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Resource(object):
+    """ A lock that goes to the highest priority waiter (oldest first among equals). """
+    def __init__(self, name):
+        self.name = name
+        self._cond = threading.Condition()
+        self._owner = None
+        self._waiting = []
+        self._seq = itertools.count()
+
+    def acquire(self, priority=0, timeout=None):
+        entry = (-priority, next(self._seq))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            while self._owner is not None or self._waiting[0] != entry:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+                    return False
+                self._cond.wait(remaining)
+            heapq.heappop(self._waiting)
+            self._owner = entry
+            return True
+
+    def release(self):
+        with self._cond:
+            self._owner = None
+            self._cond.notify_all()
+
+    def locked(self):
+        return self._owner is not None
+
+
+class Task(object):
+    def __init__(self, name, func, period, deadline=None, priority=0, resources=(), offset=0.0):
+        """
+        `func` takes no arguments. The first release is `offset` seconds after the scheduler starts.
+        `deadline` (defaults to the period) is measured from each release.
+        """
+        self.name = name
+        self.func = func
+        self.period = period
+        self.deadline = period if deadline is None else deadline
+        self.priority = priority
+        self.resources = tuple(sorted(resources))
+        self.offset = offset
+        self.next_release = None
+        self.running = False
+        # when the run in progress is due to be done by.
+        self.running_deadline = None
+        self.runs = 0
+        self.misses = 0
+        self.failures = 0
+        self.last_start = None
+        self.last_duration = None
+
+    def __repr__(self):
+        return f"{self.name} every {self.period}s p{self.priority} {','.join(self.resources)}"
+
+
+class Scheduler(object):
+    def __init__(self, clock=time.monotonic, sleep=time.sleep, max_workers=None, instruments=None):
+        self.clock = clock
+        self.sleep = sleep
+        self.instruments = instruments
+        self.tasks = {}
+        self.resources = {}
+        self.max_workers = max_workers
+        self._executor = None
+        self._stopped = threading.Event()
+
+    def add(self, task):
+        self.tasks[task.name] = task
+        for name in task.resources:
+            self.resources.setdefault(name, Resource(name))
+        return task
+
+    def time_until(self, name, now=None):
+        """ Seconds until the next release of a task (0 if it is due or running). """
+        task = self.tasks[name]
+        if task.next_release is None:
+            return task.offset
+        return max(0.0, task.next_release - (self.clock() if now is None else now))
+
+    def trigger(self, name):
+        """ Release a task right away (e.g. on an event) instead of waiting for its period. """
+        self.tasks[name].next_release = self.clock()
+
+    def set_period(self, name, period, deadline=None):
+        """ Change a task's cadence. The next release moves up if the new period makes it due sooner. """
+        task = self.tasks[name]
+        if task.next_release is not None:
+            task.next_release = min(task.next_release, self.clock() + period)
+        task.period = period
+        task.deadline = period if deadline is None else deadline
+
+    def _executor_for(self):
+        if self._executor is None:
+            workers = self.max_workers or max(1, len(self.tasks))
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='task')
+        return self._executor
+
+    def _acquire(self, task, release):
+        held = []
+        for name in task.resources:
+            timeout = max(0.0, release + task.deadline - self.clock())
+            if not self.resources[name].acquire(task.priority, timeout):
+                break
+            held.append(self.resources[name])
+        else:
+            return held
+        for r in reversed(held):
+            r.release()
+        return None
+
+    def _run(self, task, release):
+        if self.instruments is None:
+            return self._run_task(task, release)
+        with self.instruments.iteration(task.name, release + task.deadline):
+            self._run_task(task, release)
+
+    def _run_task(self, task, release):
+        try:
+            if self.instruments is not None and task.resources:
+                with self.instruments.timed(f"wait.{','.join(task.resources)}"):
+                    held = self._acquire(task, release)
+            else:
+                held = self._acquire(task, release)
+            if held is None:
+                task.misses += 1
+                logging.warning(f"{task.name} missed its deadline waiting for {','.join(task.resources)}")
+                return
+            try:
+                task.last_start = self.clock()
+                task.func()
+                task.runs += 1
+            except:
+                task.failures += 1
+                traceback.print_exc()
+            finally:
+                task.last_duration = self.clock() - task.last_start
+                for r in reversed(held):
+                    r.release()
+        finally:
+            task.running = False
+
+    def run_pending(self, now=None):
+        """ Starts every task that is due. Returns how long until the next one is. """
+        now = self.clock() if now is None else now
+        due = []
+        for task in self.tasks.values():
+            if task.next_release is None:
+                task.next_release = now + task.offset
+            if task.next_release <= now:
+                due.append(task)
+        for task in sorted(due, key=lambda t: -t.priority):
+            release = task.next_release
+            # stay on the original grid, skipping any releases that are already gone.
+            missed = int((now - release) // task.period)
+            task.next_release = release + (missed + 1) * task.period
+            if task.running:
+                # a run that's still within its deadline covers this release. One past it doesn't.
+                if now > task.running_deadline:
+                    task.misses += 1
+                    logging.warning(f"{task.name} is still running. Skipping this one.")
+                continue
+            if now > release + task.deadline:
+                task.misses += 1
+                logging.warning(f"{task.name} released {now - release:.1f}s ago, past its deadline.")
+                continue
+            task.running = True
+            task.running_deadline = release + task.deadline
+            self._executor_for().submit(self._run, task, release)
+        return max(0.0, min(t.next_release for t in self.tasks.values()) - self.clock())
+
+    def run(self, max_nap=1.0):
+        """ Runs until `stop` is called. """
+        while not self._stopped.is_set():
+            self.sleep(min(max_nap, self.run_pending()))
+        self.shutdown()
+
+    def stop(self):
+        self._stopped.set()
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def summary(self):
+        return {name: {'runs': t.runs, 'misses': t.misses, 'failures': t.failures, 'last_duration': t.last_duration}
+                for name, t in self.tasks.items()}
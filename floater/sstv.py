@@ -1,30 +1,223 @@
-import subprocess
-import os
 import logging
+import threading
+from math import pi
+import numpy as np
+from PIL import Image
+from pysstv import color, grayscale
+from pysstv.sstv import FREQ_BLACK, FREQ_RANGE
+import afsk
+import overlay
 
-PYTHONHOME = os.environ.get('PYTHONHOME', '/home/pi/tracker_env/bin')
+DEFAULT_MODE = 'MartinM1'
+DEFAULT_RATE = 48000
 
-def annotate_img(img_src, img_dest, info):
+MODES = {m.__name__: m for m in color.MODES + grayscale.MODES}
+
+# pixels at the bottom of the frame that are given to the callsign/altitude/position label.
+LABEL_BAR_HEIGHT = 24
+
+# lines are buffered up to this many (freq, msec) tuples before being turned into samples,
+# for the modes that we can't vectorize a scanline at a time.
+_TUPLE_CHUNK = 4096
+
+def annotate_img(img_src, img_dest, info, mode=DEFAULT_MODE, bar_height=LABEL_BAR_HEIGHT):
     """
-    convert /Users/gdusbabek/Desktop/test_photos/capture_0139.jpg -fill '#0008' -draw 'rectangle 65,5,5,30' -fill white -annotate +10+20 KI5GRD /Users/gdusbabek/Desktop/test_photos/capture_0139_ano.jpg
-    convert /Users/gdusbabek/Desktop/test_photos/capture_0139.jpg -background 'transparent' -pointsize 48 -fill white label:'KI5GRD' -gravity Center -append /Users/gdusbabek/Desktop/test_photos/capture_0139_ano.jpg
+    Shrinks the photo to the SSTV frame and puts `info` in a black bar underneath, the same layout
+    `convert ... label:info -gravity Center -append` used to give us, minus the 1280x720 detour.
+    If `img_dest` is None the PIL image comes back as-is, so it can go straight to `encode`
+    without a trip through JPEG. Otherwise it gets saved and the path is returned.
     """
-    # params = ['convert', img_src, '-fill', shlex.quote('#0008'), '-draw', shlex.quote('rectangle 65,5,5,30'), '-fill', 'white', '-annotate', '+10+141', callsign, img_dest]
-    params = ['convert', img_src, '-pointsize', '48', '-background', 'Black', '-fill', 'white', f"label:{info}", '-gravity', 'Center', '-append', img_dest]
+    mode = MODES[mode] if isinstance(mode, str) else mode
     try:
-        res = subprocess.check_output(params, shell=False)
+        photo = Image.open(img_src) if isinstance(img_src, str) else img_src
+        frame = Image.new('RGB', (mode.WIDTH, mode.HEIGHT))
+        frame.paste(photo.convert('RGB').resize((mode.WIDTH, mode.HEIGHT - bar_height), Image.LANCZOS), (0, 0))
+        frame.paste(overlay.label_bar(info, mode.WIDTH, bar_height), (0, mode.HEIGHT - bar_height))
+        if img_dest is None:
+            return frame
+        frame.save(img_dest, quality=95)
         return img_dest
-    except subprocess.CalledProcessError as ex:
+    except OSError as ex:
+        logging.error(f'Could not annotate {img_src}: {ex}')
         return None
 
-def img_to_wav(img_path, wav_path):
+
+class _Oscillator(object):
+    """
+    Turns (freq, msec) segments into PCM with the same tones and timing as pysstv's
+    gen_values/gen_samples (a segment boundary can land a sample apart), a whole block of segments
+    at a time instead of one sample at a time. The phase is continuous, but it isn't carried
+    quite the way pysstv does it, so the samples themselves drift apart from pysstv's.
+    Phase and the fractional sample count carry over between blocks.
+    """
+    def __init__(self, rate):
+        self.rate = rate
+        self.spms = rate / 1000
+        self.carry = 0.0
+        self.phase = 0.0
+
+    def render(self, freqs, msecs):
+        if len(msecs) == 0:
+            return np.empty(0, dtype=np.int16)
+        exact = self.carry + np.cumsum(np.asarray(msecs, dtype=np.float64) * self.spms)
+        ends = exact.astype(np.int64)
+        self.carry = exact[-1] - ends[-1]
+        counts = np.diff(ends, prepend=0)
+        steps = np.repeat(np.asarray(freqs, dtype=np.float64) * (2 * pi / self.rate), counts)
+        phase = self.phase + np.cumsum(steps) - steps
+        self.phase = (self.phase + steps.sum()) % (2 * pi)
+        values = np.trunc(np.sin(phase) * 32768)
+        return np.clip(values, -32768, 32767).astype(np.int16)
+
+
+def _fit(image, mode):
+    if isinstance(image, str):
+        image = Image.open(image)
+    if image.size != (mode.WIDTH, mode.HEIGHT):
+        image = image.resize((mode.WIDTH, mode.HEIGHT), Image.LANCZOS)
+    return image
+
+def _split_header(sstv):
+    """ pysstv puts the image tuples between the VIS header and the FSK id. Find the seam. """
+    seam = object()
+    sstv.gen_image_tuples = lambda: [seam]
+    tuples = list(sstv.gen_freq_bits())
+    del sstv.gen_image_tuples
+    idx = tuples.index(seam)
+    return tuples[:idx], tuples[idx + 1:]
+
+def _as_arrays(tuples):
+    if not tuples:
+        return np.empty(0), np.empty(0)
+    freqs, msecs = zip(*tuples)
+    return np.array(freqs, dtype=np.float64), np.array(msecs, dtype=np.float64)
+
+def _pixel_freqs(values):
+    return FREQ_BLACK + FREQ_RANGE * values.astype(np.float64) / 255
+
+def _vectorized_lines(sstv):
+    """
+    Yields (freqs, msecs) for each scanline of the modes whose lines are just sync + per channel
+    pixel runs (Martin, Scottie, Pasokon and the grayscale Robots). Returns None for the rest.
+    """
+    mode = type(sstv)
+    if issubclass(mode, color.ColorSSTV):
+        if mode.encode_line is not color.ColorSSTV.encode_line or mode.gen_image_tuples is not grayscale.GrayscaleSSTV.gen_image_tuples:
+            return None
+        pixels = np.asarray(sstv.image.convert('RGB'))
+        channels = [(list(sstv.before_channel(c)), c.value, list(sstv.after_channel(c))) for c in mode.COLOR_SEQ]
+    elif issubclass(mode, grayscale.GrayscaleSSTV):
+        if mode.encode_line is not grayscale.GrayscaleSSTV.encode_line:
+            return None
+        pixels = np.asarray(sstv.image.convert('LA'))
+        channels = [([], 0, [])]
+    else:
+        return None
+
+    msec_pixel = sstv.SCAN / sstv.WIDTH
+    pixel_msecs = np.full(sstv.WIDTH, msec_pixel)
+
+    def lines():
+        sync_f, sync_m = _as_arrays(list(sstv.horizontal_sync()))
+        gaps = [(_as_arrays(before), idx, _as_arrays(after)) for before, idx, after in channels]
+        for line in range(sstv.HEIGHT):
+            freqs = [sync_f]
+            msecs = [sync_m]
+            for (bf, bm), idx, (af, am) in gaps:
+                freqs += [bf, _pixel_freqs(pixels[line, :sstv.WIDTH, idx]), af]
+                msecs += [bm, pixel_msecs, am]
+            yield np.concatenate(freqs), np.concatenate(msecs)
+    return lines()
+
+def _chunked_tuples(sstv):
+    chunk = []
+    for t in sstv.gen_image_tuples():
+        chunk.append(t)
+        if len(chunk) >= _TUPLE_CHUNK:
+            yield _as_arrays(chunk)
+            chunk = []
+    if chunk:
+        yield _as_arrays(chunk)
+
+def stream(image, mode=DEFAULT_MODE, rate=DEFAULT_RATE, vox=False, fskid=None):
+    """
+    Encodes an image (path or PIL image) and yields int16 sample chunks as it goes:
+    the VIS header, then one chunk per scanline, then the FSK id (if any).
+    The image gets resized to the mode's frame if it isn't already.
+    """
+    mode = MODES[mode] if isinstance(mode, str) else mode
+    sstv = mode(_fit(image, mode), rate, 16)
+    sstv.vox_enabled = vox
+    if fskid:
+        sstv.add_fskid_text(fskid)
+    head, tail = _split_header(sstv)
+    osc = _Oscillator(rate)
+    yield osc.render(*_as_arrays(head))
+    lines = _vectorized_lines(sstv)
+    for freqs, msecs in (lines if lines is not None else _chunked_tuples(sstv)):
+        yield osc.render(freqs, msecs)
+    if tail:
+        yield osc.render(*_as_arrays(tail))
+
+def encode(image, mode=DEFAULT_MODE, rate=DEFAULT_RATE, vox=False, fskid=None):
+    """ Same as `stream`, but returns the whole transmission as one int16 buffer. """
+    return np.concatenate(list(stream(image, mode=mode, rate=rate, vox=vox, fskid=fskid)))
+
+def img_to_wav(img_path, wav_path, mode=DEFAULT_MODE, rate=DEFAULT_RATE):
     """
     pi images default to 1280 × 720.
     This does Martin M1, 16 bits per sample at 48k.
+    `img_path` can also be an image that's already in memory (e.g. from annotate_img).
     """
     try:
-        subprocess.check_output([os.path.join(PYTHONHOME, 'python'), '-m', 'pysstv', '--resize', img_path, wav_path])
+        afsk.write_wav(encode(img_path, mode=mode, rate=rate), wav_path, rate=rate)
         return True
-    except subprocess.CalledProcessError as ex:
-        logging.error(ex.output)
+    except (OSError, ValueError) as ex:
+        logging.error(f'Could not encode {img_path}: {ex}')
         return False
+
+
+class Prepared(object):
+    """
+    Holds one ready-to-play transmission and what it was made from (the photo and its label).
+    `prepare` is meant to run on a low priority thread right after a photo or fix comes in;
+    whoever keys the radio later just picks the audio up.
+    """
+    def __init__(self, mode=DEFAULT_MODE, rate=DEFAULT_RATE):
+        self.mode = mode
+        self.rate = rate
+        self._lock = threading.Lock()
+        self.photo_path = None
+        self.info = None
+        self.audio = None
+
+    def is_current(self, photo_path, info):
+        return self.audio is not None and self.photo_path == photo_path and self.info == info
+
+    def prepare(self, photo_path, info, image=None):
+        """
+        Annotates and encodes `image` (defaults to the photo itself). Does nothing if that exact
+        photo and label are already done. Returns True if there's audio for them afterwards.
+        """
+        if self.is_current(photo_path, info):
+            return True
+        img = annotate_img(photo_path if image is None else image, None, info, mode=self.mode)
+        if img is None:
+            return False
+        audio = encode(img, mode=self.mode, rate=self.rate)
+        with self._lock:
+            self.photo_path, self.info, self.audio = photo_path, info, audio
+        logging.debug(f'SSTV ready for {photo_path}: {len(audio) / self.rate:.1f}s of audio')
+        return True
+
+    def get(self, photo_path):
+        """
+        The audio for `photo_path`, or None if a different (or no) photo was prepared. The label
+        may trail the latest fix by one update if a re-encode is still under way.
+        """
+        with self._lock:
+            return self.audio if self.photo_path == photo_path else None
+
+    def invalidate(self):
+        with self._lock:
+            self.photo_path, self.info, self.audio = None, None, None
@@ -0,0 +1,113 @@
+"""
+Keeps the SD card from filling up. A full card takes the logs, the flight recorder and the stats
+down with the photos.
+
+Each kind of media has a quota. The bytes used come from the media store, which keeps count as
+captures are added and removed, so checking is a dictionary lookup (plus one statvfs for the card
+as a whole). Capture tasks ask `allow` before writing. `enforce` runs now and then: a kind past
+HIGH_WATER of its quota is trimmed back to LOW_WATER. If the card itself is short of
+MIN_FREE_BYTES (logs grow too), videos make up the difference.
+
+What goes first:
+- photos are thinned, oldest first, to every 2nd, then every 4th, ... The newest KEEP_PHOTOS and
+  anything protected (the photo the next SSTV is made from) are left alone.
+- videos go oldest first, except the ones within BURST_KEEP_SECS of burst, which only go when
+  nothing else is left, furthest from burst first.
+"""
+import os
+import logging
+
+import media
+
+GB = 1024 ** 3
+MB = 1024 ** 2
+
+QUOTAS = {media.PHOTO: 4 * GB, media.VIDEO: 16 * GB}
+HIGH_WATER = 0.9
+LOW_WATER = 0.8
+# below this much free space on the card nothing more gets written, whatever the quotas say.
+MIN_FREE_BYTES = 500 * MB
+
+KEEP_PHOTOS = 20
+BURST_KEEP_SECS = 10 * 60
+
+
+class StorageBudget(object):
+    def __init__(self, store, quotas=None, high_water=HIGH_WATER, low_water=LOW_WATER,
+                 min_free=MIN_FREE_BYTES, keep_photos=KEEP_PHOTOS):
+        self.store = store
+        self.quotas = dict(QUOTAS, **(quotas or {}))
+        self.high_water = high_water
+        self.low_water = low_water
+        self.min_free = min_free
+        self.keep_photos = keep_photos
+        # wall clock time of burst, when there's been one.
+        self.burst_at = None
+
+    def free_bytes(self):
+        try:
+            st = os.statvfs(self.store.root)
+        except OSError:
+            return None
+        return st.f_bavail * st.f_frsize
+
+    def allow(self, kind):
+        """ True if there's room for another capture of `kind`. """
+        if self.store.bytes_used(kind) >= self.quotas[kind]:
+            return False
+        free = self.free_bytes()
+        return free is None or free >= self.min_free
+
+    def _photo_victims(self, excess, protect):
+        entries = self.store.entries(media.PHOTO)[:-self.keep_photos or None]
+        entries = [e for e in entries if e.path not in protect]
+        victims, freed, every = {}, 0, 2
+        while freed < excess and every <= len(entries) * 2:
+            for i, entry in enumerate(entries):
+                if freed >= excess:
+                    break
+                # thinning to every `every`th keeps the ones a coarser pass would keep too.
+                if i % every and entry.seq not in victims:
+                    victims[entry.seq] = entry
+                    freed += entry.size or 0
+            every *= 2
+        return list(victims.values())
+
+    def _video_victims(self, excess, protect):
+        entries = [e for e in self.store.entries(media.VIDEO) if e.path not in protect]
+        if self.burst_at is None:
+            ordered = entries
+        else:
+            near = lambda e: abs(e.time - self.burst_at) <= BURST_KEEP_SECS
+            ordered = ([e for e in entries if not near(e)] +
+                       sorted((e for e in entries if near(e)), key=lambda e: -abs(e.time - self.burst_at)))
+        victims, freed = [], 0
+        for entry in ordered:
+            if freed >= excess:
+                break
+            victims.append(entry)
+            freed += entry.size or 0
+        return victims
+
+    def enforce(self, protect=()):
+        """ Trims every kind that's past its high watermark. Returns how many captures went. """
+        protect = set(p for p in protect if p)
+        free = self.free_bytes()
+        short = self.min_free - free if free is not None and free < self.min_free else 0
+        removed = 0
+        for kind, quota in self.quotas.items():
+            used = self.store.bytes_used(kind)
+            excess = used - quota * self.low_water if used >= quota * self.high_water else 0
+            if kind == media.VIDEO:
+                excess = max(excess, short)
+            if excess <= 0:
+                continue
+            if kind == media.PHOTO:
+                victims = self._photo_victims(excess, protect)
+            else:
+                victims = self._video_victims(excess, protect)
+            self.store.remove(kind, victims)
+            removed += len(victims)
+            logging.warning(f"{kind} storage at {used / MB:.0f}MB of {quota / MB:.0f}MB. Removed {len(victims)}, "
+                            f"{self.store.bytes_used(kind) / MB:.0f}MB left")
+        return removed
@@ -0,0 +1,127 @@
+"""
+APRS telemetry (APRS 1.0.1 chapter 13).
+
+Sensor readings are fed in as they come and averaged until the next beacon, which sends them as
+one fixed size T# frame: five analog channels scaled to 0-255 and eight status bits. What the
+channels are called, their units and how to scale them back (PARM/UNIT/EQNS/BITS) doesn't change,
+so those go out only every so often.
+
+Building the packets changes nothing. Once they're on the air, `commit` starts the next window,
+bumps the sequence number and marks the metadata sent. A beacon that never made it out gets built
+again next time, with the samples it would have carried.
+"""
+import time
+from collections import namedtuple
+
+# value = a * x^2 + b * x + c, x being what goes on the air (0-255).
+Channel = namedtuple('Channel', ['name', 'unit', 'a', 'b', 'c'])
+
+# names are short on purpose, the spec limits them (7, 7, 6, 6 and 5 characters).
+ANALOG = (
+    Channel('TempIn', 'degF', 0, 1, -130),
+    Channel('TmpOut', 'degF', 0, 1, -130),
+    Channel('Sats', 'sats', 0, 1, 0),
+    Channel('Alt', 'm', 0, 200, 0),
+    Channel('FixAg', 's', 0, 1, 0),
+)
+
+# (6, 5, 4, 4, 4, 3, 3, 3 characters at most). SD: the card is full, photos or video are being refused.
+BITS = ('GPS', 'SSTV', 'Vid', 'TIn', 'TOut', 'SD', 'B7', 'B8')
+
+# metadata goes out with the first beacon and then this often.
+META_PERIOD = 10 * 60
+
+PROJECT = 'floater balloon'
+
+
+class Telemetry(object):
+    def __init__(self, call, channels=ANALOG, bits=BITS, project=PROJECT, meta_period=META_PERIOD, clock=time.monotonic):
+        self.call = call
+        self.channels = tuple(channels)
+        self.bit_names = tuple(bits)
+        self.project = project
+        self.meta_period = meta_period
+        self.clock = clock
+        self.seq = 0
+        self._index = {ch.name: i for i, ch in enumerate(self.channels)}
+        self._sums = [0.0] * len(self.channels)
+        self._counts = [0] * len(self.channels)
+        self._last = [0] * len(self.channels)
+        self._bits = [False] * len(self.bit_names)
+        self._meta_sent = None
+        # (values, sums, counts, metadata time) of the last packets built, until they're committed.
+        self._pending = None
+
+    def sample(self, name, value):
+        """ Adds a reading to the current window. Anything that isn't a number (no reading yet) is ignored. """
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return
+        i = self._index[name]
+        self._sums[i] += value
+        self._counts[i] += 1
+
+    def set_bit(self, name, on):
+        self._bits[self.bit_names.index(name)] = bool(on)
+
+    @staticmethod
+    def scale(channel, value):
+        """ Inverse of the channel's linear equation, clamped to a byte. """
+        x = int(round((value - channel.c) / channel.b))
+        return min(255, max(0, x))
+
+    def frame(self):
+        """
+        T# info field for everything sampled since the last commit. Channels with no samples repeat
+        their last value.
+        """
+        values = [self.scale(ch, self._sums[i] / self._counts[i]) if self._counts[i] else self._last[i]
+                  for i, ch in enumerate(self.channels)]
+        self._pending = (values, list(self._sums), list(self._counts), None)
+        analog = ','.join(f'{x:03d}' for x in values)
+        bits = ''.join('1' if b else '0' for b in self._bits)
+        return f'T#{self.seq:03d},{analog},{bits}'
+
+    def commit(self):
+        """ The last frame (and metadata) built went out. Samples taken since then stay for the next one. """
+        if self._pending is None:
+            return
+        values, sums, counts, meta_at = self._pending
+        self._pending = None
+        for i in range(len(self.channels)):
+            self._counts[i] -= counts[i]
+            self._sums[i] = self._sums[i] - sums[i] if self._counts[i] else 0.0
+        self._last = values
+        self.seq = (self.seq + 1) % 1000
+        if meta_at is not None:
+            self._meta_sent = meta_at
+
+    def _message(self, text):
+        # telemetry metadata are messages to ourselves. The addressee is padded to 9 characters.
+        return f':{self.call:<9}:{text}'
+
+    def metadata(self):
+        """ The PARM, UNIT, EQNS and BITS info fields. """
+        coefs = ','.join(f'{v:g}' for ch in self.channels for v in (ch.a, ch.b, ch.c))
+        return [
+            self._message('PARM.' + ','.join(ch.name for ch in self.channels) + ',' + ','.join(self.bit_names)),
+            self._message('UNIT.' + ','.join(ch.unit for ch in self.channels) + ',' + ','.join(['on'] * len(self.bit_names))),
+            self._message(f'EQNS.{coefs}'),
+            self._message(f'BITS.{"1" * len(self.bit_names)},{self.project[:23]}'),
+        ]
+
+    def metadata_due(self, now=None):
+        now = self.clock() if now is None else now
+        return self._meta_sent is None or now - self._meta_sent >= self.meta_period
+
+    def packets(self, dst, via_digis, now=None):
+        """
+        Direwolf style strings for the next beacon: the T# frame, plus the metadata when it is due.
+        They're meant to go out back to back with the position in one transmission. `commit` once they have.
+        """
+        now = self.clock() if now is None else now
+        head = f"{self.call}>{dst},{','.join(via_digis)}:"
+        infos = [self.frame()]
+        if self.metadata_due(now):
+            infos += self.metadata()
+            self._pending = self._pending[:3] + (now,)
+        return [head + info for info in infos]
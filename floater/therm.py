@@ -1,13 +1,76 @@
 import os
 import time
+import threading
 import logging
-
-# can't do any harm, right?
-os.system('modprobe w1-therm')
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 BASE_DIR         = '/sys/bus/w1/devices/'
 EXT_THERM_DEVICE = '28-8a20160fa0ff'
 INT_THERM_DEVICE = '28-8a201605ecff'
+DEVICES          = {'internal': INT_THERM_DEVICE, 'external': EXT_THERM_DEVICE}
+
+_driver_checked = False
+
+# newer kernels can start a conversion on every sensor on the bus at once.
+BULK_READ        = 'w1_bus_master1/therm_bulk_read'
+
+# what a DS18B20 reports before it has done a conversion (85C). Never a real reading up there.
+POWER_ON_RESET   = 0x0550
+
+Reading = namedtuple('Reading', ['temp_c', 'time'])
+
+
+def _crc8(data):
+    """ Dallas/Maxim 1-Wire CRC. """
+    crc = 0
+    for b in data:
+        for _ in range(8):
+            mix = (crc ^ b) & 1
+            crc >>= 1
+            if mix:
+                crc ^= 0x8C
+            b >>= 1
+    return crc
+
+def _parse_w1_slave(raw_lines):
+    """
+    Returns degrees C, or None if the kernel or our own CRC check doesn't like the scratchpad.
+    """
+    if len(raw_lines) < 2 or not raw_lines[0].strip().endswith('YES'):
+        return None
+    try:
+        scratchpad = bytes(int(x, 16) for x in raw_lines[0].split(':')[0].split())
+    except ValueError:
+        return None
+    if len(scratchpad) != 9 or _crc8(scratchpad[:8]) != scratchpad[8]:
+        return None
+    if scratchpad[0] | (scratchpad[1] << 8) == POWER_ON_RESET:
+        return None
+    eq_pos = raw_lines[1].find('t=')
+    if eq_pos < 0:
+        return None
+    return float(raw_lines[1][eq_pos + 2:]) / 1000.0
+
+def _convert(temp_c, fc):
+    if temp_c is None:
+        return None
+    return round(temp_c * 9.0 / 5.0 + 32.0, 1) if fc.lower() == 'f' else round(temp_c, 1)
+
+
+def load_driver(base_dir=None):
+    """
+    Makes sure w1-therm is loaded. The w1-gpio overlay usually has it loaded by the time we start,
+    so modprobe only runs if no sensor shows up. Once per process.
+    """
+    global _driver_checked
+    if _driver_checked:
+        return
+    _driver_checked = True
+    base_dir = base_dir or BASE_DIR
+    if not any(os.path.exists(os.path.join(base_dir, device, 'w1_slave')) for device in DEVICES.values()):
+        logging.info('No 1-Wire sensors yet. Loading w1-therm')
+        os.system('modprobe w1-therm')
 
 
 def _get_raw_lines(device_path):
@@ -24,24 +87,149 @@ def _get_temp(device, fc, timeout):
     So two lines. If the CRC checks ot, the temperature is thousanths of degrees celsius.
     This means that "27500" is 27.5C
     """
+    load_driver()
     start = time.time()
-    device_file = os.path.join('/sys/bus/w1/devices/', device, 'w1_slave')
+    device_file = os.path.join(BASE_DIR, device, 'w1_slave')
     while (time.time() - start < timeout):
         raw_lines = _get_raw_lines(device_file)
-        if raw_lines[0].strip().endswith('YES'):
-            eq_pos = raw_lines[1].find('t=')
-            temp_str = raw_lines[1][eq_pos + 2:]
-            temp_c = float(temp_str) / 1000.0
-            temp_f = temp_c * 9.0 / 5.0 + 32.0
-            return round(temp_f, 1) if fc.lower() == 'f' else round(temp_c, 1)
+        temp_c = _parse_w1_slave(raw_lines)
+        if temp_c is not None:
+            return _convert(temp_c, fc)
         else:
-            logging.debug(f"raw line 0: {raw_lines[0]}")
+            logging.debug(f"raw line 0: {raw_lines[0] if raw_lines else ''}")
             time.sleep(0.2)
-    logging.warn("Could not get temperature")
+    logging.warning("Could not get temperature")
     return None
 
-def get_internal_temp(fc='f', timeout=5):
+
+class Stats(object):
+    __slots__ = ('count', 'total', 'low', 'high', 'since')
+
+    def __init__(self, since):
+        self.count = 0
+        self.total = 0.0
+        self.low = None
+        self.high = None
+        self.since = since
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.low = value if self.low is None else min(self.low, value)
+        self.high = value if self.high is None else max(self.high, value)
+
+    def as_dict(self):
+        return {'count': self.count, 'min': self.low, 'max': self.high,
+                'mean': self.total / self.count if self.count else None, 'since': self.since}
+
+
+class ThermSampler(threading.Thread):
+    """
+    Samples every sensor in the background and keeps the latest good reading (plus min/max/mean
+    over the current window), so nobody waits on the 1-Wire bus. Conversions on all sensors are
+    started together with the kernel's bulk read when it has one, otherwise the sensors are read
+    in parallel so their ~750ms conversions overlap.
+    """
+    def __init__(self, devices=None, interval=10, base_dir=None):
+        super().__init__(name='therm', daemon=True)
+        self.devices = dict(devices or DEVICES)
+        self.interval = interval
+        self.base_dir = base_dir or BASE_DIR
+        self.latest = {name: None for name in self.devices}
+        self._windows = {name: Stats(time.time()) for name in self.devices}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._pool = None
+
+    def _slave_path(self, device):
+        return os.path.join(self.base_dir, device, 'w1_slave')
+
+    def _bulk_path(self):
+        path = os.path.join(self.base_dir, BULK_READ)
+        return path if os.path.exists(path) else None
+
+    def _read(self, device):
+        try:
+            return _parse_w1_slave(_get_raw_lines(self._slave_path(device)))
+        except OSError:
+            return None
+
+    def _bulk_convert(self, bulk_path, timeout=2.0):
+        with open(bulk_path, 'w') as f:
+            f.write('trigger\n')
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with open(bulk_path) as f:
+                # -1 means some sensor is still converting.
+                if f.read().strip() != '-1':
+                    return True
+            time.sleep(0.05)
+        return False
+
+    def sample(self):
+        """ One pass over every sensor. Returns {name: temp_c or None}. """
+        bulk_path = self._bulk_path()
+        names = list(self.devices)
+        try:
+            if bulk_path and self._bulk_convert(bulk_path):
+                temps = [self._read(self.devices[n]) for n in names]
+            else:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=len(names), thread_name_prefix='w1')
+                temps = list(self._pool.map(self._read, [self.devices[n] for n in names]))
+        except OSError:
+            logging.warning("Could not sample temperatures")
+            temps = [None] * len(names)
+        now = time.time()
+        with self._lock:
+            for name, temp_c in zip(names, temps):
+                if temp_c is not None:
+                    self.latest[name] = Reading(temp_c, now)
+                    self._windows[name].add(temp_c)
+        return dict(zip(names, temps))
+
+    def window(self, name, reset=False):
+        """ min/max/mean/count of the readings since the last reset. """
+        with self._lock:
+            stats = self._windows[name].as_dict()
+            if reset:
+                self._windows[name] = Stats(time.time())
+        return stats
+
+    def run(self):
+        while not self._stopped.is_set():
+            self.sample()
+            self._stopped.wait(self.interval)
+        if self._pool:
+            self._pool.shutdown()
+
+    def stop(self):
+        self._stopped.set()
+
+
+_sampler = None
+
+def start(interval=10):
+    global _sampler
+    if _sampler is None or not _sampler.is_alive():
+        load_driver()
+        _sampler = ThermSampler(interval=interval)
+        _sampler.start()
+    return _sampler
+
+def _cached(name, fc, max_age):
+    reading = _sampler.latest.get(name) if _sampler else None
+    if reading is None or time.time() - reading.time > max_age:
+        return None
+    return _convert(reading.temp_c, fc)
+
+def get_internal_temp(fc='f', timeout=5, max_age=60):
+    """ The sampler's latest reading if it is running and has one, otherwise a (blocking) read. """
+    if _sampler:
+        return _cached('internal', fc, max_age)
     return _get_temp(INT_THERM_DEVICE, fc, timeout)
 
-def get_external_temp(fc='f', timeout=5):
+def get_external_temp(fc='f', timeout=5, max_age=60):
+    if _sampler:
+        return _cached('external', fc, max_age)
     return _get_temp(EXT_THERM_DEVICE, fc, timeout)
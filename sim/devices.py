@@ -0,0 +1,290 @@
+"""
+Stand-ins for the hardware around the Pi: the UART and its mux, the GPS, the DRA818, the
+1-Wire thermometers and the audio path to the radio. All of them run on whatever clock is
+installed (see simclock), so they keep up when time is compressed.
+"""
+import os
+import tty
+import gzip
+import math
+import time
+import logging
+import threading
+from collections import namedtuple
+import numpy as np
+
+import afsk
+import nmea
+import therm
+
+EPOCH_SECS = 5
+
+
+class UartMux(object):
+    """
+    A pty in place of /dev/ttyAMA0. Bytes go to and from whichever device the mux select pins
+    (as last written through fake_gpio) point at, and nowhere when the mux is disabled.
+    """
+    def __init__(self, gpio, fake_gpio):
+        self.gpio = gpio
+        self.pins = fake_gpio
+        self.master, self.slave = os.openpty()
+        # raw from the start. Nothing gets echoed back before the tracker opens the port.
+        tty.setraw(self.slave)
+        self.device = os.ttyname(self.slave)
+        self.devices = {}
+        self.dropped = 0
+        self._write_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._reader = threading.Thread(target=self._read_loop, name='uart-mux', daemon=True)
+        self._reader.start()
+
+    def attach(self, name, device):
+        self.devices[name] = device
+
+    def selected(self):
+        g, pins = self.gpio, self.pins
+        if pins.input(g.TX_MUX_E) != g.LOW or pins.input(g.RX_MUX_E) != g.LOW:
+            return None
+        s = (pins.input(g.TX_MUX_S0), pins.input(g.TX_MUX_S1), pins.input(g.TX_MUX_S2))
+        if s == tuple(g.GPS_PINS):
+            return 'gps'
+        if s == tuple(g.VHF_PINS):
+            return 'vhf'
+        return None
+
+    def send(self, source, data):
+        """ Device -> Pi. Lost if the mux isn't pointed at `source`, same as on the board. """
+        if self.selected() != source:
+            self.dropped += len(data)
+            return False
+        with self._write_lock:
+            os.write(self.master, data)
+        return True
+
+    def _read_loop(self):
+        while not self._closed.is_set():
+            try:
+                data = os.read(self.master, 1024)
+            except OSError:
+                return
+            device = self.devices.get(self.selected())
+            if device is not None:
+                device.receive(data)
+
+    def close(self):
+        self._closed.set()
+        for fd in (self.slave, self.master):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+def load_epochs(path):
+    """ NMEA log -> list of epochs (lists of raw lines). A new epoch starts at each RMC. """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        lines = f.readlines()
+    epochs, current = [], []
+    for bline in lines:
+        if bline[3:6] == b'RMC' and any(l[3:6] == b'RMC' for l in current):
+            epochs.append(current)
+            current = []
+        current.append(bline)
+    if current:
+        epochs.append(current)
+    return epochs
+
+
+class NmeaReplay(threading.Thread):
+    """
+    Plays a recorded log into the mux, one epoch every EPOCH_SECS (simulated) seconds.
+    Keeps track of where the log says we are, for the other fakes.
+    """
+    def __init__(self, mux, epochs, epoch_secs=EPOCH_SECS, on_epoch=None):
+        super().__init__(name='gps-replay', daemon=True)
+        self.mux = mux
+        self.epochs = epochs
+        self.epoch_secs = epoch_secs
+        self.on_epoch = on_epoch
+        self.altitude = 0.0
+        self.epoch = 0
+        self.finished = threading.Event()
+        self._stopped = threading.Event()
+        self._sentence = nmea.Sentence()
+
+    def run(self):
+        next_at = time.monotonic()
+        for self.epoch, lines in enumerate(self.epochs):
+            if self._stopped.is_set():
+                break
+            for bline in lines:
+                try:
+                    if nmea.parse(bline, self._sentence) == nmea.GGA and self._sentence.altitude is not None:
+                        self.altitude = self._sentence.altitude
+                except nmea.ParseError:
+                    pass
+                self.mux.send('gps', bline)
+            if self.on_epoch:
+                self.on_epoch(self)
+            next_at += self.epoch_secs
+            time.sleep(max(0.0, next_at - time.monotonic()))
+        self.finished.set()
+
+    def stop(self):
+        self._stopped.set()
+
+    @property
+    def duration(self):
+        return len(self.epochs) * self.epoch_secs
+
+
+class Dra818Emulator(object):
+    """
+    Answers the DRA818's AT commands the way the module does. Says nothing while powered down
+    (PD low), like the real thing.
+    """
+    def __init__(self, mux, gpio, fake_gpio, pd_pin=19):
+        self.mux = mux
+        self.gpio = gpio
+        self.pins = fake_gpio
+        self.pd_pin = pd_pin
+        self.frequency = None
+        self.squelch = None
+        self.commands = []
+        self._buffer = b''
+
+    def powered(self):
+        return self.pins.input(self.pd_pin) != self.gpio.LOW
+
+    def receive(self, data):
+        self._buffer += data
+        while b'\r\n' in self._buffer:
+            line, self._buffer = self._buffer.split(b'\r\n', 1)
+            line = line.decode('ascii', errors='replace').strip()
+            if not line or not self.powered():
+                continue
+            self.commands.append(line)
+            response = self.handle(line)
+            if response is not None:
+                self.mux.send('vhf', (response + '\r\n').encode())
+
+    def handle(self, line):
+        if line == 'AT+DMOCONNECT':
+            return '+DMOCONNECT:0'
+        if line.startswith('AT+DMOSETGROUP='):
+            return '+DMOSETGROUP:' + ('0' if self._set_group(line[len('AT+DMOSETGROUP='):]) else '1')
+        if line.startswith('AT+DMOSETVOLUME='):
+            return '+DMOSETVOLUME:0'
+        if line.startswith('AT+SETFILTER='):
+            return '+DMOSETFILTER:0'
+        if line.startswith('AT+SETTAIL='):
+            return '+DMOSETTAIL:0'
+        if line.startswith('S+'):
+            return 'S=0'
+        return None
+
+    def _set_group(self, args):
+        try:
+            bw, tx, rx, tx_ctcss, squelch, rx_ctcss = args.split(',')
+            tx, rx, squelch = float(tx), float(rx), int(squelch)
+        except ValueError:
+            return False
+        if bw not in ('0', '1') or not 134.0 <= tx <= 174.0 or not 134.0 <= rx <= 174.0 or not 0 <= squelch <= 8:
+            return False
+        self.frequency, self.squelch = tx, squelch
+        return True
+
+
+def standard_temp_c(altitude):
+    """ 1976 standard atmosphere, up to 32 km. """
+    if altitude < 11000:
+        return 15.0 - 0.0065 * altitude
+    if altitude < 20000:
+        return -56.5
+    return -56.5 + 0.001 * (min(altitude, 32000) - 20000)
+
+
+class FakeW1(object):
+    """ The sysfs tree the w1-therm driver would give us, with a DS18B20 per therm.DEVICES entry. """
+    def __init__(self, base_dir, devices=None):
+        self.base_dir = base_dir
+        self.devices = dict(devices or therm.DEVICES)
+        for device in self.devices.values():
+            os.makedirs(os.path.join(base_dir, device), exist_ok=True)
+        self.update(20.0, 15.0)
+
+    @staticmethod
+    def w1_slave(temp_c):
+        raw = int(round(temp_c * 16)) & 0xffff
+        pad = bytes([raw & 0xff, raw >> 8, 0x4b, 0x46, 0x7f, 0xff, 0x0c, 0x10])
+        pad += bytes([therm._crc8(pad)])
+        hexed = ' '.join(f'{b:02x}' for b in pad)
+        millis = int(round((raw - 0x10000 if raw & 0x8000 else raw) * 62.5))
+        return f'{hexed} : crc={pad[8]:02x} YES\n{hexed} t={millis}\n'
+
+    def set(self, name, temp_c):
+        path = os.path.join(self.base_dir, self.devices[name], 'w1_slave')
+        # swapped in whole, so a reader never sees half a file.
+        with open(path + '.tmp', 'w') as f:
+            f.write(self.w1_slave(temp_c))
+        os.replace(path + '.tmp', path)
+
+    def update(self, internal_c, external_c):
+        self.set('internal', internal_c)
+        self.set('external', external_c)
+
+    def follow(self, altitude):
+        """ Outside air from the standard atmosphere. The payload box stays a good deal warmer. """
+        outside = standard_temp_c(altitude)
+        self.update(20.0 + 0.3 * (outside - 15.0), outside)
+
+
+Transmission = namedtuple('Transmission', ['start', 'secs', 'frequency', 'packets'])
+
+
+class SimPlayer(object):
+    """
+    Takes the place of playback.Player: keys PTT, "plays" for as long as the audio lasts and
+    writes down what went out. Short transmissions are demodulated, so what ends up in the log
+    is what a receiver would have heard. With wait=False (benchmarks) nothing waits for the airtime.
+    """
+    DECODE_MAX_SECS = 10
+
+    def __init__(self, radio, decode=True, wait=True):
+        self.radio = radio
+        self.decode = decode
+        self.wait = wait
+        self.transmissions = []
+
+    def play(self, audio, rate=48000, ptt=None, tx_delay=0.3):
+        if isinstance(audio, np.ndarray):
+            samples = audio
+        else:
+            # a generator (the SSTV stream). Encoding it costs what it costs on the real thing.
+            samples = np.concatenate(list(audio))
+        secs = tx_delay + len(samples) / rate
+        start = time.time()
+        if ptt:
+            ptt(True)
+        try:
+            if self.wait:
+                time.sleep(secs)
+        finally:
+            if ptt:
+                ptt(False)
+        packets = None
+        if self.decode and secs <= self.DECODE_MAX_SECS:
+            packets = [afsk.decode_frame(f) for f in afsk.demodulate(samples, rate)]
+        self.transmissions.append(Transmission(start, secs, self.radio.frequency, packets))
+        if packets:
+            for packet in packets:
+                logging.info(f'heard: {packet}')
+        return secs
+
+    def close(self):
+        pass
+
+    def airtime(self):
+        return math.fsum(t.secs for t in self.transmissions)
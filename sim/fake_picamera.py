@@ -0,0 +1,98 @@
+"""
+Just enough of picamera for cam.py: PiCamera stills (to a file or into an RGB buffer, resized)
+and h264 recordings, to a file or a PiCameraCircularIO. Stills are a sky gradient that gets darker
+with `altitude()`; recordings are sparse files the size a real one would be, so disk accounting
+sees realistic numbers.
+"""
+import io
+import time
+import threading
+import numpy as np
+from PIL import Image
+
+# bits per second of a 1280x720 h264 recording at the default quality.
+BITRATE = 17000000
+
+# set by the simulator.
+altitude = lambda: 0.0
+
+
+def _frame(size, shot):
+    w, h = size
+    frac = min(1.0, max(0.0, altitude() / 30000.0))
+    top = np.array([90, 150, 235]) * (1 - frac) + np.array([5, 10, 40]) * frac
+    bottom = np.array([120, 110, 90])
+    rows = np.linspace(0, 1, h)[:, None]
+    gradient = (top * (1 - rows) + bottom * rows).astype(np.uint8)
+    img = np.repeat(gradient[:, None, :], w, axis=1)
+    # something that changes from shot to shot.
+    img[:, (shot * 7) % w] = 255
+    return Image.fromarray(img)
+
+
+class PiCameraCircularIO(object):
+    """ Holds no frames, just keeps track of how much footage it would have. """
+    def __init__(self, camera, size=None, seconds=None, bitrate=BITRATE, splitter_port=1):
+        self.camera = camera
+        self.bitrate = bitrate
+        self.seconds = seconds if seconds is not None else size * 8 / bitrate
+        self.started = None
+
+    def copy_to(self, output, size=None, seconds=None, first_frame=None):
+        held = min(self.seconds, time.monotonic() - self.started)
+        if seconds is not None:
+            held = min(held, seconds)
+        with open(output, 'wb') as f:
+            f.truncate(int(held * self.bitrate / 8))
+
+    def clear(self):
+        self.started = time.monotonic()
+
+
+class PiCamera(object):
+    def __init__(self, resolution=(1280, 720), framerate=30):
+        self.resolution = resolution
+        self.framerate = framerate
+        self.shots = 0
+        self._lock = threading.Lock()
+        self._recordings = {}
+        self.encoder_error = None
+
+    def capture(self, output, format='jpeg', use_video_port=False, splitter_port=0, resize=None):
+        with self._lock:
+            self.shots += 1
+            shot = self.shots
+        img = _frame(resize or self.resolution, shot)
+        if format == 'rgb':
+            output[:] = img.tobytes()
+        elif isinstance(output, str):
+            img.save(output, format='JPEG', quality=85)
+        else:
+            buf = io.BytesIO()
+            img.save(buf, format='JPEG', quality=85)
+            output.write(buf.getvalue())
+
+    def start_recording(self, output, format='h264', splitter_port=1, bitrate=BITRATE):
+        if splitter_port in self._recordings:
+            raise RuntimeError(f'Already recording on port {splitter_port}')
+        if isinstance(output, PiCameraCircularIO):
+            output.clear()
+        self._recordings[splitter_port] = (output, time.monotonic(), bitrate)
+
+    def wait_recording(self, timeout=0, splitter_port=1):
+        if splitter_port not in self._recordings:
+            raise RuntimeError(f'Not recording on port {splitter_port}')
+        # picamera raises the encoder's error from here once it has died.
+        if self.encoder_error is not None:
+            raise self.encoder_error
+        if timeout:
+            time.sleep(timeout)
+
+    def stop_recording(self, splitter_port=1):
+        output, started, bitrate = self._recordings.pop(splitter_port)
+        if isinstance(output, str):
+            with open(output, 'wb') as f:
+                f.truncate(int((time.monotonic() - started) * bitrate / 8))
+
+    def close(self):
+        self._recordings.clear()
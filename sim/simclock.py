@@ -0,0 +1,63 @@
+"""
+A clock that runs `speed` times faster than the wall clock.
+
+`install` swaps it in for time.time, time.monotonic and time.sleep, and makes Condition.wait
+timeouts count in simulated seconds too. That takes in Event.wait and threading.Timer, which wait
+on a Condition underneath (the scheduler's resources, the thermometer sampler, the camera's video
+timer). It has to happen before the floater modules are imported, since some of them (the
+scheduler, telemetry) bind the clock functions as default arguments.
+
+Anything that loops on its own deadline from the real clock (queue.Queue.get, Condition.wait_for)
+still waits in real seconds.
+"""
+import time
+import threading
+
+_real_time = time.time
+_real_monotonic = time.monotonic
+_real_sleep = time.sleep
+_real_cond_wait = threading.Condition.wait
+
+
+class SimClock(object):
+    def __init__(self, speed=60.0, start=None):
+        self.speed = float(speed)
+        self._real_start = _real_monotonic()
+        self._epoch_start = _real_time() if start is None else start
+
+    def elapsed(self):
+        """ Simulated seconds since the clock was made. """
+        return (_real_monotonic() - self._real_start) * self.speed
+
+    def time(self):
+        return self._epoch_start + self.elapsed()
+
+    def monotonic(self):
+        return self.elapsed()
+
+    def sleep(self, secs):
+        if secs > 0:
+            _real_sleep(secs / self.speed)
+
+    def real(self, secs):
+        """ Wall clock seconds that `secs` simulated seconds take. """
+        return secs / self.speed
+
+
+def install(clock):
+    """ Makes `clock` the process' clock. """
+    time.time = clock.time
+    time.monotonic = clock.monotonic
+    time.sleep = clock.sleep
+
+    def wait(self, timeout=None):
+        return _real_cond_wait(self, None if timeout is None else clock.real(timeout))
+
+    threading.Condition.wait = wait
+    return clock
+
+def uninstall():
+    time.time = _real_time
+    time.monotonic = _real_monotonic
+    time.sleep = _real_sleep
+    threading.Condition.wait = _real_cond_wait
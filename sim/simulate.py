@@ -0,0 +1,167 @@
+"""
+Flies flight_controller through a recorded flight with none of the hardware.
+
+The GPS is a pty replaying an NMEA log, the DRA818 is an emulator on the other side of the same
+pty (behind a simulated mux), the thermometers are a fake sysfs tree that follows the altitude,
+the camera is sim/fake_picamera and the audio goes nowhere (but APRS gets demodulated). Time runs
+`--speed` times faster than the wall clock, so the 2.7 hour log in tests/data takes under
+three minutes at the default 60x.
+
+Durations in the report are in simulated seconds. CPU bound work is inflated by the speed factor
+too, so picking a speed close to how much faster this machine is than the Pi gives a fair idea of
+how the loop would hold up on the Pi.
+
+    python sim/simulate.py [--log tests/data/flight.nmea.gz] [--speed 60] [--minutes 30] [--report out.json]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+import tempfile
+import threading
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'floater'))
+sys.path.insert(0, HERE)
+
+import simclock
+import fake_picamera
+
+DEFAULT_LOG = os.path.join(HERE, '..', 'tests', 'data', 'flight.nmea.gz')
+
+
+class Simulation(object):
+    def __init__(self, log=DEFAULT_LOG, speed=60.0, call='N0CALL-11', work_dir=None, minutes=None, decode=True):
+        self.clock = simclock.install(simclock.SimClock(speed))
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix='floater-sim-')
+        # picamera is imported when the camera is first opened, media paths when cam is imported.
+        sys.modules['picamera'] = fake_picamera
+        os.environ['MEDIA_HOME'] = os.path.join(self.work_dir, 'media')
+
+        import gpio
+        import fake_gpio
+        import therm
+        import dra818
+        import devices
+        import flight_controller
+        flight_controller.load()
+        # pyserial times out in real seconds. gps.pause() waits in simulated ones, and has to outlast a read.
+        flight_controller.gps.READ_TIMEOUT = self.clock.real(flight_controller.gps.READ_TIMEOUT)
+        self.fc = flight_controller
+        self.dra818 = dra818
+
+        therm.BASE_DIR = os.path.join(self.work_dir, 'w1')
+        self.w1 = devices.FakeW1(therm.BASE_DIR)
+        self.mux = devices.UartMux(gpio, fake_gpio)
+        self.radio = devices.Dra818Emulator(self.mux, gpio, fake_gpio, pd_pin=dra818.PD)
+        self.mux.attach('vhf', self.radio)
+        epochs = devices.load_epochs(log)
+        if minutes:
+            epochs = epochs[:int(minutes * 60 / devices.EPOCH_SECS)]
+        self.replay = devices.NmeaReplay(self.mux, epochs, on_epoch=lambda r: self.w1.follow(r.altitude))
+        fake_picamera.altitude = lambda: self.replay.altitude
+        self.player = devices.SimPlayer(self.radio, decode=decode)
+        dra818._player = self.player
+        # the driver's response timeout is in (simulated) seconds. Give the emulator's thread a fair chance.
+        dra818.DEFAULT_UART_PORT = self.mux.device
+        dra818._radio = dra818.Dra818(self.mux.device, timeout=max(dra818.RESPONSE_TIMEOUT, 0.1 * speed))
+
+        self.args = argparse.Namespace(call=call, uart_device=self.mux.device,
+                                       recorder_path=os.path.join(self.work_dir, 'flight.rec'),
+                                       stats_path=os.path.join(self.work_dir, 'stats.json'))
+        self.state = self.schedule = None
+
+    def run(self):
+        real_start, cpu_start = time.perf_counter(), time.process_time()
+        self.state, self.schedule = self.fc.setup(self.args)
+        runner = threading.Thread(target=self.schedule.run, name='schedule', daemon=True)
+        self.replay.start()
+        runner.start()
+        self.replay.finished.wait()
+        self.schedule.stop()
+        runner.join()
+        self.fc.gps._reader.stop()
+        self.mux.close()
+        return self.report(time.perf_counter() - real_start, time.process_time() - cpu_start)
+
+    def report(self, real_secs, cpu_secs):
+        import cam
+        import media
+        import recorder
+        import instrument
+        stats = instrument.default().summary()
+        tx = self.player.transmissions
+        aprs_tx = [t for t in tx if t.packets is not None]
+        records = recorder.read(self.args.recorder_path)
+        tasks = self.schedule.summary()
+        return {
+            'sim_secs': self.replay.duration,
+            'real_secs': real_secs,
+            'cpu_secs': cpu_secs,
+            'speed': self.clock.speed,
+            'achieved_speed': self.replay.duration / real_secs if real_secs else None,
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'tasks': tasks,
+            'overruns': sum(t['misses'] for t in tasks.values()),
+            'failures': sum(t['failures'] for t in tasks.values()),
+            'late_runs': stats['overrun_count'],
+            'late_causes': [f"{o['task']}: {o['cause']}" for o in stats['overruns'][-5:]],
+            'stages': {name: {k: h.get(k) for k in ('count', 'p50', 'p90', 'max')} for name, h in stats['stages'].items()},
+            'transmissions': len(tx),
+            'airtime_secs': self.player.airtime(),
+            'aprs_transmissions': len(aprs_tx),
+            'aprs_packets_heard': sum(len(t.packets) for t in aprs_tx),
+            'aprs_undecoded': sum(1 for t in aprs_tx if not t.packets),
+            'sstv_transmissions': len(tx) - len(aprs_tx),
+            'radio_commands': len(self.radio.commands),
+            'uart_bytes_dropped': self.mux.dropped,
+            'first_beacon_secs': self.fc._first_beacon,
+            'phases': [(round(t - self.fc._phase.started), p) for t, p in self.fc._phase.changes],
+            'photos': cam.store().count(media.PHOTO),
+            'videos': cam.store().count(media.VIDEO),
+            'media_mb': {kind: cam.store().bytes_used(kind) / 2 ** 20 for kind in (media.PHOTO, media.VIDEO)},
+            'media_removed': stats['counters'].get('storage.removed', 0),
+            'records': len(records),
+            'temp_in_valid': float(np.mean(~np.isnan(records['temp_in']))) if len(records) else None,
+            'max_altitude': float(np.nanmax(records['altitude'])) if len(records) else None,
+        }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--log', default=DEFAULT_LOG, help='NMEA log to fly')
+    parser.add_argument('--speed', type=float, default=60.0, help='Simulated seconds per wall clock second')
+    parser.add_argument('--minutes', type=float, help='Only fly the first this many minutes of the log')
+    parser.add_argument('--call', default='N0CALL-11')
+    parser.add_argument('--work-dir', help='Where media, the flight recording and the fake sysfs go (default: a temp dir)')
+    parser.add_argument('--no-decode', action='store_true', help="Don't demodulate APRS transmissions")
+    parser.add_argument('--report', help='Write the report here as JSON')
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--photo-quota', type=int, help='MB of photos the flight controller may keep')
+    parser.add_argument('--video-quota', type=int, help='MB of video the flight controller may keep')
+    args = parser.parse_args(argv[1:])
+
+    sim = Simulation(args.log, args.speed, args.call, args.work_dir, args.minutes, not args.no_decode)
+    sim.args.photo_quota, sim.args.video_quota = args.photo_quota, args.video_quota
+    # flight_controller turns on debug logging when it is imported.
+    logging.getLogger().setLevel(args.log_level)
+    report = sim.run()
+    for key, value in report.items():
+        if key not in ('tasks', 'stages'):
+            print(f'{key:20s} {value}')
+    for name, t in report['tasks'].items():
+        print(f"  {name:10s} runs {t['runs']:5d}  misses {t['misses']:3d}  failures {t['failures']:3d}  "
+              f"last {t['last_duration'] or 0:.2f}s")
+    for name, h in report['stages'].items():
+        print(f"  {name:24s} n {h['count']:5d}  p50 {h['p50'] or 0:7.3f}s  p90 {h['p90'] or 0:7.3f}s  max {h['max'] or 0:7.3f}s")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0 if report['failures'] == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
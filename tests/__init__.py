@@ -1,3 +1,5 @@
 # I suck at python. Is there no another way around this?
 import sys, os
-sys.path.insert(0, os.path.abspath('..'))
\ No newline at end of file
+sys.path.insert(0, os.path.abspath('..'))
+# the modules in floater/ import each other by bare name (that's how they run on the pi).
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'floater'))
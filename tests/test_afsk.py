@@ -0,0 +1,50 @@
+import os
+import pytest
+import floater.afsk as afsk
+
+APRS_STRING = 'N0CALL>APN25,WIDE1-1,WIDE2-1:@142159h4903.50N/07201.75WO065/156/A=075344 sat=None in= out= sstv=0'
+
+
+def test_crc16():
+    # the standard CRC-16/X.25 check value.
+    assert afsk._crc16(b'123456789') == 0x906E
+
+def test_encode_address():
+    assert afsk._encode_address('N0CALL', last=False) == bytes([0x9C, 0x60, 0x86, 0x82, 0x98, 0x98, 0x60])
+    assert afsk._encode_address('WIDE2-1', last=True)[-1] == 0x63
+    assert afsk._encode_address('APN25', last=False, command=True)[-1] == 0xE0
+    with pytest.raises(afsk.FrameError):
+        afsk._encode_address('TOOLONGCALL', last=True)
+
+def test_frame_round_trip():
+    assert afsk.decode_frame(afsk.encode_frame(APRS_STRING)) == APRS_STRING
+    assert afsk.decode_frame(afsk.encode_frame('N0CALL>APN25,WIDE1-1*:>hi')) == 'N0CALL>APN25,WIDE1-1*:>hi'
+
+def test_bad_fcs():
+    frame = bytearray(afsk.encode_frame(APRS_STRING))
+    frame[20] ^= 0x01
+    with pytest.raises(afsk.FrameError):
+        afsk.decode_frame(bytes(frame))
+
+def test_stuffing():
+    bits = [1, 1, 1, 1, 1, 1, 1, 0]
+    stuffed = afsk._stuff(bits)
+    assert stuffed == [1, 1, 1, 1, 1, 0, 1, 1, 0]
+    assert afsk._unstuff(stuffed) == bits
+
+def test_nrzi():
+    assert list(afsk.nrzi([1, 0, 0, 1, 0])) == [1, 0, 1, 1, 0]
+
+@pytest.mark.parametrize('rate', [44100, 48000, 22050])
+def test_modulate_decodes(rate):
+    samples = afsk.make_samples([APRS_STRING, 'N0CALL>APN25:>second'], rate=rate)
+    assert samples.dtype == 'int16'
+    assert abs(int(samples.max())) <= 32767 * afsk.DEFAULT_AMPLITUDE // 100 + 1
+    assert [afsk.decode_frame(f) for f in afsk.demodulate(samples, rate=rate)] == [APRS_STRING, 'N0CALL>APN25:>second']
+
+def test_write_wav(tmp_path):
+    wav_path = os.path.join(tmp_path, 'aprs.wav')
+    afsk.write_wav(afsk.make_samples(APRS_STRING), wav_path)
+    samples, rate = afsk.read_wav(wav_path)
+    assert rate == afsk.DEFAULT_RATE
+    assert [afsk.decode_frame(f) for f in afsk.demodulate(samples, rate)] == [APRS_STRING]
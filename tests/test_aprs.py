@@ -1,8 +1,10 @@
 import os
+import threading
 from datetime import datetime
 import itertools
 import pytest
 import floater.aprs as aprs
+import floater.afsk as afsk
 
 # 2934.94157N,09817.02034W
 
@@ -10,10 +12,10 @@ import floater.aprs as aprs
 def simple_balloon():
     b = aprs.State()
     b.call = 'N0CALL'
-    b.lat = '4903.50123N'
-    b.lon = '07201.7521W'
+    b.lat = 49 + 3.50123 / 60
+    b.lon = -(72 + 1.7521 / 60)
     b.ground_speed_knots = 156
-    b.raw_altitude = str(int(round(75344 / 3.28084))) + 'M'
+    b.altitude = 75344 / 3.28084
     b.course = 65
     return b
 
@@ -29,19 +31,51 @@ def test_get_times():
     assert aprs.getDHM(dt) == '131421z'
 
 def test_encode_latitude():
-    assert aprs.encode_latitude('4903.50N') == '4903.50N'
-    assert aprs.encode_latitude('4903.50n') == '4903.50N'
-    assert aprs.encode_latitude('49.50N') == '4900.50N'
-    assert aprs.encode_latitude('4903.5012N') == '4903.50N'
+    assert aprs.encode_latitude(49 + 3.5 / 60) == '4903.50N'
+    assert aprs.encode_latitude(-(49 + 3.5 / 60)) == '4903.50S'
+    assert aprs.encode_latitude(49.0 + 0.5 / 60) == '4900.50N'
+    # rounded, not truncated.
+    assert aprs.encode_latitude(49 + 3.5061 / 60) == '4903.51N'
+    assert aprs.encode_latitude(49 + 59.999 / 60) == '5000.00N'
+    assert aprs.encode_latitude(0.0) == '0000.00N'
 
 def test_encode_longitude():
-    assert aprs.encode_longitude('07201.75W') == '07201.75W'
-    assert aprs.encode_longitude('07201.75w') == '07201.75W'
-    assert aprs.encode_longitude('07201.7521W') == '07201.75W'
-    assert aprs.encode_longitude('072.75W') == '07200.75W'
+    assert aprs.encode_longitude(-(72 + 1.75 / 60)) == '07201.75W'
+    assert aprs.encode_longitude(72 + 1.7521 / 60) == '07201.75E'
+    assert aprs.encode_longitude(-(72 + 0.75 / 60)) == '07200.75W'
+    assert aprs.encode_longitude(-179.99999) == '18000.00W'
 
 def test_encode_position():
-    assert aprs.encode_position('4903.50123N', '07201.75241W') == '4903.50N/07201.75WO'
+    assert aprs.encode_position(49 + 3.50123 / 60, -(72 + 1.75241 / 60)) == '4903.50N/07201.75WO'
+
+def test_alt_to_feet():
+    assert aprs.alt_to_feet(None) == 0
+    assert aprs.alt_to_feet(22965.6) == 75346
+    assert aprs.alt_to_feet(-3.0) == -10
+
+def test_state():
+    state = aprs.State()
+    assert not state.is_valid()
+    assert state.fix_age() == float('inf')
+    state.lat, state.lon, state.fix_time = 29.5, -98.3, 100.0
+    assert state.is_valid()
+    assert state.fix_age(now=104.5) == 4.5
+    copy = state.snapshot()
+    state.lat = 30.0
+    assert copy.lat == 29.5 and copy.lon == -98.3
+    assert copy.lock is not state.lock
+    # a fix half way through being written is waited for.
+    taken = []
+    with state.lock:
+        worker = threading.Thread(target=lambda: taken.append(state.snapshot()))
+        worker.start()
+        worker.join(0.1)
+        assert not taken
+        state.lon = -98.0
+    worker.join()
+    assert (taken[0].lat, taken[0].lon) == (30.0, -98.0)
+    with pytest.raises(AttributeError):
+        state.raw_altitude = '100M'
 
 def test_encode_altitude():
     assert aprs.encode_altitude(123) == '/A=000123'
@@ -52,6 +86,7 @@ def test_encode_course_and_speed():
     assert aprs.encode_course_and_speed(34, 21) == '034/021'
     assert aprs.encode_course_and_speed(0, 21) == '360/021'
     assert aprs.encode_course_and_speed(1, 121) == '001/121'
+    assert aprs.encode_course_and_speed(359.6, 20.7) == '360/021'
 
 def test_make_info_string(simple_balloon, simple_zulu):
     assert aprs.make_info_string(simple_balloon, simple_zulu) == '@142159h4903.50N/07201.75WO065/156/A=075344'
@@ -64,8 +99,46 @@ def test_make_direwolf_string(simple_balloon, simple_zulu):
 
 def test_make_wav(simple_balloon, simple_zulu):
     if not os.environ.get('DIREWOLF_HOME'):
-        return
+        pytest.skip('DIREWOLF_HOME is not set')
     wav_path = '/tmp/test_file_5.wav'
     aprs_string = aprs.make_direwolf_string(simple_balloon, 'APN25', ['WIDE1-1', 'WIDE2-1'], simple_zulu)
-    aprs.make_wav(aprs_string, wav_path)
-    assert os.path.exists(wav_path)
\ No newline at end of file
+    aprs.make_wav(aprs_string, wav_path, backend='direwolf')
+    assert os.path.exists(wav_path)
+    # whatever gen_packets puts on the air should decode to exactly what the native modulator sends.
+    samples, rate = afsk.read_wav(wav_path)
+    assert [afsk.decode_frame(f) for f in afsk.demodulate(samples, rate)] == [aprs_string]
+
+def test_make_wav_native(simple_balloon, simple_zulu, tmp_path):
+    wav_path = os.path.join(tmp_path, 'aprs.wav')
+    aprs_string = aprs.make_direwolf_string(simple_balloon, 'APN25', ['WIDE1-1', 'WIDE2-1'], simple_zulu)
+    aprs.make_wav(aprs_string, wav_path, backend='native')
+    samples, rate = afsk.read_wav(wav_path)
+    assert [afsk.decode_frame(f) for f in afsk.demodulate(samples, rate)] == [aprs_string]
+
+def test_compress_position():
+    # the examples from chapter 9 of the spec.
+    assert aprs.compress_latitude(49.5) == '5L!!'
+    assert aprs.compress_longitude(-72.75) == '<*e7'
+    assert aprs.compress_course_and_speed(88, 36.2) == '7P['
+    # the speed byte tops out at 'z', however fast.
+    assert aprs.compress_course_and_speed(0, 10000)[1] == 'z'
+    assert aprs.compress_altitude(10004) == 'S]S'
+    assert aprs.encode_compressed_position(49.5, -72.75, '7P[') == '/5L!!<*e7O7P['
+
+def test_make_info_string_compressed(simple_balloon, simple_zulu):
+    plain = aprs.make_info_string(simple_balloon, simple_zulu)
+    course = aprs.make_info_string(simple_balloon, simple_zulu, aprs.COMPRESS_COURSE)
+    altitude = aprs.make_info_string(simple_balloon, simple_zulu, aprs.COMPRESS_ALTITUDE)
+    assert course.startswith('@142159h/') and course.endswith('/A=075344')
+    assert len(course) == 8 + 13 + 9
+    assert len(altitude) == 8 + 13
+    assert len(plain) - len(course) >= 10
+    with pytest.raises(ValueError):
+        aprs.make_info_string(simple_balloon, simple_zulu, 'mic-e')
+
+def test_make_wav_compressed(simple_balloon, simple_zulu, tmp_path):
+    wav_path = os.path.join(tmp_path, 'aprs.wav')
+    aprs_string = aprs.make_direwolf_string(simple_balloon, 'APN25', ['WIDE1-1'], simple_zulu, aprs.COMPRESS_ALTITUDE)
+    aprs.make_wav(aprs_string, wav_path, backend='native')
+    samples, rate = afsk.read_wav(wav_path)
+    assert [afsk.decode_frame(f) for f in afsk.demodulate(samples, rate)] == [aprs_string]
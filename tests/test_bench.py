@@ -0,0 +1,22 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bench'))
+import suite
+
+
+def _check(r):
+    assert r['iterations'] >= 1
+    assert r['cpu_secs'] >= 0 and r['peak_rss_kb'] > 0
+    assert r['items'] > 0
+
+def test_cases_run():
+    for name in ('aprs_string', 'aprs_samples'):
+        _check(suite.run_case(name, scale=0.01, warmup=0))
+    # the loop sets up the flight controller's globals. Keep them out of this process.
+    _check(suite.run_isolated('loop', scale=0.01))
+
+def test_compare():
+    old = {'cases': {'loop': {'cpu_secs': 1.0, 'peak_rss_kb': 1000}, 'gone': {'cpu_secs': 1.0, 'peak_rss_kb': 1}}}
+    new = {'cases': {'loop': {'cpu_secs': 1.2, 'peak_rss_kb': 1500}, 'added': {'cpu_secs': 1.0, 'peak_rss_kb': 1}}}
+    assert suite.compare(old, new) == {'loop': (1.2, 500, True)}
+    assert not suite.compare(old, new, threshold=0.5)['loop'][2]
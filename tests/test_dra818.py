@@ -0,0 +1,64 @@
+import pytest
+import floater.dra818 as dra818
+
+
+class FakeUart(object):
+    """ Answers like a DRA818 would. """
+    def __init__(self, answers=None):
+        self.written = []
+        self.pending = []
+        self.answers = answers or {'AT+DMOCONNECT': '+DMOCONNECT:0', 'AT+DMOSETGROUP': '+DMOSETGROUP:0'}
+
+    def reset_input_buffer(self):
+        self.pending = []
+
+    def write(self, data):
+        cmd = data.decode().strip()
+        self.written.append(cmd)
+        answer = self.answers.get(cmd.split('=')[0])
+        if answer:
+            self.pending += ['$GPGGA,noise', answer]
+
+    def readline(self):
+        return (self.pending.pop(0) + '\r\n').encode() if self.pending else b''
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def radio(monkeypatch):
+    monkeypatch.setattr(dra818.time, 'sleep', lambda secs: None)
+    r = dra818.Dra818(timeout=0.05)
+    r._uart = FakeUart()
+    return r
+
+
+def test_program(radio):
+    assert radio.program(frequency=144.390)
+    assert radio._uart.written == ['AT+DMOCONNECT', 'AT+DMOSETGROUP=1,144.3900,144.3900,0000,0,0000']
+
+def test_program_is_cached(radio):
+    assert radio.program(frequency=144.390)
+    assert radio.program(frequency=144.390)
+    assert len(radio._uart.written) == 2
+    assert radio.program(frequency=146.500)
+    assert len(radio._uart.written) == 4
+
+def test_power_down_invalidates(radio, monkeypatch):
+    monkeypatch.setattr(dra818.gpio, 'set_pin', lambda pin, hilo: None)
+    assert radio.program(frequency=144.390)
+    radio.power_down()
+    radio.power_up()
+    assert radio.program(frequency=144.390)
+    assert len(radio._uart.written) == 4
+
+def test_program_failure(radio):
+    radio._uart.answers['AT+DMOSETGROUP'] = '+DMOSETGROUP:1'
+    assert not radio.program(frequency=144.390, tries=2)
+    assert radio.config is None
+    assert radio._uart.written.count('AT+DMOCONNECT') == 2
+
+def test_no_answer_times_out(radio):
+    radio._uart.answers = {}
+    assert not radio.program(frequency=144.390, tries=1)
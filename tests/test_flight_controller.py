@@ -0,0 +1,63 @@
+import os
+import sys
+import subprocess
+
+FLOATER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'floater')
+
+
+def test_import_is_cheap():
+    # no camera, no numpy and no modprobe until a mode needs them.
+    code = ("import sys, flight_controller; "
+            "loaded = [m for m in ('picamera', 'numpy', 'PIL', 'cam', 'therm', 'serial') if m in sys.modules]; "
+            "assert not loaded, loaded")
+    subprocess.run([sys.executable, '-c', code], cwd=FLOATER_DIR, check=True, timeout=30)
+
+
+class _Prepared(object):
+    def __init__(self):
+        self.photo_path = None
+        self.labels = []
+
+    def prepare(self, photo_path, info, image=None):
+        self.photo_path = photo_path
+        self.labels.append(info)
+
+
+class _Schedule(object):
+    def __init__(self):
+        self.until = 100
+
+    def time_until(self, name):
+        return self.until
+
+
+def test_sstv_prep_skips_small_moves(monkeypatch):
+    import aprs
+    import flight_controller as fc
+    prepared = _Prepared()
+    monkeypatch.setattr(fc, 'aprs', aprs)
+    monkeypatch.setattr(fc, '_sstv', prepared)
+    monkeypatch.setattr(fc, '_sstv_basis', None)
+    monkeypatch.setattr(fc, '_sstv_refreshed', False)
+    state = aprs.State()
+    state.call, state.lat, state.lon, state.altitude = 'N0CALL', 29.5, -98.2, 1000.0
+    state.last_photo_path = 'capture_0001.jpg'
+    schedule = _Schedule()
+    fc.prepare_sstv(state, schedule)
+    # every fix moves the label a little. Not enough for another encode.
+    for alt in (1020.0, 1050.0, 1090.0):
+        state.altitude = alt
+        fc.prepare_sstv(state, schedule)
+    assert len(prepared.labels) == 1
+    state.altitude = 1100.0
+    fc.prepare_sstv(state, schedule)
+    # a new photo always is.
+    state.last_photo_path = 'capture_0002.jpg'
+    fc.prepare_sstv(state, schedule)
+    assert len(prepared.labels) == 3
+    # one last refresh just before the slot, and only one.
+    schedule.until = fc.SSTV_REFRESH_SECS
+    state.altitude = 1120.0
+    fc.prepare_sstv(state, schedule)
+    fc.prepare_sstv(state, schedule)
+    assert len(prepared.labels) == 4 and '1120M' in prepared.labels[-1]
@@ -0,0 +1,53 @@
+import pytest
+import floater.gpio as gpio
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    gpio.init_pins()
+    made = []
+    real = gpio.GPIO.output
+
+    def output(pins, values):
+        made.append((list(pins), list(values)))
+        real(pins, values)
+
+    monkeypatch.setattr(gpio.GPIO, 'output', output)
+    yield made
+    gpio.init_pins()
+
+def test_switch_is_batched(calls):
+    E = (gpio.TX_MUX_E, gpio.RX_MUX_E)
+    assert gpio.enable_gps()
+    assert gpio.channel() == gpio.GPS
+    # E is already high after init: move the selects, enable.
+    assert calls == [([gpio.TX_MUX_S0, gpio.RX_MUX_S0], [gpio.HIGH, gpio.HIGH]), (list(E), [gpio.LOW, gpio.LOW])]
+    # already there.
+    del calls[:]
+    assert not gpio.enable_gps()
+    assert calls == []
+    # disable, move the selects, enable. One call each.
+    assert gpio.enable_vhf()
+    assert [set(pins) for pins, _ in calls] == [set(E), {gpio.TX_MUX_S0, gpio.TX_MUX_S1, gpio.RX_MUX_S0, gpio.RX_MUX_S1}, set(E)]
+    assert calls[0][1] == [gpio.HIGH, gpio.HIGH] and calls[-1][1] == [gpio.LOW, gpio.LOW]
+    pins = gpio.GPIO._state
+    assert (pins[gpio.TX_MUX_S0], pins[gpio.TX_MUX_S1], pins[gpio.TX_MUX_S2]) == gpio.VHF_PINS
+    assert (pins[gpio.RX_MUX_S0], pins[gpio.RX_MUX_S1], pins[gpio.RX_MUX_S2]) == gpio.VHF_PINS
+    assert pins[gpio.TX_MUX_E] == pins[gpio.RX_MUX_E] == gpio.LOW
+
+def test_off(calls):
+    gpio.enable_vhf()
+    del calls[:]
+    gpio.clear_uart()
+    assert gpio.channel() == gpio.OFF
+    assert gpio.GPIO._state[gpio.TX_MUX_E] == gpio.HIGH
+    # E goes up once, and stays up while the selects go back to Y0.
+    assert len(calls) == 2
+    with pytest.raises(ValueError):
+        gpio.select('uhf')
+
+def test_set_pin_skips_repeats(calls):
+    gpio.set_pin(gpio.VHF_PTT, gpio.LOW)
+    gpio.set_pin(gpio.VHF_PTT, gpio.LOW)
+    gpio.set_pin(gpio.VHF_PTT, gpio.HIGH)
+    assert calls == [([gpio.VHF_PTT], [gpio.LOW]), ([gpio.VHF_PTT], [gpio.HIGH])]
@@ -0,0 +1,63 @@
+import os
+import time
+import pynmea2
+import pytest
+import floater.gps as gps
+
+RMC = '$GPRMC,123519,A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W*6A'
+GGA = '$GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,*47'
+VTG = '$GPVTG,054.7,T,034.4,M,005.5,N,010.2,K*48'
+NO_FIX_GGA = '$GPGGA,,,,,,0,00,99.99,,,,,,*48'
+
+
+def test_merge():
+    fix = gps.EMPTY_FIX
+    fix = gps.merge(fix, pynmea2.parse(RMC), 1.0)
+    assert fix.lat == pytest.approx(48.1173)
+    assert fix.lon == pytest.approx(11.516666, abs=1e-5)
+    assert fix.speed_knots == 22.4
+    assert fix.status == 'A'
+    fix = gps.merge(fix, pynmea2.parse(GGA), 2.0)
+    assert fix.altitude == 545.4
+    assert fix.sats == 8
+    assert fix.quality == 1
+    fix = gps.merge(fix, pynmea2.parse(VTG), 3.0)
+    assert fix.speed_kph == 10.2
+    assert fix.course == 54.7
+    assert fix.received == 3.0
+    assert fix.has_position()
+
+def test_merge_keeps_last_known():
+    fix = gps.merge(gps.EMPTY_FIX, pynmea2.parse(GGA), 1.0)
+    fix = gps.merge(fix, pynmea2.parse(NO_FIX_GGA), 2.0)
+    # position survives, quality says there's no fix right now.
+    assert fix.lat == pytest.approx(48.1173)
+    assert fix.altitude == 545.4
+    assert fix.quality == 0
+    assert not fix.has_position()
+
+def test_fix_age():
+    fix = gps.EMPTY_FIX._replace(received=100.0)
+    assert fix.age(now=105.0) == 5.0
+    assert not fix.is_stale(now=105.0)
+    assert fix.is_stale(now=100.0 + gps.STALE_SECS + 1)
+    assert gps.EMPTY_FIX.is_stale()
+
+def test_reader_on_pty():
+    master, slave = os.openpty()
+    reader = gps.GpsReader(os.ttyname(slave))
+    reader.start()
+    try:
+        time.sleep(0.2)
+        os.write(master, f'{RMC}\r\n{GGA}\r\n$GPGSV,garbage\r\n'.encode())
+        deadline = time.time() + 3
+        while reader.fix.altitude is None and time.time() < deadline:
+            time.sleep(0.05)
+        assert reader.fix.altitude == 545.4
+        assert reader.fix.age() < 3
+        assert reader.pause()
+    finally:
+        reader.stop()
+        reader.join(2)
+        os.close(master)
+        os.close(slave)
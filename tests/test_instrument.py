@@ -0,0 +1,96 @@
+import json
+import time
+import pytest
+import floater.instrument as instrument
+import floater.scheduler as scheduler
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, secs):
+        self.now += secs
+
+
+def test_histogram():
+    h = instrument.Histogram()
+    assert h.percentile(50) is None
+    for secs in [0.01] * 90 + [2.0] * 9 + [30.0]:
+        h.add(secs)
+    assert h.count == 100
+    assert h.min == 0.01 and h.max == 30.0
+    assert 0.01 <= h.percentile(50) < 0.015
+    assert 2.0 <= h.percentile(99) < 2.9
+    assert h.percentile(100) == 30.0
+    assert h.as_dict()['mean'] == pytest.approx((0.9 + 18 + 30) / 100)
+
+def test_overrun_names_the_culprit(caplog):
+    clock = FakeClock()
+    inst = instrument.Instruments(clock=clock)
+    with inst.iteration('aprs', deadline_at=5.0):
+        with inst.timed('send_aprs'):
+            with inst.timed('uart.dra818'):
+                clock.advance(0.1)
+            with inst.timed('dra818.transmit'):
+                clock.advance(7.0)
+        with inst.timed('update_gps'):
+            clock.advance(0.5)
+    assert inst.overrun_count == 1
+    overrun = inst.overruns[0]
+    assert overrun['late'] == pytest.approx(2.6)
+    assert overrun['cause'] == 'send_aprs 7.10s > dra818.transmit 7.00s'
+    assert 'dra818.transmit' in caplog.text
+    # on time: nothing to report.
+    with inst.iteration('gps', deadline_at=clock() + 5):
+        clock.advance(1)
+    assert inst.overrun_count == 1
+    assert inst.stages['task.aprs'].max == pytest.approx(7.6)
+
+def test_flush(tmp_path):
+    inst = instrument.Instruments()
+    with inst.timed('update_temps'):
+        pass
+    inst.count('dra818.timeouts')
+    inst.count('dra818.timeouts')
+    path = str(tmp_path / 'stats.json')
+    inst.flush(path)
+    with open(path) as f:
+        summary = json.load(f)
+    assert summary['stages']['update_temps']['count'] == 1
+    assert summary['window']['update_temps']['count'] == 1
+    assert summary['counters'] == {'dra818.timeouts': 2}
+    # a new window, the totals carry on.
+    with inst.timed('update_temps'):
+        pass
+    summary = inst.flush(path)
+    assert summary['stages']['update_temps']['count'] == 2
+    assert summary['window']['update_temps']['count'] == 1
+
+def test_decorator():
+    inst = instrument.Instruments()
+
+    @inst.timed('work')
+    def work(n):
+        return n * 2
+
+    assert work(2) == 4 and work(3) == 6
+    assert inst.stages['work'].count == 2
+
+def test_scheduler_reports_late_runs():
+    inst = instrument.Instruments()
+    schedule = scheduler.Scheduler(instruments=inst)
+
+    @inst.timed('encode')
+    def slow():
+        time.sleep(0.05)
+
+    task = schedule.add(scheduler.Task('slow', slow, period=10, deadline=0.02))
+    schedule.run_pending()
+    schedule.shutdown()
+    assert task.runs == 1
+    assert inst.stages['task.slow'].count == 1
+    assert inst.overruns[0]['cause'].startswith('encode')
@@ -0,0 +1,79 @@
+import os
+import gzip
+import math
+import pytest
+import floater.landing as landing
+import floater.phase as phase
+import floater.nmea as nmea
+import floater.aprs as aprs
+
+FLIGHT_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'flight.nmea.gz')
+
+
+def _meters(lat1, lon1, lat2, lon2):
+    north = math.radians(lat2 - lat1) * landing.EARTH_RADIUS
+    east = math.radians(lon2 - lon1) * landing.EARTH_RADIUS * math.cos(math.radians(lat1))
+    return math.hypot(north, east)
+
+def _epochs():
+    """ (lat, lon, altitude, speed_knots, course) every 5 seconds of the recorded flight. """
+    sentence = nmea.Sentence()
+    fix = {}
+    with gzip.open(FLIGHT_LOG, 'rb') as f:
+        for bline in f:
+            try:
+                kind = nmea.parse(bline, sentence)
+            except nmea.ParseError:
+                continue
+            if kind == nmea.RMC:
+                if 'altitude' in fix:
+                    yield fix['lat'], fix['lon'], fix['altitude'], fix['speed'], fix['course']
+                fix.update(lat=sentence.lat, lon=sentence.lon, speed=sentence.speed_knots, course=sentence.course)
+            elif kind == nmea.GGA:
+                fix['altitude'] = sentence.altitude
+
+def test_recorded_flight():
+    detector = phase.PhaseDetector()
+    predictor = landing.LandingPredictor()
+    predictions = []
+    for i, (lat, lon, altitude, speed, course) in enumerate(_epochs()):
+        detector.add(i * 5.0, altitude)
+        if detector.phase == phase.GROUND:
+            predictor.ground = altitude
+        elif detector.phase in (phase.ASCENT, phase.DESCENT):
+            predictor.add_wind(altitude, speed, course)
+        if detector.phase == phase.DESCENT:
+            predictor.observe_descent(altitude, detector.rate.rate)
+        if detector.phase in (phase.BURST, phase.DESCENT):
+            predictions.append(predictor.predict(lat, lon, altitude))
+    landed = (lat, lon)
+    # right after burst, 30 km up and 25 km from where it comes down.
+    first = predictions[0]
+    assert _meters(first.lat, first.lon, *landed) < 1000
+    assert 2000 < first.secs < 3000
+    assert predictor.descent_rate == pytest.approx(5.0, abs=0.3)
+
+def test_fall_time():
+    predictor = landing.LandingPredictor(descent_rate=5.0)
+    # calm everywhere: straight down, and in the time the drag model says.
+    p = predictor.predict(45.0, -75.0, 20000)
+    assert (p.lat, p.lon) == (45.0, -75.0)
+    h2 = 2 * landing.SCALE_HEIGHT
+    assert p.secs == pytest.approx(h2 / 5.0 * (1 - math.exp(-20000 / h2)), rel=0.01)
+    # on a layer boundary, and below the ground.
+    assert predictor.predict(45.0, -75.0, 500).secs == pytest.approx(100, rel=0.02)
+    assert predictor.predict(45.0, -75.0, -10).secs == 0
+
+def test_wind_drift():
+    predictor = landing.LandingPredictor(descent_rate=5.0)
+    # 10 m/s from the west, only seen up high. The layers under it borrow it.
+    for _ in range(3):
+        predictor.add_wind(10250, 10 / landing.KNOTS, 90.0)
+    p = predictor.predict(0.0, 0.0, 10400)
+    assert p.lat == pytest.approx(0.0, abs=1e-9)
+    assert _meters(0.0, 0.0, p.lat, p.lon) == pytest.approx(10 * p.secs, rel=1e-6)
+
+def test_comment():
+    comment = aprs.landing_comment(29.67376, -97.39564, 2431)
+    assert comment == 'LZ=2940.43N,09723.74W T-41'
+    assert len(comment) <= 27
@@ -0,0 +1,114 @@
+import os
+from collections import namedtuple
+import floater.media as media
+
+Fix = namedtuple('Fix', ['lat', 'lon', 'altitude'])
+
+
+def _touch(path):
+    with open(path, 'wb') as f:
+        f.write(b'x' * 10)
+
+
+def test_sequence_and_manifest(tmp_path):
+    store = media.MediaStore(str(tmp_path))
+    p0 = store.next_path(media.PHOTO)
+    p1 = store.next_path(media.PHOTO)
+    v0 = store.next_path(media.VIDEO)
+    assert p0.endswith(os.path.join('photos', 'capture_0000.jpg'))
+    assert p1.endswith('capture_0001.jpg')
+    assert v0.endswith(os.path.join('videos', 'capture_0000.h264'))
+    for p in (p0, p1):
+        _touch(p)
+    store.add(media.PHOTO, p0, Fix(29.5, -98.2, 1200.0), when=100.0)
+    e = store.add(media.PHOTO, p1, when=200.0)
+    assert e.size == 10 and e.seq == 1 and e.lat is None
+    assert store.latest(media.PHOTO) == e
+    assert store.latest(media.VIDEO) is None
+
+    # a fresh store picks up where the last one left off, without looking at the photos.
+    again = media.MediaStore(str(tmp_path))
+    assert again.count(media.PHOTO) == 2
+    assert again.entries(media.PHOTO)[0].alt == 1200.0
+    assert again.next_path(media.PHOTO).endswith('capture_0002.jpg')
+    assert again.next_path(media.VIDEO).endswith('capture_0000.h264')
+
+def test_between(tmp_path):
+    store = media.MediaStore(str(tmp_path))
+    for t in (10.0, 20.0, 30.0, 40.0):
+        path = store.next_path(media.PHOTO)
+        store.add(media.PHOTO, path, size=1, when=t)
+    # out of order timestamps still end up sorted.
+    store.add(media.PHOTO, store.next_path(media.PHOTO), size=1, when=25.0)
+    assert [e.time for e in store.between(media.PHOTO, 20.0, 30.0)] == [20.0, 25.0, 30.0]
+    assert store.between(media.PHOTO, 50.0, 60.0) == []
+
+def test_recovery(tmp_path):
+    store = media.MediaStore(str(tmp_path))
+    path = store.next_path(media.PHOTO)
+    _touch(path)
+    store.add(media.PHOTO, path)
+    # captured, then the power went before the manifest line was written.
+    _touch(store.next_path(media.PHOTO))
+    with open(store.manifest_path, 'a') as f:
+        f.write('{"kind": "photo", "se')
+    again = media.MediaStore(str(tmp_path))
+    # the photo that didn't make it into the manifest is still on the card, taking up room.
+    assert again.count(media.PHOTO) == 2
+    assert again.bytes_used(media.PHOTO) == 20
+    assert again.next_path(media.PHOTO).endswith('capture_0002.jpg')
+    assert media.MediaStore(str(tmp_path)).count(media.PHOTO) == 2
+
+def test_add_after_torn_line(tmp_path):
+    store = media.MediaStore(str(tmp_path))
+    _touch(store.next_path(media.PHOTO))
+    store.add(media.PHOTO, store.path_for(media.PHOTO, 0))
+    with open(store.manifest_path, 'a') as f:
+        f.write('{"kind": "photo", "se')
+    again = media.MediaStore(str(tmp_path))
+    path = again.next_path(media.PHOTO)
+    _touch(path)
+    again.add(media.PHOTO, path)
+    assert [e.seq for e in media.MediaStore(str(tmp_path)).entries(media.PHOTO)] == [0, 1]
+
+def test_bootstrap_without_manifest(tmp_path):
+    os.makedirs(tmp_path / 'photos')
+    for name in ('capture_0000.jpg', 'capture_0007.jpg', 'notes.txt'):
+        _touch(str(tmp_path / 'photos' / name))
+    store = media.MediaStore(str(tmp_path))
+    assert store.next_path(media.PHOTO).endswith('capture_0008.jpg')
+    # they're sized and counted, and the listing isn't needed again.
+    assert [e.seq for e in store.entries(media.PHOTO)] == [0, 7]
+    assert store.bytes_used(media.PHOTO) == 20
+    assert os.path.exists(store.manifest_path)
+    assert media.MediaStore(str(tmp_path)).bytes_used(media.PHOTO) == 20
+
+def test_remove_after_recovery(tmp_path):
+    store = media.MediaStore(str(tmp_path))
+    for _ in range(3):
+        path = store.next_path(media.PHOTO)
+        _touch(path)
+        store.add(media.PHOTO, path)
+    with open(store.manifest_path, 'a') as f:
+        f.write('{"kind": "photo", "se')
+    again = media.MediaStore(str(tmp_path))
+    again.remove(media.PHOTO, again.entries(media.PHOTO)[:1])
+    reloaded = media.MediaStore(str(tmp_path))
+    assert [e.seq for e in reloaded.entries(media.PHOTO)] == [1, 2]
+    assert reloaded.bytes_used(media.PHOTO) == 20
+
+def test_remove(tmp_path):
+    store = media.MediaStore(str(tmp_path))
+    for _ in range(3):
+        path = store.next_path(media.PHOTO)
+        _touch(path)
+        store.add(media.PHOTO, path)
+    assert store.bytes_used(media.PHOTO) == 30
+    first = store.entries(media.PHOTO)[0]
+    store.remove(media.PHOTO, [first])
+    assert not os.path.exists(first.path)
+    assert store.bytes_used(media.PHOTO) == 20
+    again = media.MediaStore(str(tmp_path))
+    assert [e.seq for e in again.entries(media.PHOTO)] == [1, 2]
+    assert again.bytes_used(media.PHOTO) == 20
+    assert again.next_path(media.PHOTO).endswith('capture_0003.jpg')
@@ -0,0 +1,72 @@
+import os
+import gzip
+import pytest
+import floater.nmea as nmea
+import floater.gps as gps
+
+FLIGHT_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'flight.nmea.gz')
+
+
+@pytest.fixture
+def sentence():
+    return nmea.Sentence()
+
+
+def test_rmc(sentence):
+    assert nmea.parse(b'$GPRMC,123519,A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W*6A\r\n', sentence) == nmea.RMC
+    assert sentence.lat == pytest.approx(48.1173)
+    assert sentence.lon == pytest.approx(11.5166667)
+    assert sentence.speed_knots == 22.4
+    assert sentence.course == 84.4
+    assert sentence.date == 230394
+    assert sentence.utc == 123519
+    assert sentence.status == 'A'
+    assert sentence.altitude is None
+
+def test_gga(sentence):
+    assert nmea.parse(b'$GPGGA,123519,4807.038,S,01131.000,W,1,08,0.9,545.4,M,46.9,M,,*48', sentence) == nmea.GGA
+    assert sentence.lat == pytest.approx(-48.1173)
+    assert sentence.lon == pytest.approx(-11.5166667)
+    assert sentence.sats == 8
+    assert sentence.quality == 1
+    assert sentence.altitude == 545.4
+
+def test_vtg_and_gll(sentence):
+    assert nmea.parse(b'$GPVTG,054.7,T,034.4,M,005.5,N,010.2,K*48', sentence) == nmea.VTG
+    assert (sentence.course, sentence.speed_knots, sentence.speed_kph) == (54.7, 5.5, 10.2)
+    assert nmea.parse(b'$GPGLL,4916.45,N,12311.12,W,225444,A,*1D', sentence) == nmea.GLL
+    assert sentence.lat == pytest.approx(49.274167)
+    assert sentence.speed_kph is None
+
+def test_no_fix(sentence):
+    assert nmea.parse(b'$GPGGA,,,,,,0,00,99.99,,,,,,*48', sentence) == nmea.GGA
+    assert sentence.lat is None
+    assert sentence.quality == 0
+
+def test_unwanted(sentence):
+    # rejected on the type alone, so a bad checksum doesn't matter.
+    assert nmea.parse(b'$GPGSV,3,1,12,07,67,014,34*00', sentence) is None
+    assert nmea.parse(b'$GPTXT,01,01,02,u-blox ag - www.u-blox.com*50', sentence) is None
+    assert nmea.parse(b'', sentence) is None
+    assert nmea.parse(b'\xff\xfe garbage', sentence) is None
+
+def test_bad_checksum(sentence):
+    with pytest.raises(nmea.ChecksumError):
+        nmea.parse(b'$GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,*48', sentence)
+    with pytest.raises(nmea.ChecksumError):
+        nmea.parse(b'$GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,', sentence)
+
+def test_matches_pynmea2_on_flight_log(sentence):
+    fast = slow = gps.EMPTY_FIX
+    with gzip.open(FLIGHT_LOG, 'rb') as f:
+        for bline in f:
+            try:
+                kind = nmea.parse(bline, sentence)
+            except nmea.ChecksumError:
+                continue
+            if kind:
+                fast = gps.merge_sentence(fast, sentence, 0.0)
+                slow = gps.merge(slow, gps._interpret_gps_line(bline), 0.0)
+                assert fast.lat == pytest.approx(slow.lat, abs=1e-9)
+                assert fast.lon == pytest.approx(slow.lon, abs=1e-9)
+                assert fast._replace(lat=0, lon=0) == slow._replace(lat=0, lon=0)
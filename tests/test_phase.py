@@ -0,0 +1,74 @@
+import os
+import numpy as np
+import pytest
+import floater.phase as phase
+import floater.nmea as nmea
+import floater.scheduler as scheduler
+import floater.flight_controller as flight_controller
+
+FLIGHT_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'flight.nmea.gz')
+
+
+def _feed(detector, times, altitudes):
+    for t, altitude in zip(times, altitudes):
+        detector.add(t, altitude)
+    return [p for _, p in detector.changes]
+
+def test_vertical_rate_matches_least_squares():
+    rng = np.random.default_rng(1)
+    t = np.arange(0, 600, 2.0)
+    alt = 1000 + 5.0 * t + rng.normal(0, 3, len(t))
+    rate = phase.VerticalRate(window=60)
+    for i in range(len(t)):
+        rate.add(t[i], alt[i])
+    inside = t >= t[-1] - 60
+    assert rate.rate == pytest.approx(np.polyfit(t[inside], alt[inside], 1)[0], rel=1e-9)
+    assert phase.VerticalRate().rate is None
+
+def test_recorded_flight():
+    import gzip
+    sentence = nmea.Sentence()
+    times, altitudes = [], []
+    with gzip.open(FLIGHT_LOG, 'rb') as f:
+        for bline in f:
+            try:
+                if nmea.parse(bline, sentence) == nmea.GGA:
+                    # one fix every 5 seconds in the log.
+                    times.append(len(times) * 5.0)
+                    altitudes.append(sentence.altitude)
+            except nmea.ParseError:
+                pass
+    detector = phase.PhaseDetector()
+    assert _feed(detector, times, altitudes) == [phase.ASCENT, phase.BURST, phase.DESCENT, phase.LANDED]
+    burst_at = dict((p, t) for t, p in detector.changes)[phase.BURST]
+    top = times[int(np.argmax(altitudes))]
+    assert 0 < burst_at - top < 60
+
+def test_float_and_valve_down():
+    rng = np.random.default_rng(2)
+    t = np.arange(0, 3 * 3600, 1.0)
+    alt = np.concatenate([np.full(300, 200.0),
+                          200 + 5.0 * np.arange(3900),
+                          np.full(3600, 19700.0),
+                          19700 - 3.0 * np.arange(3000)])[:len(t)]
+    alt = np.maximum(alt, 200) + rng.normal(0, 2, len(t))
+    detector = phase.PhaseDetector()
+    assert _feed(detector, t, alt) == [phase.ASCENT, phase.CRUISE, phase.DESCENT]
+
+def test_reboot_at_float():
+    detector = phase.PhaseDetector()
+    assert _feed(detector, range(0, 600, 5), [18000.0] * 120) == [phase.CRUISE]
+
+def test_policy_retunes_schedule():
+    schedule = scheduler.Scheduler()
+    for name, period, deadline in [('aprs', 60, 30), ('photo', 60, None), ('video', 300, 150)]:
+        schedule.add(scheduler.Task(name, lambda: None, period=period, deadline=deadline))
+    schedule.run_pending(now=0)
+    flight_controller.apply_phase(schedule, phase.CRUISE)
+    assert schedule.tasks['aprs'].period == 120 and schedule.tasks['aprs'].deadline == 60
+    assert schedule.tasks['video'].period == flight_controller.MINUTES_30
+    flight_controller.apply_phase(schedule, phase.BURST)
+    assert schedule.tasks['photo'].period == 20 and schedule.tasks['photo'].deadline == 20
+    # video and beacon go right away.
+    assert schedule.time_until('video') == 0 and schedule.time_until('aprs') == 0
+    schedule.shutdown()
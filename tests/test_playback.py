@@ -0,0 +1,60 @@
+import numpy as np
+import floater.playback as playback
+
+
+class FakePcm(object):
+    def __init__(self):
+        self.writes = []
+        self.closed = False
+
+    def write(self, data):
+        self.writes.append(np.frombuffer(data, dtype='<i2'))
+        return len(data) // 2
+
+    def close(self):
+        self.closed = True
+
+
+def _player(pcm):
+    player = playback.Player(period_frames=256)
+    player._open = lambda rate: pcm
+    return player
+
+
+def test_play_keys_around_audio():
+    pcm = FakePcm()
+    events = []
+    samples = np.arange(1000, dtype=np.int16)
+    secs = _player(pcm).play(samples, rate=8000, ptt=lambda on: events.append((on, len(pcm.writes))), tx_delay=0.1)
+    # keyed before anything was written, unkeyed after everything was.
+    assert events == [(True, 0), (False, len(pcm.writes))]
+    assert secs == 1024 / 8000
+    played = np.concatenate(pcm.writes)
+    lead_in = 1024  # 800 frames of tx delay, rounded up to whole periods
+    assert not played[:lead_in].any()
+    assert np.array_equal(played[lead_in:lead_in + 1000], samples)
+    assert all(len(w) % 256 == 0 for w in pcm.writes)
+
+def test_play_generator():
+    pcm = FakePcm()
+    chunks = [np.full(100, i, dtype=np.int16) for i in range(1, 6)]
+    _player(pcm).play(iter(chunks), rate=8000, tx_delay=0)
+    played = np.concatenate(pcm.writes)
+    assert np.array_equal(played[:500], np.concatenate(chunks))
+    assert not played[500:].any()
+
+def test_play_unkeys_on_error():
+    class BrokenPcm(FakePcm):
+        def write(self, data):
+            raise IOError('gone')
+    pcm = BrokenPcm()
+    events = []
+    player = _player(pcm)
+    player._pcm = pcm
+    try:
+        player.play(np.zeros(10, dtype=np.int16), rate=8000, ptt=events.append)
+        assert False
+    except IOError:
+        pass
+    assert events == [True, False]
+    assert pcm.closed
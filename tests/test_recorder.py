@@ -0,0 +1,55 @@
+import os
+import numpy as np
+import pytest
+import floater.recorder as recorder
+
+
+def test_append_and_read(tmp_path):
+    path = os.path.join(tmp_path, 'flight.rec')
+    rec = recorder.Recorder(path, capacity=16, sync_every=4)
+    assert os.path.getsize(path) == recorder.HEADER_SIZE + 16 * recorder.RECORD.itemsize
+    rec.append(100.0, 29.58, -98.28, 250.0, 0.0, 0.0, 7, 71.6, 68.0)
+    rec.append(105.0, 29.59, -98.27, 275.5, 3.2, 45.0, None, '', None)
+    rec.close()
+    records = recorder.read(path)
+    assert list(records['seq']) == [1, 2]
+    assert records['lat'][0] == 29.58 and records['altitude'][1] == pytest.approx(275.5)
+    assert records['sats'][1] == recorder.NO_SATS
+    assert np.isnan(records['temp_in'][1]) and np.isnan(records['temp_out'][1])
+
+def test_ring_wraps_and_resumes(tmp_path):
+    path = os.path.join(tmp_path, 'flight.rec')
+    rec = recorder.Recorder(path, capacity=8)
+    for t in range(10):
+        rec.append(float(t), altitude=t * 10.0)
+    rec.close()
+    # the sequence carries on after a restart.
+    rec = recorder.Recorder(path)
+    assert rec.capacity == 8
+    rec.append(10.0, altitude=100.0)
+    rec.close()
+    records = recorder.read(path)
+    assert list(records['seq']) == list(range(4, 12))
+    assert list(records['time']) == [float(t) for t in range(3, 11)]
+    chunks = list(recorder.iterate(path, chunk=3))
+    assert [len(c) for c in chunks] == [3, 3, 2]
+    assert chunks[0].dtype == recorder.RECORD
+
+def test_torn_record_is_skipped(tmp_path):
+    path = os.path.join(tmp_path, 'flight.rec')
+    rec = recorder.Recorder(path, capacity=8)
+    for t in range(3):
+        rec.append(float(t), lat=1.0, lon=2.0)
+    rec.close()
+    # half of record 2 made it to the card.
+    with open(path, 'r+b') as f:
+        f.seek(recorder.HEADER_SIZE + 2 * recorder.RECORD.itemsize + 20)
+        f.write(b'\xff' * 8)
+    assert list(recorder.read(path)['seq']) == [1, 3]
+
+def test_not_a_recording(tmp_path):
+    path = os.path.join(tmp_path, 'flight.rec')
+    with open(path, 'wb') as f:
+        f.write(b'hello' * 100)
+    with pytest.raises(ValueError):
+        recorder.Recorder(path)
@@ -0,0 +1,88 @@
+import time
+import threading
+import floater.scheduler as scheduler
+
+
+def test_resource_priority():
+    r = scheduler.Resource('radio')
+    assert r.acquire(priority=0)
+    order = []
+
+    def waiter(name, priority):
+        assert r.acquire(priority=priority, timeout=2)
+        order.append(name)
+        r.release()
+
+    threads = [threading.Thread(target=waiter, args=('low', 1)), threading.Thread(target=waiter, args=('high', 9))]
+    for t in threads:
+        t.start()
+        time.sleep(0.05)
+    r.release()
+    for t in threads:
+        t.join()
+    assert order == ['high', 'low']
+
+def test_resource_timeout():
+    r = scheduler.Resource('camera')
+    assert r.acquire()
+    assert not r.acquire(timeout=0.05)
+    r.release()
+    assert r.acquire(timeout=0.05)
+
+def test_cadence_with_slow_neighbor():
+    schedule = scheduler.Scheduler()
+    beacons = []
+    beacon = schedule.add(scheduler.Task('beacon', lambda: beacons.append(time.monotonic()), period=0.05, priority=10))
+    # hogs the camera well past the beacon period. Doesn't share anything with the beacon.
+    schedule.add(scheduler.Task('video', lambda: time.sleep(0.3), period=1.0, resources=('camera',)))
+    runner = threading.Thread(target=schedule.run, kwargs={'max_nap': 0.01})
+    runner.start()
+    time.sleep(0.32)
+    schedule.stop()
+    runner.join()
+    assert len(beacons) >= 5
+    assert beacon.misses == 0
+
+def test_shared_resource_misses_deadline():
+    schedule = scheduler.Scheduler()
+    hog = schedule.add(scheduler.Task('sstv', lambda: time.sleep(0.2), period=10, resources=('radio',)))
+    aprs = schedule.add(scheduler.Task('aprs', lambda: None, period=10, deadline=0.05, resources=('radio',), offset=0.02))
+    schedule.run_pending()
+    time.sleep(0.03)
+    schedule.run_pending()
+    schedule.shutdown()
+    assert hog.runs == 1
+    assert aprs.runs == 0
+    assert aprs.misses == 1
+
+def test_skips_while_running():
+    schedule = scheduler.Scheduler()
+    task = schedule.add(scheduler.Task('slow', lambda: time.sleep(0.1), period=0.02))
+    schedule.run_pending()
+    time.sleep(0.05)
+    schedule.run_pending()
+    schedule.shutdown()
+    assert task.runs == 1
+    assert task.misses == 1
+
+def test_overlap_within_deadline_is_not_a_miss():
+    schedule = scheduler.Scheduler()
+    task = schedule.add(scheduler.Task('encode', lambda: time.sleep(0.1), period=0.02, deadline=1.0))
+    schedule.run_pending()
+    time.sleep(0.05)
+    schedule.run_pending()
+    schedule.shutdown()
+    assert task.runs == 1
+    assert task.misses == 0
+
+def test_time_until_and_trigger():
+    now = [100.0]
+    schedule = scheduler.Scheduler(clock=lambda: now[0])
+    schedule.add(scheduler.Task('sstv', lambda: None, period=1800, offset=95))
+    assert schedule.time_until('sstv') == 95
+    schedule.run_pending()
+    now[0] = 150.0
+    assert schedule.time_until('sstv') == 45
+    schedule.trigger('sstv')
+    assert schedule.time_until('sstv') == 0
+    schedule.shutdown()
@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+import pytest
+
+SIM_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sim')
+sys.path.insert(0, SIM_DIR)
+import simclock
+import fake_picamera
+import devices
+import gpio
+import fake_gpio
+import therm
+import dra818
+import cam
+import scheduler
+import media
+
+
+@pytest.fixture
+def mux():
+    # a fresh board, whatever other tests did to the pins.
+    gpio.init_pins()
+    m = devices.UartMux(gpio, fake_gpio)
+    yield m
+    m.close()
+
+
+def test_clock():
+    clock = simclock.SimClock(speed=100, start=1000.0)
+    start = time.perf_counter()
+    clock.sleep(10)
+    assert time.perf_counter() - start < 1.0
+    assert clock.monotonic() >= 10
+    assert clock.time() >= 1010.0
+    assert clock.real(50) == 0.5
+
+def test_waits_are_simulated():
+    clock = simclock.install(simclock.SimClock(speed=100))
+    try:
+        start = time.perf_counter()
+        assert not threading.Event().wait(20)
+        resource = scheduler.Resource('radio')
+        resource.acquire()
+        assert not resource.acquire(timeout=20)
+        assert time.perf_counter() - start < 1.0
+        assert clock.monotonic() >= 40
+    finally:
+        simclock.uninstall()
+
+def test_mux_routes_by_pins(mux):
+    gpio.enable_vhf()
+    assert mux.selected() == 'vhf'
+    assert not mux.send('gps', b'$GPRMC\r\n')
+    gpio.enable_gps()
+    assert mux.selected() == 'gps'
+    gpio.clear_uart()
+    assert mux.selected() is None
+
+def test_dra818_driver_against_emulator(mux):
+    radio = devices.Dra818Emulator(mux, gpio, fake_gpio, pd_pin=dra818.PD)
+    mux.attach('vhf', radio)
+    gpio.set_pin(dra818.PD, gpio.HIGH)
+    gpio.enable_vhf()
+    driver = dra818.Dra818(mux.device, timeout=0.5)
+    try:
+        assert driver.program(frequency=144.390, tries=1)
+        assert radio.frequency == 144.390
+        assert radio.commands[0] == 'AT+DMOCONNECT'
+        # out of band: the module says no.
+        assert not driver.program(frequency=440.0, tries=1)
+        # powered down it says nothing at all.
+        driver.power_down()
+        assert not driver.program(frequency=146.5, tries=1)
+        driver.power_up()
+        assert driver.program(frequency=146.5, tries=1)
+    finally:
+        driver.close()
+        gpio.enable_gps()
+
+def test_fake_w1(tmp_path):
+    w1 = devices.FakeW1(str(tmp_path))
+    w1.update(21.5, -56.5)
+    sampler = therm.ThermSampler(base_dir=str(tmp_path))
+    assert sampler.sample() == {'internal': 21.5, 'external': -56.5}
+    w1.follow(11000)
+    assert sampler.sample()['external'] == pytest.approx(-56.5, abs=0.07)
+    assert devices.standard_temp_c(0) == 15.0
+
+def test_fake_camera(tmp_path):
+    service = cam.CameraService(fake_picamera.PiCamera())
+    service._warm_at = 0
+    photo_path = os.path.join(tmp_path, 'photo.jpg')
+    small = service.capture(photo_path)
+    assert small.size == cam.SSTV_SIZE
+    assert os.path.getsize(photo_path) > 0
+    video_path = os.path.join(tmp_path, 'video.h264')
+    done = []
+    service.start_video(video_path, on_done=done.append)
+    assert service.stop_video() == video_path
+    assert done == [video_path] and os.path.exists(video_path)
+
+def test_fake_camera_ring(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'picamera', fake_picamera)
+    service = cam.CameraService(fake_picamera.PiCamera())
+    service._warm_at = 0
+    assert service.start_ring(seconds=30)
+    assert not service.start_ring(seconds=30)
+    with pytest.raises(RuntimeError):
+        service.start_video(os.path.join(tmp_path, 'video.h264'))
+    time.sleep(0.1)
+    clip_path = os.path.join(tmp_path, 'clip.h264')
+    service.save_ring(clip_path)
+    # the encoder is still going after the save.
+    service.camera.wait_recording(0, splitter_port=cam.VIDEO_PORT)
+    assert os.path.getsize(clip_path) > 0
+    service.stop_ring()
+    with pytest.raises(RuntimeError):
+        service.save_ring(clip_path)
+
+def test_ring_restarts_after_encoder_dies(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'picamera', fake_picamera)
+    service = cam.CameraService(fake_picamera.PiCamera())
+    service._warm_at = 0
+    monkeypatch.setattr(cam, '_service', service)
+    monkeypatch.setattr(cam, '_store', media.MediaStore(str(tmp_path)))
+    monkeypatch.setattr(cam, 'MIN_CLIP_SECS', 0)
+    assert cam.start_ring()
+    service.camera.encoder_error = IOError('encoder died')
+    with pytest.raises(IOError):
+        cam.save_clip()
+    assert service.ring is None and not cam.recording()
+    service.camera.encoder_error = None
+    # the next video task gets a new ring going, and clips come out of it.
+    assert cam.start_ring()
+    assert os.path.exists(cam.save_clip())
+
+def test_simulated_flight(tmp_path):
+    report_path = os.path.join(tmp_path, 'report.json')
+    subprocess.run([sys.executable, os.path.join(SIM_DIR, 'simulate.py'), '--minutes', '4', '--speed', '120',
+                    '--work-dir', str(tmp_path), '--report', report_path],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=120)
+    with open(report_path) as f:
+        report = json.load(f)
+    assert report['failures'] == 0
+    assert report['aprs_packets_heard'] >= 3
+    assert report['aprs_undecoded'] == 0
+    assert report['photos'] >= 3
+    assert report['records'] > 40
+    # the sampler keeps up in simulated time, so readings don't go stale between samples.
+    assert report['temp_in_valid'] > 0.9
+    # resource waits give up at the task's deadline (30s for the beacon), in simulated seconds.
+    for name, stage in report['stages'].items():
+        if name.startswith('wait.'):
+            assert stage['max'] < 45, name
+    # the first position triggers the beacon, rather than the next one-minute release.
+    assert report['first_beacon_secs'] < 60
@@ -0,0 +1,108 @@
+from array import array
+import os
+import numpy as np
+import pytest
+from PIL import Image
+import floater.sstv as sstv
+
+
+@pytest.fixture
+def noise_image():
+    rng = np.random.default_rng(1)
+    return Image.fromarray(rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8))
+
+
+def _pysstv_samples(image, mode_name):
+    mode = sstv.MODES[mode_name]
+    return np.array(array('h', mode(image.resize((mode.WIDTH, mode.HEIGHT), Image.LANCZOS), sstv.DEFAULT_RATE, 16).gen_samples()))
+
+def test_encode_matches_pysstv(noise_image):
+    expected = _pysstv_samples(noise_image, 'Robot8BW')
+    actual = sstv.encode(noise_image, mode='Robot8BW')
+    assert len(actual) == len(expected)
+    assert np.abs(actual.astype(int) - expected).max() <= 1
+
+@pytest.mark.parametrize('mode_name', ['MartinM1', 'Robot36', 'PD90'])
+def test_encode_length(noise_image, mode_name):
+    # segment boundaries can land a sample apart, but the transmission is the same length.
+    expected = _pysstv_samples(noise_image, mode_name)
+    actual = sstv.encode(noise_image, mode=mode_name)
+    assert actual.dtype == np.int16
+    assert abs(len(actual) - len(expected)) <= 1
+
+def _tone(samples, rate):
+    """ Strongest frequency in `samples`, to a fraction of a Hz. """
+    spectrum = np.abs(np.fft.rfft(samples.astype(float), n=2 ** 20))
+    return np.argmax(spectrum) * rate / 2 ** 20
+
+def test_oscillator_tones():
+    rate = 48000
+    freqs = [1200, 1500, 2300, 1900, 1100]
+    msecs = [30.0, 20.3, 40.7, 25.1, 33.3]
+    osc = sstv._Oscillator(rate)
+    # two blocks: the phase and the fractional sample carry over between them.
+    samples = np.concatenate([osc.render(freqs[:2], msecs[:2]), osc.render(freqs[2:], msecs[2:])])
+    ends = np.floor(np.cumsum(msecs) * rate / 1000).astype(int)
+    assert abs(len(samples) - ends[-1]) <= 1
+    start = 0
+    for freq, end in zip(freqs, ends):
+        # each segment is its own tone, for as long as it should be.
+        assert abs(_tone(samples[start + 1:end - 1], rate) - freq) < 5
+        start = end
+    # and no phase jumps anywhere, boundaries included.
+    assert np.abs(np.diff(samples.astype(int))).max() <= 2 * np.pi * max(freqs) / rate * 32768 + 1
+
+def test_stream_by_scanline(noise_image):
+    chunks = list(sstv.stream(noise_image, mode='MartinM1'))
+    # VIS header + one per line.
+    assert len(chunks) == 1 + sstv.MODES['MartinM1'].HEIGHT
+    assert np.array_equal(np.concatenate(chunks), sstv.encode(noise_image, mode='MartinM1'))
+
+def test_img_to_wav(noise_image, tmp_path):
+    img_path = os.path.join(tmp_path, 'photo.jpg')
+    wav_path = os.path.join(tmp_path, 'sstv.wav')
+    noise_image.save(img_path)
+    assert sstv.img_to_wav(img_path, wav_path)
+    assert os.path.getsize(wav_path) > 2 * 100 * sstv.DEFAULT_RATE
+    assert not sstv.img_to_wav(os.path.join(tmp_path, 'missing.jpg'), wav_path)
+
+def test_annotate_img_in_memory(noise_image):
+    mode = sstv.MODES['MartinM1']
+    frame = sstv.annotate_img(noise_image, None, 'N0CALL 22966M 07201.75W,4903.50N')
+    assert frame.size == (mode.WIDTH, mode.HEIGHT)
+    bar = np.asarray(frame)[mode.HEIGHT - sstv.LABEL_BAR_HEIGHT:]
+    # black bar with some white text on it.
+    assert bar.min() == 0
+    assert bar.max() > 200
+    assert (bar == 0).mean() > 0.5
+
+def test_annotate_img_to_file(noise_image, tmp_path):
+    img_path = os.path.join(tmp_path, 'photo.jpg')
+    dest = os.path.join(tmp_path, 'sstv.jpg')
+    noise_image.save(img_path)
+    assert sstv.annotate_img(img_path, dest, 'N0CALL') == dest
+    assert Image.open(dest).size == (320, 256)
+    assert sstv.annotate_img(os.path.join(tmp_path, 'missing.jpg'), dest, 'N0CALL') is None
+
+def test_glyph_atlas_is_cached():
+    import floater.overlay as overlay
+    assert overlay.atlas(18) is overlay.atlas(18)
+    glyphs = overlay.atlas(18)
+    assert glyphs.render('AB').width == glyphs.width('A') + glyphs.width('B')
+
+def test_prepared(noise_image):
+    prepared = sstv.Prepared(mode='Robot8BW', rate=8000)
+    assert prepared.get('a.jpg') is None
+    assert prepared.prepare('a.jpg', 'N0CALL 100M', noise_image)
+    audio = prepared.get('a.jpg')
+    assert len(audio) == len(sstv.encode(sstv.annotate_img(noise_image, None, 'N0CALL 100M', mode='Robot8BW'),
+                                         mode='Robot8BW', rate=8000))
+    # same photo and label: nothing to do.
+    prepared.prepare('a.jpg', 'N0CALL 100M', noise_image)
+    assert prepared.get('a.jpg') is audio
+    # a newer fix means a new label.
+    prepared.prepare('a.jpg', 'N0CALL 200M', noise_image)
+    assert prepared.get('a.jpg') is not audio and prepared.is_current('a.jpg', 'N0CALL 200M')
+    assert prepared.get('b.jpg') is None
+    prepared.invalidate()
+    assert prepared.get('a.jpg') is None
@@ -0,0 +1,70 @@
+import os
+import floater.media as media
+import floater.storage as storage
+
+
+def _fill(store, kind, n, size, start=0.0, step=60.0):
+    for i in range(n):
+        path = store.next_path(kind)
+        with open(path, 'wb') as f:
+            f.truncate(size)
+        store.add(kind, path, when=start + i * step)
+
+
+def _budget(store, **kwargs):
+    return storage.StorageBudget(store, min_free=0, **kwargs)
+
+
+def test_allow(tmp_path):
+    store = media.MediaStore(str(tmp_path))
+    budget = _budget(store, quotas={media.PHOTO: 100})
+    _fill(store, media.PHOTO, 9, 10)
+    assert budget.allow(media.PHOTO)
+    _fill(store, media.PHOTO, 1, 10)
+    assert not budget.allow(media.PHOTO)
+    assert budget.allow(media.VIDEO)
+    # the card being full trumps the quota.
+    assert not storage.StorageBudget(store, min_free=2 ** 62).allow(media.VIDEO)
+
+def test_photos_are_thinned(tmp_path):
+    store = media.MediaStore(str(tmp_path))
+    budget = _budget(store, quotas={media.PHOTO: 100}, keep_photos=2)
+    _fill(store, media.PHOTO, 10, 10)
+    newest = store.latest(media.PHOTO).path
+    assert budget.enforce(protect=(newest,)) == 2
+    # every other one of the oldest go first.
+    assert [e.seq for e in store.entries(media.PHOTO)] == [0, 2, 4, 5, 6, 7, 8, 9]
+    assert store.bytes_used(media.PHOTO) == 80
+    # under the high watermark now: nothing to do.
+    assert budget.enforce() == 0
+
+def test_thinning_spares_the_protected(tmp_path):
+    store = media.MediaStore(str(tmp_path))
+    budget = _budget(store, quotas={media.PHOTO: 50}, keep_photos=0)
+    _fill(store, media.PHOTO, 5, 10)
+    sstv_photo = store.entries(media.PHOTO)[1].path
+    budget.enforce(protect=(sstv_photo,))
+    assert sstv_photo in [e.path for e in store.entries(media.PHOTO)]
+    assert store.bytes_used(media.PHOTO) <= 40
+
+def test_videos_near_burst_are_kept(tmp_path):
+    store = media.MediaStore(str(tmp_path))
+    budget = _budget(store, quotas={media.VIDEO: 1000})
+    # one clip a minute for 20 minutes, burst at 15.
+    _fill(store, media.VIDEO, 20, 50)
+    budget.burst_at = 15 * 60.0
+    budget.enforce()
+    times = [e.time / 60 for e in store.entries(media.VIDEO)]
+    assert store.bytes_used(media.VIDEO) <= 800
+    assert times == [4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19]
+
+def test_media_from_before_the_manifest(tmp_path):
+    os.makedirs(tmp_path / 'photos')
+    for seq in range(3):
+        with open(str(tmp_path / 'photos' / f'capture_{seq:04d}.jpg'), 'wb') as f:
+            f.truncate(1000)
+    store = media.MediaStore(str(tmp_path))
+    budget = _budget(store, quotas={media.PHOTO: 1000}, keep_photos=0)
+    assert store.bytes_used(media.PHOTO) == 3000
+    assert not budget.allow(media.PHOTO)
+    assert budget.enforce() > 0
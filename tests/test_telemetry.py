@@ -0,0 +1,62 @@
+import floater.telemetry as telemetry
+import floater.afsk as afsk
+
+
+def test_frame_averages_and_resets():
+    t = telemetry.Telemetry('N0CALL-11')
+    for v in (20, 22):
+        t.sample('TempIn', v)
+    t.sample('TmpOut', -40.4)
+    t.sample('Sats', 9)
+    t.sample('Alt', 30000)
+    t.sample('FixAg', '')    # no reading yet
+    t.sample('TempIn', None)
+    t.set_bit('GPS', True)
+    t.set_bit('SSTV', True)
+    assert t.frame() == 'T#000,151,090,009,150,000,11000000'
+    t.commit()
+    # nothing new: same values, next sequence number.
+    t.sample('Alt', 100000)
+    assert t.frame() == 'T#001,151,090,009,255,000,11000000'
+
+def test_sequence_wraps():
+    t = telemetry.Telemetry('N0CALL')
+    t.seq = 999
+    assert t.frame().startswith('T#999,')
+    t.commit()
+    assert t.frame().startswith('T#000,')
+
+def test_metadata():
+    parm, unit, eqns, bits = telemetry.Telemetry('N0CALL-11').metadata()
+    assert parm == ':N0CALL-11:PARM.TempIn,TmpOut,Sats,Alt,FixAg,GPS,SSTV,Vid,TIn,TOut,SD,B7,B8'
+    assert unit.startswith(':N0CALL-11:UNIT.degF,degF,sats,m,s,on')
+    assert eqns == ':N0CALL-11:EQNS.0,1,-130,0,1,-130,0,1,0,0,200,0,0,1,0'
+    assert bits == ':N0CALL-11:BITS.11111111,floater balloon'
+    assert telemetry.Telemetry('N0CALL').metadata()[0].startswith(':N0CALL   :PARM.')
+
+def test_metadata_schedule():
+    t = telemetry.Telemetry('N0CALL', meta_period=600)
+    for now, n in ((0, 5), (60, 1), (600, 5)):
+        assert len(t.packets('APN25', ['WIDE1-1'], now=now)) == n
+        t.commit()
+
+def test_nothing_lost_until_commit():
+    t = telemetry.Telemetry('N0CALL', meta_period=600)
+    t.sample('Sats', 8)
+    first = t.packets('APN25', ['WIDE1-1'], now=0)
+    # that transmission failed: the same frame and the metadata go again.
+    t.sample('Sats', 10)
+    again = t.packets('APN25', ['WIDE1-1'], now=60)
+    assert len(again) == 5 and again[0] == first[0].replace(',008,', ',009,')
+    # a sample that comes in while it's on the air is kept for the next one.
+    t.sample('Sats', 4)
+    t.commit()
+    assert t.packets('APN25', ['WIDE1-1'], now=120) == ['N0CALL>APN25,WIDE1-1:T#001,000,000,004,000,000,00000000']
+
+def test_packets_on_the_air():
+    t = telemetry.Telemetry('N0CALL-11')
+    t.sample('Sats', 7)
+    packets = t.packets('APN25', ['WIDE1-1'], now=0)
+    assert packets[0] == 'N0CALL-11>APN25,WIDE1-1:T#000,000,000,007,000,000,00000000'
+    samples = afsk.make_samples(packets)
+    assert [afsk.decode_frame(f) for f in afsk.demodulate(samples, afsk.DEFAULT_RATE)] == packets
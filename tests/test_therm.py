@@ -0,0 +1,61 @@
+import os
+import floater.therm as therm
+
+GOOD = ['b8 01 55 00 7f ff 0c 10 8c : crc=8c YES\n', 'b8 01 55 00 7f ff 0c 10 8c t=27500\n']
+
+
+def _sensor(base_dir, device, lines):
+    os.makedirs(os.path.join(base_dir, device), exist_ok=True)
+    with open(os.path.join(base_dir, device, 'w1_slave'), 'w') as f:
+        f.writelines(lines)
+
+
+def test_crc8():
+    assert therm._crc8(bytes.fromhex('b80155007fff0c10')) == 0x8c
+
+def test_parse_w1_slave():
+    assert therm._parse_w1_slave(GOOD) == 27.5
+    assert therm._parse_w1_slave(['b8 01 55 00 7f ff 0c 10 8c : crc=8c NO\n', GOOD[1]]) is None
+    # the kernel said YES but the crc doesn't match the scratchpad.
+    assert therm._parse_w1_slave(['b8 01 55 00 7f ff 0c 10 8d : crc=8d YES\n', GOOD[1]]) is None
+    assert therm._parse_w1_slave([]) is None
+
+def test_parse_power_on_reset():
+    pad = bytes.fromhex('5005' + '4b467fff0c10')
+    line = ' '.join(f'{b:02x}' for b in pad + bytes([therm._crc8(pad)]))
+    assert therm._parse_w1_slave([f'{line} : crc=xx YES\n', f'{line} t=85000\n']) is None
+
+def test_sampler_parallel(tmp_path):
+    base_dir = str(tmp_path)
+    _sensor(base_dir, 'in', GOOD)
+    _sensor(base_dir, 'out', ['garbage\n'])
+    sampler = therm.ThermSampler(devices={'internal': 'in', 'external': 'out'}, base_dir=base_dir)
+    assert sampler.sample() == {'internal': 27.5, 'external': None}
+    assert sampler.latest['internal'].temp_c == 27.5
+    assert sampler.latest['external'] is None
+    sampler.sample()
+    stats = sampler.window('internal', reset=True)
+    assert stats['count'] == 2
+    assert stats['min'] == stats['max'] == stats['mean'] == 27.5
+    assert sampler.window('internal')['count'] == 0
+
+def test_sampler_bulk(tmp_path):
+    base_dir = str(tmp_path)
+    _sensor(base_dir, 'in', GOOD)
+    os.makedirs(os.path.join(base_dir, 'w1_bus_master1'))
+    bulk = os.path.join(base_dir, therm.BULK_READ)
+    with open(bulk, 'w') as f:
+        f.write('0\n')
+    sampler = therm.ThermSampler(devices={'internal': 'in'}, base_dir=base_dir)
+    assert sampler.sample() == {'internal': 27.5}
+    with open(bulk) as f:
+        assert f.read().strip() == 'trigger'
+
+def test_cached_reads(tmp_path, monkeypatch):
+    _sensor(str(tmp_path), 'in', GOOD)
+    sampler = therm.ThermSampler(devices={'internal': 'in'}, base_dir=str(tmp_path))
+    monkeypatch.setattr(therm, '_sampler', sampler)
+    assert therm.get_internal_temp() is None
+    sampler.sample()
+    assert therm.get_internal_temp() == 81.5
+    assert therm.get_internal_temp('c') == 27.5